@@ -1,23 +1,100 @@
+import argparse
 import asyncio
 import json
 import logging
+import sqlite3
+import zlib
 from asyncio import AbstractEventLoop
 from datetime import datetime, timedelta
+from os import makedirs
+from os.path import join
 from time import strftime, localtime
-from typing import Optional
+from typing import Optional, Iterable
 
 import aiohttp
 import async_timeout
+import numpy as np
 from netdata import Netdata
-from pandas import DataFrame
+from pandas import DataFrame, merge_asof, concat
 
 _logger = logging.getLogger(__name__)
 
 
-async def get_system_cpu_data(loop: AbstractEventLoop, day_to_get_metrics_from: datetime):
+class NetdataCache:
+    """
+    Keeps the responses of the netdata data endpoint in a SQLite file,
+    keyed by the netdata instance, the chart, the dimensions and the day.
+    Responses for a day that was not over when they were fetched are incomplete
+    and therefore ignored, so that they are fetched again.
+    """
+
+    def __init__(self, cache_directory: str):
+        makedirs(cache_directory, exist_ok=True)
+        self._connection = sqlite3.connect(join(cache_directory, "netdata_cache.db"), timeout=30)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS netdata_data ("
+            "base_url TEXT NOT NULL, "
+            "chart TEXT NOT NULL, "
+            "dimensions TEXT NOT NULL, "
+            "day TEXT NOT NULL, "
+            "complete INTEGER NOT NULL, "
+            "fetched_at TEXT NOT NULL, "
+            "json_data BLOB NOT NULL, "
+            "PRIMARY KEY (base_url, chart, dimensions, day))"
+        )
+        self._connection.commit()
+
+    def get(self, base_url: str, chart: str, dimensions: str, day: datetime) -> Optional[dict]:
+        """Returns the cached response of the data endpoint or None if there is no complete one."""
+        row = self._connection.execute(
+            "SELECT json_data FROM netdata_data "
+            "WHERE base_url = ? AND chart = ? AND dimensions = ? AND day = ? AND complete = 1",
+            (str(base_url), chart, dimensions, day.strftime("%Y-%m-%d"))
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, base_url: str, chart: str, dimensions: str, day: datetime, json_data: dict):
+        fetched_at = datetime.now()
+        end_of_the_day = datetime(day.year, day.month, day.day) + timedelta(days=1)
+
+        self._connection.execute(
+            "INSERT OR REPLACE INTO netdata_data VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (str(base_url), chart, dimensions, day.strftime("%Y-%m-%d"), int(fetched_at >= end_of_the_day),
+             fetched_at.isoformat(), zlib.compress(json.dumps(json_data).encode()))
+        )
+        self._connection.commit()
+
+    def get_base_urls(self) -> list[str]:
+        """Returns the netdata instances with cached responses."""
+        return [row[0] for row in self._connection.execute("SELECT DISTINCT base_url FROM netdata_data ORDER BY 1")]
+
+    def invalidate(self, day: Optional[datetime] = None):
+        """Removes the cached responses of the given day or of all days."""
+        if day is None:
+            self._connection.execute("DELETE FROM netdata_data")
+        else:
+            self._connection.execute("DELETE FROM netdata_data WHERE day = ?", (day.strftime("%Y-%m-%d"),))
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+
+async def get_system_cpu_data(
+        loop: AbstractEventLoop,
+        day_to_get_metrics_from: datetime,
+        host: str = "192.168.64.6",
+        port: int = 19999,
+        timeout: float = 5,
+        cache: Optional[NetdataCache] = None
+):
     """Get the data from a Netdata instance."""
     async with aiohttp.ClientSession() as session:
-        data = Netdata("192.168.64.6", loop, session, port=19999)
+        data = Netdata(host, loop, session, port=port)
         # # Get data for the CPU
         # await data.get_data("system.cpu")
         # print(json.dumps(data.values, indent=4, sort_keys=True))
@@ -31,7 +108,9 @@ async def get_system_cpu_data(loop: AbstractEventLoop, day_to_get_metrics_from:
             loop,
             session,
             day_to_get_metrics_from,
-            dimension="user,system"
+            dimension="user,system",
+            timeout=timeout,
+            cache=cache
         )
 
         dataframe["total"] = dataframe["user"] + dataframe["system"]
@@ -66,7 +145,9 @@ async def get_data_from_netdata_async(
         session: aiohttp.ClientSession,
         date_to_retrieve: datetime,
         chart: str = "system.cpu",
-        dimension: str = ""
+        dimension: str = "",
+        timeout: float = 5,
+        cache: Optional[NetdataCache] = None
 ) -> DataFrame:
     """
     Retrieve performance metrics from netdata using the data endpoint.
@@ -76,9 +157,35 @@ async def get_data_from_netdata_async(
     :param date_to_retrieve: the date of the day to retrieve data from
     :param chart: Chart to get data from, defaults to system.cpu
     :param dimension: 'Column' of the returned chart, defaults to
+    :param timeout: Seconds to wait for the response
+    :param cache: Cache to look the data up in before requesting it and to store the response in
     """
 
-    data_endpoint = "data?chart={chart}&dimensions={dimension}&before={end}&after={start}&options=seconds"
+    json_data = cache.get(netdata.base_url, chart, dimension, date_to_retrieve) if cache is not None else None
+    if json_data is None:
+        json_data = await _request_data_from_netdata_async(netdata, loop, session, date_to_retrieve, chart, dimension,
+                                                           timeout)
+        if cache is not None:
+            cache.put(netdata.base_url, chart, dimension, date_to_retrieve, json_data)
+    else:
+        _logger.debug("Using cached %s %s of %s", chart, dimension, date_to_retrieve.date())
+
+    dataframe = DataFrame(json_data["data"],
+                          columns=json_data["labels"])
+    dataframe.set_index('time', inplace=True)
+
+    return dataframe
+
+
+async def _request_data_from_netdata_async(
+        netdata: Netdata,
+        loop: AbstractEventLoop,
+        session: aiohttp.ClientSession,
+        date_to_retrieve: datetime,
+        chart: str,
+        dimension: str,
+        timeout: float
+) -> dict:
 
     day_to_get_metrics_from = date_to_retrieve
     start_of_the_day = datetime(day_to_get_metrics_from.year, day_to_get_metrics_from.month,
@@ -89,24 +196,160 @@ async def get_data_from_netdata_async(
     _logger.debug(start_of_the_day)
     _logger.debug(end_of_the_day)
 
+    return await _request_window_from_netdata_async(netdata, loop, session, chart, dimension,
+                                                    start_of_the_day, end_of_the_day, timeout)
+
+
+async def _request_window_from_netdata_async(
+        netdata: Netdata,
+        loop: AbstractEventLoop,
+        session: aiohttp.ClientSession,
+        chart: str,
+        dimension: str,
+        start: datetime,
+        end: datetime,
+        timeout: float
+) -> dict:
+
+    data_endpoint = "data?chart={chart}&dimensions={dimension}&before={end}&after={start}&options=seconds"
+
     url = "{}{}".format(netdata.base_url,
                         data_endpoint.format(chart=chart,
                                              dimension=dimension,
-                                             end=int(end_of_the_day.timestamp()),
-                                             start=int(start_of_the_day.timestamp())
+                                             end=int(end.timestamp()),
+                                             start=int(start.timestamp())
                                              )
                         )
 
     _logger.debug(url)
 
-    with async_timeout.timeout(5, loop=loop):
+    with async_timeout.timeout(timeout, loop=loop):
         response = await session.get(url)
+        response.raise_for_status()
 
-    json_data = await response.json()
+    return await response.json()
 
-    dataframe = DataFrame(json_data["data"],
-                          columns=json_data["labels"])
-    dataframe.set_index('time', inplace=True)
+
+async def get_data_from_netdata_for_days_async(
+        loop: AbstractEventLoop,
+        days: Iterable[datetime],
+        charts: dict[str, str],
+        host: str = "192.168.64.6",
+        port: int = 19999,
+        max_concurrent_requests: int = 4,
+        window: timedelta = timedelta(hours=6),
+        retries: int = 3,
+        timeout: float = 5,
+        cache: Optional[NetdataCache] = None
+) -> DataFrame:
+    """
+    Retrieve performance metrics of several days and charts from netdata at once.
+    Every day is requested in windows, all windows are requested concurrently over one session.
+    :param loop: Existing AbstractEventLoop instance
+    :param days: The days to retrieve data from
+    :param charts: The charts to get data from and the dimensions to get of each chart,
+    e.g. {"system.cpu": "user,system"}, an empty string gets all dimensions
+    :param host: Host of the netdata instance
+    :param port: Port of the netdata instance
+    :param max_concurrent_requests: Maximum number of requests in flight at the same time
+    :param window: Time span requested at once
+    :param retries: How often a failed window is requested again
+    :param timeout: Seconds to wait for the response of a window
+    :param cache: Cache to look the days up in before requesting them and to store the responses in
+    :return: A tidy frame with the columns time, chart, dimension and value
+    """
+    days = sorted({datetime(day.year, day.month, day.day) for day in days})
+
+    connector = aiohttp.TCPConnector(limit=max_concurrent_requests)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        netdata = Netdata(host, loop, session, port=port)
+        semaphore = asyncio.Semaphore(max_concurrent_requests)
+
+        async def request_window(chart: str, dimension: str, start: datetime, end: datetime) -> dict:
+            for attempt in range(retries + 1):
+                try:
+                    async with semaphore:
+                        return await _request_window_from_netdata_async(netdata, loop, session, chart, dimension,
+                                                                        start, end, timeout)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt == retries:
+                        raise
+                    _logger.warning("Requesting %s from %s to %s failed (%s), retrying", chart, start, end, e)
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+
+        async def request_day(chart: str, dimension: str, day: datetime) -> DataFrame:
+            json_data = cache.get(netdata.base_url, chart, dimension, day) if cache is not None else None
+
+            if json_data is None:
+                end_of_the_day = day + timedelta(days=1)
+                windows = []
+                start = day
+                while start < end_of_the_day:
+                    end = min(start + window, end_of_the_day)
+                    # 'before' is inclusive
+                    windows.append(request_window(chart, dimension, start, end - timedelta(seconds=1)))
+                    start = end
+
+                responses = await asyncio.gather(*windows)
+                json_data = {
+                    "labels": responses[0]["labels"],
+                    "data": [row for response in responses for row in response["data"]]
+                }
+                if cache is not None:
+                    cache.put(netdata.base_url, chart, dimension, day, json_data)
+
+            dataframe = DataFrame(json_data["data"], columns=json_data["labels"])
+            dataframe = dataframe.melt(id_vars="time", var_name="dimension")
+            dataframe.insert(1, "chart", chart)
+            return dataframe
+
+        dataframes = await asyncio.gather(*(
+            request_day(chart, dimension, day)
+            for chart, dimension in charts.items()
+            for day in days
+        ))
+
+    if len(dataframes) == 0:
+        return DataFrame(columns=["time", "chart", "dimension", "value"])
+
+    return concat(dataframes, ignore_index=True) \
+        .drop_duplicates(subset=["time", "chart", "dimension"]) \
+        .sort_values(["chart", "dimension", "time"], ignore_index=True)
+
+
+def get_chart_from_tidy_dataframe(dataframe: DataFrame, chart: str) -> DataFrame:
+    """
+    Selects a chart of a frame returned by get_data_from_netdata_for_days_async,
+    with one column per dimension, indexed by time like the frames of get_data_from_netdata_async.
+    """
+    return dataframe[dataframe["chart"] == chart] \
+        .pivot(index="time", columns="dimension", values="value") \
+        .rename_axis(columns=None)
+
+
+async def get_system_cpu_data_for_days(
+        loop: AbstractEventLoop,
+        days: Iterable[datetime],
+        host: str = "192.168.64.6",
+        port: int = 19999,
+        max_concurrent_requests: int = 4,
+        timeout: float = 5,
+        cache: Optional[NetdataCache] = None
+) -> DataFrame:
+    """Get the system cpu usage of several days, see get_system_cpu_data."""
+    dataframe = await get_data_from_netdata_for_days_async(
+        loop,
+        days,
+        {"system.cpu": "user,system"},
+        host,
+        port,
+        max_concurrent_requests=max_concurrent_requests,
+        timeout=timeout,
+        cache=cache
+    )
+
+    dataframe = get_chart_from_tidy_dataframe(dataframe, "system.cpu").reindex(columns=["user", "system"])
+    dataframe["total"] = dataframe["user"] + dataframe["system"]
 
     return dataframe
 
@@ -126,6 +369,41 @@ def get_row_from_dataframe_using_nearest_time(dataframe: DataFrame, timestamp: f
     # return dataframe.query('time == @nearest_time')
 
 
+def join_dataframe_using_nearest_time(dataframe: DataFrame, timestamps, tolerance: float = 0.5) -> DataFrame:
+    """
+    Looks up the rows of the dataframe nearest in time to each of the timestamps at once.
+    :param dataframe: Performance metrics indexed by time, as returned by get_data_from_netdata_async
+    :param timestamps: Unix timestamps in seconds, in any order
+    :param tolerance: Maximum distance in seconds between a timestamp and the time of its row.
+    The default of half a second matches rounding to the nearest second, as netdata stores one value per second.
+    :return: One row per timestamp, in the order of the timestamps, with the columns of the dataframe
+    and the time of the matched row. All columns are NaN where no row is within the tolerance.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+
+    metrics = dataframe.sort_index()
+    metrics = metrics.set_axis(metrics.index.astype(np.float64), axis=0)
+    metrics.index.name = "time"
+    metrics = metrics.reset_index()
+
+    # merge_asof needs both sides sorted
+    order = np.argsort(timestamps, kind="stable")
+    left = DataFrame({"timestamp": timestamps[order]})
+
+    joined = merge_asof(
+        left,
+        metrics,
+        left_on="timestamp",
+        right_on="time",
+        direction="nearest",
+        tolerance=tolerance
+    )
+
+    result = joined.drop(columns="timestamp")
+    result.index = order
+    return result.sort_index()
+
+
 if __name__ == '__main__':
     # configure root logger
 
@@ -145,12 +423,24 @@ if __name__ == '__main__':
     # add ch to logger
     root_logger.addHandler(ch)
 
+    parser = argparse.ArgumentParser(description='Prints the system cpu usage of today from a netdata instance.')
+    parser.add_argument('--host',
+                        type=str,
+                        default="192.168.64.6",
+                        help='Host of the netdata instance')
+    parser.add_argument('--port', '-p',
+                        type=int,
+                        default=19999,
+                        help='Port of the netdata instance')
+
+    args = parser.parse_args()
+
     loop = asyncio.get_event_loop()
 
     # Get data for today
     day_to_get_metrics_from = datetime.now()
 
-    df: DataFrame = loop.run_until_complete(get_system_cpu_data(loop, day_to_get_metrics_from))
+    df: DataFrame = loop.run_until_complete(get_system_cpu_data(loop, day_to_get_metrics_from, args.host, args.port))
 
     start = datetime.now().timestamp()
 
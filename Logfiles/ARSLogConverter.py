@@ -1,10 +1,22 @@
 import argparse
-import glob
 import os
-from os.path import join
+from itertools import islice
+from typing import Iterable, Iterator
 
 from rast_common.main.StringUtils import dir_path
 
+from CompressedLogFiles import open_log_file, glob_log_files
+from StageMetrics import get_stage_metrics, add_instrumentation_arguments, instrument
+
+
+def merge_line_pairs(lines: Iterable[str]) -> Iterator[str]:
+    """Merges every two lines of an ARS log file into one line, separated by a tab."""
+    lines = iter(lines)
+    for firstLine in lines:
+        second_line = next(lines, "")
+
+        yield "{}\t{}\n".format(firstLine.strip(), second_line.strip())
+
 
 def merge_first_and_second_line(path: str):
     if "koppelcmd" not in path:
@@ -13,19 +25,23 @@ def merge_first_and_second_line(path: str):
 
     target_path = path.replace("koppelcmd", "ARS")
 
-    print("Converting ", path)
-    with open(path) as logfile:
-        with open(target_path, mode="w") as targetFile:
-            counter = 0
+    metrics = get_stage_metrics()
 
-            for firstLine in logfile:
-                second_line = logfile.readline()
+    print("Converting ", path)
+    with metrics.file(path), open_log_file(path) as logfile:
+        with open_log_file(target_path, mode="w") as targetFile:
+            lines = merge_line_pairs(logfile)
+            while True:
+                with metrics.phase("parse"):
+                    batch = list(islice(lines, 5000))
+                if len(batch) == 0:
+                    break
 
-                counter = counter + 2
-                if counter % 10000 == 0:
-                    print("Processed {} entries".format(counter))
+                with metrics.phase("write"):
+                    targetFile.writelines(batch)
 
-                targetFile.write("{}\t{}\n".format(firstLine.strip(), second_line.strip()))
+                # every merged line consists of two lines
+                metrics.count_lines(2 * len(batch))
 
 
 if __name__ == "__main__":
@@ -37,6 +53,7 @@ if __name__ == "__main__":
     parser.add_argument('--directory', '-d',
                         type=dir_path,
                         help='the directory the log files are located in')
+    add_instrumentation_arguments(parser)
 
     args = parser.parse_args()
 
@@ -44,14 +61,15 @@ if __name__ == "__main__":
         parser.print_help()
         exit(1)
 
-    logfilesToConvert = args.files if args.files is not None else []
+    with instrument("ARSLogConverter", args.report, args.profile, args.profile_output):
+        logfilesToConvert = args.files if args.files is not None else []
 
-    if args.directory is not None:
-        logfiles = glob.glob(join(args.directory, '**', '*koppelcmd*.log'), recursive=True)
-        logfilesToConvert.extend(logfiles)
+        if args.directory is not None:
+            logfiles = glob_log_files(args.directory, '*koppelcmd*.log')
+            logfilesToConvert.extend(logfiles)
 
-    print("Logs to convert: \n" + "\n".join(logfilesToConvert))
+        print("Logs to convert: \n" + "\n".join(logfilesToConvert))
 
-    for path in logfilesToConvert:
-        merge_first_and_second_line(path)
-        os.remove(path)
+        for path in logfilesToConvert:
+            merge_first_and_second_line(path)
+            os.remove(path)
@@ -0,0 +1,325 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass, asdict
+from datetime import date, datetime
+from glob import glob
+from os.path import join
+from time import perf_counter
+from typing import Optional
+
+from rast_common.main.StringUtils import dir_path
+
+from SyntheticLogs import SyntheticLogOptions, generate_logs
+
+# Runs the stages of the log pipeline on synthetic logs and reports their throughput and memory usage.
+# Every stage runs as a separate process, just like it is run from the command line, so that the peak RSS
+# of one stage is not hidden by the memory the stages before it used.
+
+SCRIPT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# in the order they run in, every stage reads the files the stage before it wrote
+STAGES = ["fixer", "merger", "converter", "workload", "etl"]
+
+
+@dataclass
+class StageResult:
+    # lines of the input files of the stage
+    lines: int
+    seconds: float
+    # of the largest process of the stage
+    peak_rss_mb: float
+
+    @property
+    def lines_per_second(self) -> float:
+        return self.lines / self.seconds if self.seconds > 0 else 0.0
+
+
+def count_lines(paths: list[str]) -> int:
+    lines = 0
+    for path in paths:
+        with open(path, "rb") as file:
+            while True:
+                data = file.read(4 * 1024 * 1024)
+                if not data:
+                    break
+                lines += data.count(b"\n")
+
+    return lines
+
+
+def run_script(arguments: list[str], verbose: bool = False) -> tuple[float, float]:
+    """
+    Runs a script of this directory in a new process and waits for it.
+    :return: The wall clock seconds it took and its peak RSS in MB
+    """
+    output = None if verbose else subprocess.DEVNULL
+
+    start = perf_counter()
+    process = subprocess.Popen([sys.executable] + arguments, cwd=SCRIPT_DIRECTORY, stdout=output, stderr=output)
+    # unlike getrusage(RUSAGE_CHILDREN), wait4 returns the resource usage of this very process
+    _, status, resource_usage = os.wait4(process.pid, 0)
+    seconds = perf_counter() - start
+
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, arguments)
+
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS
+    peak_rss_mb = resource_usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return seconds, peak_rss_mb
+
+
+def get_stage_commands(stage: str, directory: str, database_directory: str, jobs: int) -> list[list[str]]:
+    if stage == "fixer":
+        return [
+            ["WSLogFixer.py", "-d", directory, "-j", str(jobs)],
+            ["ARSLogConverter.py", "-d", directory],
+        ]
+    if stage == "merger":
+        return [["LogMerger.py", "-d", directory, "-j", str(jobs)]]
+    if stage == "converter":
+        return [["RequestLogToCLF.py", "-d", directory, "--force"]]
+    if stage == "workload":
+        return [["WorkloadExtractor.py", "-d", directory, "-j", str(jobs)]]
+    if stage == "etl":
+        return [["LogToDbETL.py", directory, database_directory, "--workers", str(jobs)]]
+
+    raise ValueError("Unknown stage {}".format(stage))
+
+
+def get_stage_input(stage: str, directory: str) -> list[str]:
+    if stage == "fixer":
+        return glob(join(directory, "Worker-cmd*.log")) + glob(join(directory, "*koppelcmd*.log"))
+    if stage == "merger":
+        return glob(join(directory, "WSCmd_f*.log")) + glob(join(directory, "ARS*.log"))
+    if stage in ("converter", "workload"):
+        return glob(join(directory, "Merged_*.log"))
+    if stage == "etl":
+        return glob(join(directory, "Conv_*.log"))
+
+    raise ValueError("Unknown stage {}".format(stage))
+
+
+def run_stages(raw_directory: str,
+               work_directory: str,
+               stages: list[str],
+               jobs: int = 1,
+               verbose: bool = False) -> dict[str, StageResult]:
+    """
+    Runs the stages up to the last one of stages on a copy of the raw logs.
+    :param raw_directory: The directory the generated logs are in, it is not modified
+    :param work_directory: The directory the stages are run in, must not exist
+    """
+    shutil.copytree(raw_directory, work_directory)
+    database_directory = join(work_directory, "db")
+
+    results = dict()
+    for stage in STAGES[:max(STAGES.index(stage) for stage in stages) + 1]:
+        lines = count_lines(get_stage_input(stage, work_directory))
+
+        seconds = 0.0
+        peak_rss_mb = 0.0
+        for command in get_stage_commands(stage, work_directory, database_directory, jobs):
+            seconds_of_command, peak_rss_mb_of_command = run_script(command, verbose)
+            seconds += seconds_of_command
+            peak_rss_mb = max(peak_rss_mb, peak_rss_mb_of_command)
+
+        results[stage] = StageResult(lines, seconds, peak_rss_mb)
+        print("{:10} {:10d} lines in {:8.2f} s".format(stage, lines, seconds))
+
+    return {stage: result for stage, result in results.items() if stage in stages}
+
+
+def benchmark(options: SyntheticLogOptions,
+              days: int,
+              stages: list[str],
+              jobs: int = 1,
+              repetitions: int = 1,
+              temp_directory: Optional[str] = None,
+              verbose: bool = False) -> dict[str, StageResult]:
+    """
+    Generates synthetic logs and runs the stages on them repetitions times.
+    :return: The result of the fastest repetition of every stage
+    """
+    best_results: dict[str, StageResult] = dict()
+
+    with tempfile.TemporaryDirectory(prefix="benchmark_", dir=temp_directory) as directory:
+        raw_directory = join(directory, "raw")
+        generate_logs(raw_directory, date(2021, 3, 4), days, options)
+
+        for repetition in range(repetitions):
+            print("Repetition {}/{}".format(repetition + 1, repetitions))
+            work_directory = join(directory, "run_{}".format(repetition))
+
+            results = run_stages(raw_directory, work_directory, stages, jobs, verbose)
+            for stage, result in results.items():
+                if stage not in best_results or result.seconds < best_results[stage].seconds:
+                    best_results[stage] = result
+
+            shutil.rmtree(work_directory)
+
+    return best_results
+
+
+def to_json(options: SyntheticLogOptions, days: int, jobs: int, results: dict[str, StageResult]) -> dict:
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": dict(asdict(options), days=days, jobs=jobs),
+        "stages": {
+            stage: dict(asdict(result), lines_per_second=result.lines_per_second)
+            for stage, result in results.items()
+        },
+    }
+
+
+def format_change(value: float, baseline_value: float) -> str:
+    if baseline_value == 0:
+        return "n/a"
+    return "{:+.1f}%".format((value / baseline_value - 1) * 100)
+
+
+def print_report(report: dict, baseline: Optional[dict] = None) -> list[str]:
+    """
+    Prints the results of every stage, compared to the baseline if one is given.
+    :return: The stages that are slower than in the baseline, ordered by how much slower they are
+    """
+    if baseline is not None and baseline["parameters"] != report["parameters"]:
+        print("The baseline was measured with other parameters, the results are not comparable:")
+        print("  baseline: ", baseline["parameters"])
+        print("  this run: ", report["parameters"])
+
+    print("{:10} {:>10} {:>9} {:>12} {:>12} {:>13} {:>13}".format(
+        "stage", "lines", "seconds", "lines/s", "peak RSS MB", "lines/s vs", "RSS vs"
+    ))
+
+    slowdowns = []
+    for stage, result in report["stages"].items():
+        baseline_result = baseline["stages"].get(stage) if baseline is not None else None
+
+        throughput_change = ""
+        rss_change = ""
+        if baseline_result is not None:
+            throughput_change = format_change(result["lines_per_second"], baseline_result["lines_per_second"])
+            rss_change = format_change(result["peak_rss_mb"], baseline_result["peak_rss_mb"])
+            if baseline_result["lines_per_second"] > 0:
+                slowdowns.append((1 - result["lines_per_second"] / baseline_result["lines_per_second"], stage))
+
+        print("{:10} {:10d} {:9.2f} {:12.0f} {:12.1f} {:>13} {:>13}".format(
+            stage, result["lines"], result["seconds"], result["lines_per_second"], result["peak_rss_mb"],
+            throughput_change, rss_change
+        ))
+
+    return [stage for slowdown, stage in sorted(slowdowns, reverse=True) if slowdown > 0]
+
+
+def main():
+    defaults = SyntheticLogOptions()
+
+    parser = argparse.ArgumentParser(description='Benchmarks the stages of the log pipeline on synthetic logs. '
+                                                 'Reports the lines per second and the peak RSS of every stage.')
+    parser.add_argument('--stages',
+                        nargs='+',
+                        choices=STAGES,
+                        default=STAGES,
+                        help='the stages to report, the stages before them are run as well to create their input')
+    parser.add_argument('--days',
+                        type=int,
+                        default=1,
+                        help='the number of days to generate logs for')
+    parser.add_argument('--lines-per-day', '-l',
+                        type=int,
+                        default=500000,
+                        help='the number of command log lines per day')
+    parser.add_argument('--concurrency', '-c',
+                        type=float,
+                        default=defaults.concurrency,
+                        help='the mean number of requests in flight at the same time')
+    parser.add_argument('--request-types', '-r',
+                        type=int,
+                        default=defaults.request_types,
+                        help='the number of request types')
+    parser.add_argument('--sources', '-s',
+                        type=int,
+                        default=defaults.sources,
+                        help='the number of WS log files per day')
+    parser.add_argument('--ars-sources',
+                        type=int,
+                        default=defaults.ars_sources,
+                        help='the number of ARS log files per day')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=defaults.seed,
+                        help='the seed of the random numbers of the generated logs')
+    parser.add_argument('--jobs', '-j',
+                        type=int,
+                        default=1,
+                        help='the number of processes the stages that can run in parallel use')
+    parser.add_argument('--repetitions', '-n',
+                        type=int,
+                        default=1,
+                        help='run the stages that many times and report the fastest run of every stage')
+    parser.add_argument('--temp-directory', '-t',
+                        type=dir_path,
+                        help='the directory the logs are generated and processed in')
+    parser.add_argument('--save-baseline',
+                        type=str,
+                        help='save the results as json to this file, to compare later runs with')
+    parser.add_argument('--baseline',
+                        type=str,
+                        help='compare the results with a baseline saved with --save-baseline')
+    parser.add_argument('--max-slowdown',
+                        type=float,
+                        help='exit with an error if a stage processes more than this many percent '
+                             'fewer lines per second than in the baseline')
+    parser.add_argument('--verbose', '-v',
+                        action='store_true',
+                        help='show the output of the stages')
+
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    options = SyntheticLogOptions(
+        lines_per_day=args.lines_per_day,
+        concurrency=args.concurrency,
+        request_types=args.request_types,
+        sources=args.sources,
+        ars_sources=args.ars_sources,
+        seed=args.seed
+    )
+
+    results = benchmark(options, args.days, args.stages, args.jobs, args.repetitions, args.temp_directory,
+                        args.verbose)
+    report = to_json(options, args.days, args.jobs, results)
+
+    slower_stages = print_report(report, baseline)
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Saved baseline to", args.save_baseline)
+
+    if baseline is not None and args.max_slowdown is not None:
+        too_slow = [
+            stage for stage in slower_stages
+            if report["stages"][stage]["lines_per_second"]
+            < baseline["stages"][stage]["lines_per_second"] * (1 - args.max_slowdown / 100)
+        ]
+        if len(too_slow) > 0:
+            print("Slower than the baseline by more than {}%: {}".format(args.max_slowdown, ", ".join(too_slow)))
+            exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,338 @@
+import os
 import re
 from datetime import datetime
+from typing import Iterator, Tuple, Optional
 
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from pandas import Categorical, DataFrame
 
-def read_data_line_from_log_file(path: str):
-    with open(path) as logfile:
+from CompressedLogFiles import open_log_file, is_compressed
+from TimestampParser import parse_timestamp
+
+# [2021-03-04 12:00:00,123456] (PR:  4/ 5/ 0) ID_REQ_KC_STORE7D3BPACKET          : Response time 6 ms
+_CONV_LINE_PATTERN = re.compile(
+    r"\[([^\]]*)\]"
+    r".*?PR:\s*(\d+)/\s*(\d+)/\s*(\d+)"
+    r".*?(ID_\w+)"
+    r".*?Response time\s(\d+)"
+)
+
+# width of the fixed-width windows the batch reader slices out of the lines
+_WINDOW_PADDING = 64
+
+
+class LogFileEntry:
+    """One entry of a Conv_*.log file."""
+
+    __slots__ = (
+        "time_stamp",
+        "number_of_parallel_requests_start",
+        "number_of_parallel_requests_end",
+        "number_of_parallel_requests_finished",
+        "request_type",
+        "response_time",
+    )
+
+    def __init__(self,
+                 time_stamp: datetime,
+                 number_of_parallel_requests_start: int,
+                 number_of_parallel_requests_end: int,
+                 number_of_parallel_requests_finished: int,
+                 request_type: str,
+                 response_time: int):
+        self.time_stamp = time_stamp
+        self.number_of_parallel_requests_start = number_of_parallel_requests_start
+        self.number_of_parallel_requests_end = number_of_parallel_requests_end
+        self.number_of_parallel_requests_finished = number_of_parallel_requests_finished
+        self.request_type = request_type
+        self.response_time = response_time
+
+    # dict-style access, as used by TrainingDataRow.from_logfile_entry
+    def keys(self):
+        return self.__slots__
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __eq__(self, other):
+        if not isinstance(other, LogFileEntry):
+            return NotImplemented
+        return all(getattr(self, key) == getattr(other, key) for key in self.__slots__)
+
+    def __repr__(self):
+        return "LogFileEntry({})".format(", ".join(f"{key}={getattr(self, key)!r}" for key in self.__slots__))
+
+
+def parse_data_line(line: str) -> LogFileEntry:
+    """
+    Extracts the timestamp, the number of parallel requests (start/end/finished),
+    the request type and the request execution time from a line of a Conv_*.log file in one pass.
+    """
+    match = _CONV_LINE_PATTERN.search(line)
+    if match is None:
+        raise ValueError("Not a valid log entry: {}".format(line.rstrip('\n')))
+
+    return LogFileEntry(
+        parse_timestamp(line, match.start(1)),
+        int(match.group(2)),
+        int(match.group(3)),
+        int(match.group(4)),
+        match.group(5),
+        int(match.group(6))
+    )
+
+
+def read_data_line_from_log_file(path: str, start_offset: int = 0, end_offset: Optional[int] = None):
+    """
+    :param path: Path to the Conv_*.log file
+    :param start_offset: Byte offset of the first line to read, has to be the beginning of a line
+    :param end_offset: Byte offset to stop reading at, has to be the end of a line, defaults to the end of the file
+
+    Compressed files cannot be appended to while they are processed, they are always read as a whole
+    and their offsets are the ones of the compressed file, see get_end_of_complete_lines.
+    """
+    for entry, _ in read_data_lines_and_offsets(path, start_offset, end_offset):
+        yield entry
+
+
+def read_data_lines_and_offsets(path: str,
+                                start_offset: int = 0,
+                                end_offset: Optional[int] = None) -> Iterator[Tuple[LogFileEntry, Optional[int]]]:
+    """
+    Like read_data_line_from_log_file, but also yields the byte offset right after the line of every entry,
+    where reading can continue after it. The offset is None if the file is read as a whole.
+    """
+    if (start_offset == 0 and end_offset is None) or is_compressed(path):
+        with open_log_file(path) as logfile:
+            for line in logfile:
+                if 'Response time' not in line:
+                    continue
+
+                yield parse_data_line(line), None
+        return
+
+    with open(path, "rb") as logfile:
+        logfile.seek(start_offset)
+        position = start_offset
         for line in logfile:
-            if 'Response time' not in line:
+            position += len(line)
+            if end_offset is not None and position > end_offset:
+                break
+
+            if b'Response time' not in line:
                 continue
 
-            # Extract:
-            # * Timestamp as DateTime
-            # * Number of Parallel Requests
-            # * Request Type
-            # * Request Execution Time
+            yield parse_data_line(line.decode()), position
+
+
+def get_end_of_complete_lines(path: str, chunk_size: int = 64 * 1024) -> int:
+    """
+    Returns the byte offset right after the last line break of a file,
+    so that a line that is still being written is left out.
+    For a compressed file, this is its size: it is read as a whole.
+    """
+    if is_compressed(path):
+        return os.path.getsize(path)
+
+    with open(path, "rb") as file:
+        end = file.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - chunk_size)
+            file.seek(start)
+            last_line_break = file.read(end - start).rfind(b"\n")
+            if last_line_break != -1:
+                return start + last_line_break + 1
+            end = start
+
+    return 0
+
+
+def _number_ending_at(buffer: np.ndarray, end: np.ndarray, max_digits: int) -> np.ndarray:
+    """Parses the unsigned integers whose last digit is right before the given positions."""
+    value = np.zeros(len(end), dtype=np.int64)
+    pending = np.arange(len(end))
+    factor = 1
+    for k in range(1, max_digits + 1):
+        position = end[pending] - k
+        digit = buffer[np.maximum(position, 0)].astype(np.int64) - ord('0')
+        is_digit = (digit >= 0) & (digit <= 9) & (position >= 0)
+
+        pending = pending[is_digit]
+        if len(pending) == 0:
+            break
+        value[pending] += digit[is_digit] * factor
+        factor *= 10
+    return value
+
+
+def _find_forward(buffer: np.ndarray, start: np.ndarray, character: str, max_distance: int) -> np.ndarray:
+    """Returns the position of the next occurrence of a character at or after the given positions, or -1."""
+    position = np.full(len(start), -1, dtype=np.int64)
+    pending = np.arange(len(start))
+    last_index = len(buffer) - 1
+    for k in range(max_distance):
+        candidates = start[pending] + k
+        hit = buffer[np.minimum(candidates, last_index)] == ord(character)
+        position[pending[hit]] = candidates[hit]
+
+        pending = pending[~hit]
+        if len(pending) == 0:
+            break
+    return position
+
+
+def _distinct_byte_strings(rows: np.ndarray) -> Tuple[list[str], np.ndarray]:
+    """
+    Returns the distinct rows of a two-dimensional array of zero-padded byte strings
+    and the index into the distinct rows for every row.
+    """
+    # hash the rows into integers, sorting those is way cheaper than sorting the byte strings
+    weights = np.random.default_rng(0).integers(1, np.iinfo(np.int64).max, rows.shape[1]).astype(np.uint64)
+    keys = (rows.astype(np.uint64) * weights).sum(axis=1)
+    _, first_index, codes = np.unique(keys, return_index=True, return_inverse=True)
+
+    if not (rows[first_index][codes] == rows).all():
+        # hash collision
+        distinct, codes = np.unique(rows.view(f'S{rows.shape[1]}').ravel(), return_inverse=True)
+        return [row.decode() for row in distinct], codes
+
+    return [row.tobytes().rstrip(b"\0").decode() for row in rows[first_index]], codes
+
+
+def _parse_data_lines(data: bytes) -> DataFrame:
+    # padding, so that fixed-width windows starting on the last line stay within the buffer
+    buffer = np.frombuffer(data + bytes(_WINDOW_PADDING), dtype=np.uint8)
+    windows = sliding_window_view(buffer, _WINDOW_PADDING)
+
+    line_ends = np.flatnonzero(buffer == ord('\n'))
+    line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+
+    # [2021-03-04 12:00:00,123456] (PR:  4/ 5/ 0) ID_REQ_KC_STORE7D3BPACKET          : Response time 6 ms
+    # everything up to '(PR:' has a fixed width, the rest is located relative to the delimiters
+    valid = line_ends - line_starts > 50
+    valid[valid] = (buffer[line_starts[valid]] == ord('[')) \
+        & (buffer[line_starts[valid] + 29] == ord('(')) \
+        & (buffer[line_ends[valid] - 1] == ord('s')) \
+        & (buffer[line_ends[valid] - 2] == ord('m'))
+    line_starts = line_starts[valid]
+    line_ends = line_ends[valid]
+
+    if len(line_starts) == 0:
+        return _empty_data_frame()
+
+    # digits of yyyy-MM-dd HH:mm:ss,ffffff
+    digits = windows[line_starts + 1, :26].astype(np.int32) - ord('0')
+
+    def number_at(offset: int, width: int) -> np.ndarray:
+        return digits[:, offset:offset + width] @ (10 ** np.arange(width - 1, -1, -1))
+
+    years = number_at(0, 4)
+    months = number_at(5, 2)
+    days = number_at(8, 2)
+    seconds_of_day = number_at(11, 2) * 3600 + number_at(14, 2) * 60 + number_at(17, 2)
+    microseconds = number_at(20, 6)
+
+    time_stamps = ((years - 1970).astype('datetime64[Y]') + (months - 1).astype('timedelta64[M]')) \
+        .astype('datetime64[D]') \
+        + (days - 1).astype('timedelta64[D]') \
+        + seconds_of_day.astype('timedelta64[s]') \
+        + microseconds.astype('timedelta64[us]')
+
+    first_slash = _find_forward(buffer, line_starts + 34, '/', 12)
+    second_slash = _find_forward(buffer, first_slash + 1, '/', 12)
+    closing_parenthesis = _find_forward(buffer, second_slash + 1, ')', 12)
+
+    found = (first_slash != -1) & (second_slash != -1) & (closing_parenthesis != -1)
+    if not found.all():
+        line_ends, time_stamps, first_slash, second_slash, closing_parenthesis = \
+            (column[found] for column in (line_ends, time_stamps, first_slash, second_slash, closing_parenthesis))
+
+    # the request type is padded to 35 characters, unless it is longer
+    request_type_start = closing_parenthesis + 2
+    colon = request_type_start + 35
+    longer = buffer[np.minimum(colon, len(buffer) - 1)] != ord(':')
+    if longer.any():
+        colons = np.flatnonzero(buffer == ord(':'))
+        colon[longer] = colons[np.searchsorted(colons, request_type_start[longer])]
+
+    # fixed-width view of the request types, padded with zeros instead of spaces
+    request_type_length = colon - request_type_start
+    width = int(request_type_length.max())
+    if width <= _WINDOW_PADDING:
+        request_type_bytes = windows[request_type_start, :width]
+    else:
+        request_type_bytes = buffer[np.minimum(request_type_start[:, None] + np.arange(width), len(buffer) - 1)]
+    request_type_bytes = np.where(
+        (request_type_bytes == ord(' ')) | (np.arange(width) >= request_type_length[:, None]),
+        0,
+        request_type_bytes
+    ).astype(np.uint8)
+    request_types, codes = _distinct_byte_strings(request_type_bytes)
+
+    return DataFrame({
+        "time_stamp": time_stamps.astype('datetime64[ns]'),
+        "number_of_parallel_requests_start": _number_ending_at(buffer, first_slash, 10),
+        "number_of_parallel_requests_end": _number_ending_at(buffer, second_slash, 10),
+        "number_of_parallel_requests_finished": _number_ending_at(buffer, closing_parenthesis, 10),
+        "request_type": Categorical.from_codes(codes, request_types),
+        # the response time is the number before the trailing ' ms'
+        "response_time": _number_ending_at(buffer, line_ends - 3, 18)
+    })
+
+
+def _empty_data_frame() -> DataFrame:
+    return DataFrame({
+        "time_stamp": np.array([], dtype='datetime64[ns]'),
+        "number_of_parallel_requests_start": np.array([], dtype=np.int64),
+        "number_of_parallel_requests_end": np.array([], dtype=np.int64),
+        "number_of_parallel_requests_finished": np.array([], dtype=np.int64),
+        "request_type": Categorical([]),
+        "response_time": np.array([], dtype=np.int64)
+    })
+
+
+def read_data_frames_from_log_file(path: str, chunk_size: int = 8 * 1024 * 1024) -> Iterator[DataFrame]:
+    """
+    Reads a Conv_*.log file in chunks of whole lines and yields every chunk as a DataFrame
+    with the same columns as the entries of read_data_line_from_log_file:
+    time_stamp (datetime64[ns]), the number of parallel requests (int64),
+    request_type (category) and response_time (int64).
+    The lines are parsed with vectorized numpy operations instead of one line at a time.
+    :param path: Path to the Conv_*.log file
+    :param chunk_size: Approximate number of bytes per chunk
+    """
+    with open_log_file(path, "rb") as logfile:
+        remainder = b""
+        while True:
+            data = logfile.read(chunk_size)
+            if not data:
+                break
+
+            data = remainder + data
+            end_of_last_line = data.rfind(b"\n") + 1
+            remainder = data[end_of_last_line:]
 
-            time_stamp = datetime.strptime(re.search('\\[.*\\]', line).group(), '[%Y-%m-%d %H:%M:%S,%f]')
+            if end_of_last_line > 0:
+                yield _parse_data_lines(data[:end_of_last_line])
 
-            number_of_parallel_requests_s = re.search('(?<=PR:)(\\s*\\d*)/(\\s*\\d*)/(\\s*\\d*)', line).groups()
-            number_of_parallel_requests_start = int(number_of_parallel_requests_s[0])
-            number_of_parallel_requests_end = int(number_of_parallel_requests_s[1])
-            number_of_parallel_requests_finished = int(number_of_parallel_requests_s[2])
+        if remainder:
+            yield _parse_data_lines(remainder + b"\n")
 
-            request_type = re.search(r"ID_\w+", line).group()
 
-            response_time = re.search('(?<=Response time\\s)\\d*', line).group()
+def read_data_frame_from_log_file(path: str) -> DataFrame:
+    """Reads a whole Conv_*.log file into one DataFrame, see read_data_frames_from_log_file."""
+    data_frames = list(read_data_frames_from_log_file(path))
+    if len(data_frames) == 0:
+        return _empty_data_frame()
+    if len(data_frames) == 1:
+        return data_frames[0]
 
-            yield {
-                "time_stamp": time_stamp,
-                "number_of_parallel_requests_start": number_of_parallel_requests_start,
-                "number_of_parallel_requests_end": number_of_parallel_requests_end,
-                "number_of_parallel_requests_finished": number_of_parallel_requests_finished,
-                "request_type": request_type,
-                "response_time": response_time
-            }
+    data_frame = DataFrame({column: np.concatenate([df[column].to_numpy() for df in data_frames])
+                            for column in data_frames[0].columns if column != "request_type"})
+    data_frame.insert(4, "request_type",
+                      Categorical(np.concatenate([df["request_type"].to_numpy(dtype=object) for df in data_frames])))
+    return data_frame
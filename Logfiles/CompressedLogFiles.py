@@ -0,0 +1,81 @@
+import glob
+import io
+from os.path import join
+from typing import IO
+
+# The compressions log files can be stored with, recognized by the suffix after ".log".
+# gzip is part of the standard library, zstd and lz4 need the zstandard and lz4 packages.
+COMPRESSION_SUFFIXES = (".gz", ".zst", ".lz4")
+
+
+def get_compression_suffix(path) -> str:
+    """Returns the compression suffix of a path, an empty string if the file is not compressed."""
+    for suffix in COMPRESSION_SUFFIXES:
+        if str(path).endswith(suffix):
+            return suffix
+
+    return ""
+
+
+def is_compressed(path) -> bool:
+    return get_compression_suffix(path) != ""
+
+
+def strip_compression_suffix(path: str) -> str:
+    suffix = get_compression_suffix(path)
+    return path[:-len(suffix)] if suffix != "" else path
+
+
+def open_log_file(path, mode: str = "r", encoding: str = None, errors: str = None, newline: str = None) -> IO:
+    """
+    Opens a log file like open() does, but decompresses or compresses it on the fly
+    if its name ends with one of the COMPRESSION_SUFFIXES.
+    Compressed files are streamed, they are never decompressed to disk.
+    """
+    suffix = get_compression_suffix(path)
+    if suffix == "":
+        return open(path, mode, encoding=encoding, errors=errors, newline=newline)
+
+    # unlike open(), the compression libraries default to binary mode
+    if "b" not in mode and "t" not in mode:
+        mode = mode + "t"
+
+    if suffix == ".gz":
+        import gzip
+        return gzip.open(path, mode, encoding=encoding, errors=errors, newline=newline)
+
+    if suffix == ".lz4":
+        import lz4.frame
+        return lz4.frame.open(path, mode, encoding=encoding, errors=errors, newline=newline)
+
+    return _open_zstd_file(path, mode, encoding, errors, newline)
+
+
+def _open_zstd_file(path, mode: str, encoding: str, errors: str, newline: str) -> IO:
+    import zstandard
+
+    file_mode = mode.replace("t", "").replace("b", "") + "b"
+    if "r" in mode:
+        # files written by pzstd or zstd -T consist of several frames
+        stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(
+            open(path, file_mode), read_across_frames=True, closefd=True
+        ))
+    else:
+        # compress with as many threads as there are cores
+        stream = io.BufferedWriter(zstandard.ZstdCompressor(threads=-1).stream_writer(
+            open(path, file_mode), closefd=True
+        ))
+
+    if "b" in mode:
+        return stream
+
+    return io.TextIOWrapper(stream, encoding=encoding, errors=errors, newline=newline)
+
+
+def glob_log_files(directory: str, pattern: str) -> list[str]:
+    """Finds the log files matching the pattern in the directory and its subdirectories, compressed or not."""
+    logfiles = []
+    for suffix in ("",) + COMPRESSION_SUFFIXES:
+        logfiles.extend(glob.glob(join(directory, '**', pattern + suffix), recursive=True))
+
+    return logfiles
@@ -0,0 +1,136 @@
+import hashlib
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import Engine, MetaData, Table, Column, String, Integer, Boolean, Row, select, update, insert, \
+    inspect, text
+from sqlalchemy.orm import Session
+
+_metadata = MetaData()
+
+# How far the ETL got with each log file. Rows and progress are committed together,
+# so a crash in the middle of a file leaves a consistent state that can be resumed.
+# The progress is counted in log file entries, not in rows, and every commit moves byte_offset to the end
+# of the last committed entry, so that a run resumes right there, whatever rows it creates per entry.
+etl_progress_table = Table(
+    "etl_progress",
+    _metadata,
+    Column("log_file", String, primary_key=True),
+    Column("rows_committed", Integer, nullable=False, default=0),
+    Column("completed", Boolean, nullable=False, default=False),
+    # the rows of the bytes before byte_offset are all committed, there are rows_at_byte_offset of them
+    Column("byte_offset", Integer, nullable=False, server_default="0"),
+    Column("rows_at_byte_offset", Integer, nullable=False, server_default="0"),
+    # the entries of the log file committed, and the ones of the bytes before byte_offset.
+    # Compressed files are read as a whole, their byte_offset stays 0 until they are completed.
+    # NULL in progress recorded before the entries were counted, the rows were the entries then
+    Column("entries_committed", Integer, nullable=True),
+    Column("entries_at_byte_offset", Integer, nullable=True),
+    # fingerprint of the beginning of the file, to notice that a file was replaced instead of appended to
+    Column("fingerprint", String, nullable=True),
+)
+
+# number of bytes at the beginning of a file the fingerprint is computed of
+FINGERPRINT_SIZE = 64 * 1024
+
+
+@dataclass
+class LogFileSegment:
+    """
+    The part of a log file a run processes: from the end of the part processed by previous runs
+    to the end of the last complete line.
+    """
+    start_offset: int
+    end_offset: int
+    # rows of the log file committed in total ...
+    rows_committed: int = 0
+    # ... and by the runs before the segment
+    rows_before_segment: int = 0
+    # entries of the log file committed in total ...
+    entries_committed: int = 0
+    # ... and the ones of the bytes before start_offset
+    entries_before_segment: int = 0
+    # byte offset right after the last committed entry, if it is known
+    entry_offset: Optional[int] = None
+
+    @property
+    def entries_committed_of_segment(self) -> int:
+        return self.entries_committed - self.entries_before_segment
+
+
+def create_etl_progress_table(db_connection: Engine):
+    _metadata.create_all(db_connection)
+
+    # databases created before the byte offsets were tracked
+    existing_columns = {column["name"] for column in inspect(db_connection).get_columns(etl_progress_table.name)}
+    with db_connection.begin() as connection:
+        for column in etl_progress_table.columns:
+            if column.name not in existing_columns:
+                default = " DEFAULT {}".format(column.server_default.arg) if column.server_default is not None else ""
+                connection.execute(text("ALTER TABLE {} ADD COLUMN {} {}{}".format(
+                    etl_progress_table.name, column.name, column.type.compile(db_connection.dialect), default
+                )))
+
+
+def get_etl_progress(db_connection: Session, log_file: str) -> Optional[Row]:
+    return db_connection.execute(
+        select(etl_progress_table).where(etl_progress_table.c.log_file == log_file)
+    ).first()
+
+
+def save_etl_progress(db_connection: Session,
+                      log_file: str,
+                      rows_committed: int,
+                      completed: bool,
+                      byte_offset: int = 0,
+                      rows_at_byte_offset: int = 0,
+                      fingerprint: Optional[str] = None,
+                      entries_committed: int = 0,
+                      entries_at_byte_offset: int = 0):
+    """Records the progress of a log file, it is committed together with the next commit of the session."""
+    values = {
+        "rows_committed": rows_committed,
+        "completed": completed,
+        "byte_offset": byte_offset,
+        "rows_at_byte_offset": rows_at_byte_offset,
+        "fingerprint": fingerprint,
+        "entries_committed": entries_committed,
+        "entries_at_byte_offset": entries_at_byte_offset
+    }
+
+    result = db_connection.execute(
+        update(etl_progress_table).where(etl_progress_table.c.log_file == log_file).values(values)
+    )
+    if result.rowcount == 0:
+        db_connection.execute(insert(etl_progress_table).values(log_file=log_file, **values))
+
+
+def save_etl_progress_of_segment(db_connection: Session, log_file: str, segment: LogFileSegment, completed: bool):
+    """
+    Records the progress of a log file within a segment. Once the segment is completed,
+    the next run continues after it, otherwise right after the last committed entry.
+    If the offset of that entry is not known, the next run processes the segment again, skipping the committed entries.
+    """
+    if completed:
+        byte_offset = segment.end_offset
+    elif segment.entry_offset is not None:
+        byte_offset = segment.entry_offset
+    else:
+        byte_offset = segment.start_offset
+
+    if byte_offset == segment.start_offset:
+        rows_at_byte_offset = segment.rows_before_segment
+        entries_at_byte_offset = segment.entries_before_segment
+    else:
+        rows_at_byte_offset = segment.rows_committed
+        entries_at_byte_offset = segment.entries_committed
+
+    save_etl_progress(db_connection, log_file, segment.rows_committed, completed,
+                      byte_offset, rows_at_byte_offset, compute_fingerprint(log_file, byte_offset),
+                      segment.entries_committed, entries_at_byte_offset)
+
+
+def compute_fingerprint(path: str, byte_offset: int) -> str:
+    """Returns a hash of the beginning of a file, but not beyond byte_offset, so that appending does not change it."""
+    with open(path, "rb") as file:
+        return hashlib.sha1(file.read(min(byte_offset, FINGERPRINT_SIZE))).hexdigest()
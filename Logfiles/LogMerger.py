@@ -1,49 +1,268 @@
 import argparse
-import glob
-from os.path import join
+import heapq
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from os.path import join, getsize
 from pathlib import Path
 
 from itertools import groupby
 
-from rast_common.main.StringUtils import dir_path, get_timestamp_from_string
+from rast_common.main.StringUtils import dir_path
 from rast_common.main.StringUtils import get_date_from_string
 
+from CompressedLogFiles import open_log_file, glob_log_files, COMPRESSION_SUFFIXES
+from StageMetrics import get_stage_metrics, run_with_stage_metrics, add_instrumentation_arguments, instrument
+from TimestampParser import get_timestamp_from_string
+
+# the maximum number of run files the external sort merges at once, more runs are merged in several passes
+MAX_MERGE_FAN_IN = 64
+
+
+class UnsortedLogFileError(Exception):
+    """Raised when a log file that is expected to be ordered by time is not."""
+
+    def __init__(self, path: str, line: str):
+        super().__init__("{} is not sorted by time, offending line: {}".format(path, line.rstrip('\n')))
+        self.path = path
+        self.line = line
+
 
 class LogMerger:
     @staticmethod
-    def aggregate(group: str, similar_logfile_paths: list):
-        def read_files(*filenames):
+    def read_files(*filenames):
+        for filename in filenames:
+            print("Reading ", filename)
+            with open_log_file(filename, 'r') as file_obj:
+                yield from file_obj
+
+    @staticmethod
+    def read_sorted_file(filename: str):
+        """
+        Reads a log file that is expected to be ordered by time.
+        :param filename: Path to the log file
+        :raises UnsortedLogFileError: as soon as a line is older than its predecessor
+        """
+        print("Reading ", filename)
+        with open_log_file(filename, 'r') as file_obj:
+            yield from LogMerger.read_sorted_lines(file_obj, filename)
+
+    @staticmethod
+    def read_sorted_lines(lines, name: str):
+        """
+        Yields the timestamp and the line of lines that are expected to be ordered by time.
+        :param lines: The lines of a log
+        :param name: The name of the log, for the error message
+        :raises UnsortedLogFileError: as soon as a line is older than its predecessor
+        """
+        last_timestamp = None
+        for line in lines:
+            timestamp = get_timestamp_from_string(line)
+            if last_timestamp is not None and timestamp < last_timestamp:
+                raise UnsortedLogFileError(name, line)
+            last_timestamp = timestamp
+
+            yield timestamp, line
+
+    @staticmethod
+    def merge_sorted_streams(*streams):
+        """
+        Merges streams of (timestamp, line) that are each ordered by time.
+        Lines with equal timestamps keep the order of the streams, just like a stable sort would.
+        """
+        return heapq.merge(*streams, key=lambda entry: entry[0])
+
+    @staticmethod
+    def merge_sorted_files(*filenames):
+        """
+        Merges log files that are each ordered by time, keeping only one line per file in memory.
+        Lines with equal timestamps keep the order of the files, just like a stable sort would.
+        """
+        streams = [LogMerger.read_sorted_file(filename) for filename in filenames]
+        for _, line in LogMerger.merge_sorted_streams(*streams):
+            yield line
+
+    @staticmethod
+    def external_sort(lines, memory_budget: int, temp_directory: str = None, max_fan_in: int = MAX_MERGE_FAN_IN):
+        """
+        Sorts lines by their timestamp using a bounded amount of memory.
+        Runs that fit into the memory budget are sorted in memory and spilled to temporary files,
+        which are then merged with a k-way merge. The result equals a stable sort of all lines.
+        :param lines: The lines to sort
+        :param memory_budget: Approximate number of bytes a run may occupy in memory
+        :param temp_directory: Where to put the temporary run files, defaults to the system temp directory
+        :param max_fan_in: The maximum number of run files that are open at once
+        """
+        if memory_budget <= 0:
+            raise ValueError("The memory budget must be positive, got {}".format(memory_budget))
+        if max_fan_in < 2:
+            raise ValueError("At least two runs must be merged at once, got {}".format(max_fan_in))
+
+        # size of the tuple and the timestamp that decorate every line of a run
+        entry_overhead = sys.getsizeof((None, None)) + sys.getsizeof(datetime.min)
+
+        with tempfile.TemporaryDirectory(prefix="LogMerger_", dir=temp_directory) as run_directory:
+            run_paths = []
+            run = []
+            run_size = 0
+
+            for line in lines:
+                run.append((get_timestamp_from_string(line), line))
+                run_size += sys.getsizeof(line) + entry_overhead
+
+                if run_size >= memory_budget:
+                    run_paths.append(LogMerger._spill_run(run, run_directory, len(run_paths)))
+                    run = []
+                    run_size = 0
+
+            run.sort(key=lambda entry: entry[0])
+
+            if len(run_paths) == 0:
+                for _, line in run:
+                    yield line
+                return
+
+            if len(run) > 0:
+                run_paths.append(LogMerger._spill_run(run, run_directory, len(run_paths)))
+            run = None
+
+            print("Merging {} sorted runs".format(len(run_paths)))
+
+            run_paths = LogMerger._merge_runs(run_paths, run_directory, max_fan_in)
+            yield from LogMerger._merge_run_files(run_paths)
+
+    @staticmethod
+    def _spill_run(run: list, run_directory: str, number: int) -> str:
+        run.sort(key=lambda entry: entry[0])
+
+        run_path = join(run_directory, "run_{:05}.log".format(number))
+        with open(run_path, mode="w") as run_file:
+            run_file.writelines(line for _, line in run)
+
+        return run_path
+
+    @staticmethod
+    def _merge_runs(run_paths: list, run_directory: str, max_fan_in: int) -> list:
+        """
+        Merges the runs in passes until at most max_fan_in runs are left.
+        Only consecutive runs are merged with each other, which keeps the merge stable.
+        :return: The paths of the remaining runs, in order
+        """
+        merge_pass = 0
+        while len(run_paths) > max_fan_in:
+            merge_pass += 1
+            print("Merge pass {}: merging {} runs into {}".format(
+                merge_pass, len(run_paths), -(-len(run_paths) // max_fan_in)
+            ))
+
+            merged_run_paths = []
+            for i in range(0, len(run_paths), max_fan_in):
+                runs_to_merge = run_paths[i:i + max_fan_in]
+
+                merged_run_path = join(
+                    run_directory, "pass_{}_run_{:05}.log".format(merge_pass, len(merged_run_paths))
+                )
+                with open(merged_run_path, mode="w") as merged_run_file:
+                    merged_run_file.writelines(LogMerger._merge_run_files(runs_to_merge))
+
+                for run_path in runs_to_merge:
+                    os.remove(run_path)
+                merged_run_paths.append(merged_run_path)
+
+            run_paths = merged_run_paths
+
+        return run_paths
+
+    @staticmethod
+    def _merge_run_files(run_paths: list):
+        def read_run(run_path: str):
+            with open(run_path, mode="r") as run_file:
+                yield from LogMerger.read_sorted_lines(run_file, run_path)
+
+        for _, line in LogMerger.merge_sorted_streams(*[read_run(run_path) for run_path in run_paths]):
+            yield line
+
+    @staticmethod
+    def write_lines(target_path: str, lines) -> int:
+        """Writes the lines and counts them as processed, every merged line is written exactly once."""
+        metrics = get_stage_metrics()
+
+        print("Writing to ", target_path)
+        with open_log_file(target_path, mode="w") as targetFile:
             counter = 0
-            for filename in filenames:
-                print("Reading ", filename)
-                with open(filename, 'r') as file_obj:
-                    for line in file_obj:
-                        counter = counter + 1
-                        if counter % 20000 == 0:
-                            print("Processed {} entries".format(counter))
+            for line in lines:
+                targetFile.write(line)
+                counter += 1
+                if counter % 20000 == 0:
+                    metrics.count_lines(20000)
 
-                        yield line
+        metrics.count_lines(counter % 20000)
+        return counter
 
+    @staticmethod
+    def aggregate(group: str,
+                  similar_logfile_paths: list,
+                  streaming: bool = False,
+                  memory_budget: int = None,
+                  temp_directory: str = None,
+                  compression_suffix: str = ""):
+        """
+        Merges the log files of one day into Merged_<group>.log.
+        :param group: The day the log files belong to
+        :param similar_logfile_paths: The log files to merge
+        :param streaming: Assume that every log file is already ordered by time and merge them
+        with constant memory. Falls back to sorting if a file turns out to be unsorted.
+        :param memory_budget: Sort with an external sort that uses approximately this many bytes of memory,
+        instead of sorting everything in memory
+        :param temp_directory: Where the external sort puts its temporary files
+        :param compression_suffix: Compress the merged log, one of the COMPRESSION_SUFFIXES
+        """
         def merge(*seqs):
-            return sorted(read_files(*seqs), key=get_timestamp_from_string)
+            return sorted(LogMerger.read_files(*seqs), key=get_timestamp_from_string)
 
         logfiles_directory = Path(similar_logfile_paths[0]).parent
-        targetPath = join(logfiles_directory, "Merged_%s.log" % group)
+        targetPath = join(logfiles_directory, "Merged_%s.log%s" % (group, compression_suffix))
 
         print("Merging %s" % similar_logfile_paths)
 
-        result_file = merge(*similar_logfile_paths)
+        metrics = get_stage_metrics()
+        with metrics.file(targetPath, size=sum(getsize(path) for path in similar_logfile_paths)):
+            if streaming:
+                lines_before = metrics.lines
+                try:
+                    # reading, merging and writing are interleaved
+                    with metrics.phase("merge"):
+                        written = LogMerger.write_lines(
+                            targetPath, LogMerger.merge_sorted_files(*similar_logfile_paths)
+                        )
+                    print("Merged %i log entries" % written)
+                    return
+                except UnsortedLogFileError as e:
+                    print(e)
+                    print("Falling back to sorting")
+                    # the lines written so far are written again
+                    metrics.lines = lines_before
 
-        print("Merged %i log entries" % len(result_file))
+            if memory_budget is not None:
+                with metrics.phase("merge"):
+                    written = LogMerger.write_lines(
+                        targetPath,
+                        LogMerger.external_sort(
+                            LogMerger.read_files(*similar_logfile_paths), memory_budget, temp_directory
+                        )
+                    )
+                print("Merged %i log entries" % written)
+                return
 
-        print("Writing to ", targetPath)
-        with open(targetPath, mode="w") as targetFile:
-            counter = 0
-            for line in result_file:
-                if counter % 20000 == 0:
-                    print("Written {} entries".format(counter))
-                targetFile.write(line)
-                counter += 1
+            with metrics.phase("sort"):
+                result_file = merge(*similar_logfile_paths)
+
+            print("Merged %i log entries" % len(result_file))
+
+            with metrics.phase("write"):
+                LogMerger.write_lines(targetPath, result_file)
 
 
 if __name__ == "__main__":
@@ -52,19 +271,66 @@ if __name__ == "__main__":
     parser.add_argument('--directory', '-d',
                         type=dir_path,
                         help='the directory the log files are located in')
+    parser.add_argument('--streaming', '-s',
+                        action='store_true',
+                        help='merge log files that are already ordered by time without loading them into memory')
+    parser.add_argument('--memory-budget', '-m',
+                        type=int,
+                        help='sort with an external sort that uses about this many megabytes of memory')
+    parser.add_argument('--temp-directory', '-t',
+                        type=dir_path,
+                        help='the directory the external sort writes its temporary files to')
+    parser.add_argument('--jobs', '-j',
+                        type=int,
+                        default=1,
+                        help='the number of days to merge in parallel')
+    parser.add_argument('--compress', '-c',
+                        choices=[suffix[1:] for suffix in COMPRESSION_SUFFIXES],
+                        help='compress the merged log files')
+    add_instrumentation_arguments(parser)
 
     args = parser.parse_args()
 
+    compression_suffix = "." + args.compress if args.compress is not None else ""
+
+    if args.memory_budget is not None and args.memory_budget <= 0:
+        parser.error("--memory-budget must be at least 1 megabyte")
+
+    memory_budget = args.memory_budget * 1024 * 1024 if args.memory_budget is not None else None
+
     if args.directory is None:
         parser.print_help()
         exit(1)
 
-    logfiles = glob.glob(join(args.directory, '**', '*.log'), recursive=True)
+    with instrument("LogMerger", args.report, args.profile, args.profile_output) as metrics:
+        logfiles = glob_log_files(args.directory, '*.log')
+
+        # group the files by the date in the file name
+        days = []
+        data = sorted(logfiles, key=get_date_from_string)
+        for group, logfile in groupby(data, key=get_date_from_string):
+            # omit the merged logs created by this script
+            logfilesToAggregate = filter(lambda f: "Merged_" not in f, list(logfile))
+
+            days.append((group, list(logfilesToAggregate)))
 
-    # group the files by the date in the file name
-    data = sorted(logfiles, key=get_date_from_string)
-    for group, logfile in groupby(data, key=get_date_from_string):
-        # omit the merged logs created by this script
-        logfilesToAggregate = filter(lambda f: "Merged_" not in f, list(logfile))
+        if args.jobs <= 1:
+            for group, logfilesToAggregate in days:
+                LogMerger.aggregate(
+                    group, logfilesToAggregate, args.streaming, memory_budget, args.temp_directory, compression_suffix
+                )
+        else:
+            with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+                futures = {
+                    executor.submit(
+                        run_with_stage_metrics, LogMerger.aggregate,
+                        group, logfilesToAggregate, args.streaming, memory_budget, args.temp_directory,
+                        compression_suffix
+                    ): group
+                    for group, logfilesToAggregate in days
+                }
 
-        LogMerger.aggregate(group, list(logfilesToAggregate))
+                for finished, future in enumerate(as_completed(futures), start=1):
+                    _, metrics_of_day = future.result()
+                    metrics.merge(metrics_of_day)
+                    print("Finished merging {} ({}/{} days)".format(futures[future], finished, len(futures)))
@@ -1,27 +1,64 @@
 import asyncio
-import glob
 import json
-import math
-from datetime import datetime, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from multiprocessing import Manager
+from queue import Empty
+from datetime import datetime, timedelta
 from os import path, makedirs
 from os.path import join
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Iterable
 
+import numpy as np
 import typer
+from pandas import DataFrame
 from rast_common.main.StringUtils import get_date_from_string
 from rast_common.main.SwitchAggFlowStats import SwitchAggFlowStats, SwitchAggFlowStatsDecoder
 from rast_common.main.TrainingDatabase import create_connection_using_sqlalchemy, create_training_data_table, \
     training_data_exists_in_db_using_sqlalchemy, insert_training_data
-from sqlalchemy import Engine
+from sqlalchemy import Engine, inspect, insert
+from sqlalchemy.exc import NoInspectionAvailable
 from sqlalchemy.orm import Session
 
-from Common import read_data_line_from_log_file
+from Common import read_data_lines_and_offsets, get_end_of_complete_lines
+from CompressedLogFiles import glob_log_files, is_compressed
+from EtlProgress import create_etl_progress_table, get_etl_progress, save_etl_progress_of_segment, LogFileSegment, \
+    compute_fingerprint
 from rast_common.main.TrainingDatabase import TrainingDataRow
+from ParquetDatasets import ParquetDatasetWriter
 from RequestLogToCLF import NumberOfParallelCommandsTracker
+from StageMetrics import get_stage_metrics, run_with_stage_metrics, instrument
+from SwitchFlowStatsIndex import SwitchFlowStatsIndex
+from SwitchFlowStatsTable import create_switch_flow_stats_table, insert_switch_flow_stats
 
 import os
 
+# system_cpu_usage of rows without a netdata sample close enough in time ...
+CPU_USAGE_WITHOUT_SAMPLE = 1
+# ... and of rows whose netdata sample has no value
+CPU_USAGE_WITHOUT_VALUE = 0
+
+# the attribute of a training data row, and the key of its values, with the flow statistics of all switches
+SWITCH_FLOW_STATS = "switch_flow_stats"
+# the attribute of a training data row with the byte offset right after its log file entry
+END_OF_ENTRY = "end_of_entry"
+
+
+@dataclass
+class EnrichmentOptions:
+    query_netdata: bool = False
+    netdata_tolerance: float = 0.5
+    enrich_with_statistics: bool = True
+    netdata_cache_directory: Optional[str] = None
+    refresh_netdata_cache: bool = False
+    netdata_concurrency: int = 4
+    netdata_host: str = "192.168.64.6"
+    netdata_port: int = 19999
+    all_switches: bool = False
+
 
 def setup_db_using_sqlalchemy(output_directory: str) -> Engine:
     current_dir = os.getcwd()
@@ -44,6 +81,8 @@ def setup_db_using_sqlalchemy(output_directory: str) -> Engine:
         exit(1)
 
     create_training_data_table(db_connection)
+    create_etl_progress_table(db_connection)
+    create_switch_flow_stats_table(db_connection)
 
     os.chdir(current_dir)
 
@@ -64,94 +103,673 @@ def main(
             "--netdata", "-n",
             help="[WIP] Query a netdata instance for performance metrics"
         ),
+        netdata_host: str = typer.Option(
+            "192.168.64.6",
+            "--netdata-host",
+            help="Host of the netdata instance"
+        ),
+        netdata_port: int = typer.Option(
+            19999,
+            "--netdata-port",
+            help="Port of the netdata instance"
+        ),
+        netdata_tolerance: float = typer.Option(
+            0.5,
+            "--netdata-tolerance",
+            help="Maximum distance in seconds between a log entry and the netdata sample used for it"
+        ),
+        netdata_cache_directory: str = typer.Option(
+            r"../netdata_cache",
+            "--netdata-cache-directory",
+            help="The directory netdata metrics of past days are cached in (relative to this scripts location)"
+        ),
+        refresh_netdata_cache: bool = typer.Option(
+            False,
+            "--refresh-netdata-cache",
+            help="Fetch the netdata metrics of the processed days again, even if they are cached"
+        ),
+        netdata_concurrency: int = typer.Option(
+            4,
+            "--netdata-concurrency",
+            help="Maximum number of requests to the netdata instance in flight at the same time"
+        ),
         enrich_with_statistics: bool = typer.Option(
             True,
             "--enrich", "-e",
             help="Enrich training data with request and switch flow statistics, if available"
+        ),
+        all_switches: bool = typer.Option(
+            False,
+            "--all-switches",
+            help="Also store the flow statistics of every switch in the switch flow statistics per training data row, "
+                 "in the table training_data_switch_flow_stats, the training data rows have the first switch"
+        ),
+        batch_size: int = typer.Option(
+            50000,
+            "--batch-size", "-b",
+            help="Number of training data rows that are inserted and committed at once"
+        ),
+        workers: int = typer.Option(
+            1,
+            "--workers", "-w",
+            help="Number of processes that parse and enrich log files in parallel, "
+                 "the rows are written to the database by this process"
+        ),
+        parquet_directory: Optional[str] = typer.Option(
+            None,
+            "--parquet-directory", "-p",
+            help="Also write the training data to a Parquet dataset in this directory, "
+                 "partitioned by day and request type (needs pyarrow)"
+        ),
+        report: Optional[str] = typer.Option(
+            None,
+            "--report",
+            help="Write a json report of the run to this file: lines and bytes per second, "
+                 "time spent per phase, duration of every file and peak memory usage"
+        ),
+        profile: Optional[str] = typer.Option(
+            None,
+            "--profile",
+            help="Profile the run with cprofile or pyinstrument (needs pyinstrument)"
+        ),
+        profile_output: Optional[str] = typer.Option(
+            None,
+            "--profile-output",
+            help="The file the profile is written to, defaults to LogToDbETL.prof or LogToDbETL.html"
         )
 ):
-    if query_netdata:
-        from AcquirePerformanceMetricsFromNetdata import get_system_cpu_data, \
-            get_row_from_dataframe_using_nearest_time
+    if parquet_directory is not None and _TRAINING_DATA_COLUMN_TYPES is None:
+        print("The columns of the training data are not known, cannot write them to a Parquet dataset")
+        exit(1)
+
+    with instrument("LogToDbETL", report, profile, profile_output) as metrics:
+        options = EnrichmentOptions(
+            query_netdata,
+            netdata_tolerance,
+            enrich_with_statistics,
+            join(os.path.dirname(os.path.abspath(__file__)), netdata_cache_directory),
+            refresh_netdata_cache,
+            netdata_concurrency,
+            netdata_host,
+            netdata_port,
+            all_switches
+        )
 
-    db_connection = setup_db_using_sqlalchemy(output_directory)
-    db_connection = Session(db_connection)
+        db_connection = setup_db_using_sqlalchemy(output_directory)
+        db_connection = Session(db_connection)
 
-    loop = asyncio.get_event_loop()
+        loop = asyncio.get_event_loop()
 
-    logfiles = glob.glob(join(directory, '**', 'Conv_*.log'), recursive=True)
-    print("Logs to process: " + str(logfiles))
+        logfiles = glob_log_files(directory, 'Conv_*.log')
+        print("Logs to process: " + str(logfiles))
 
-    for log_file in sorted(logfiles):
-        if not training_data_exists_in_db_using_sqlalchemy(db_connection, log_file):
+        logfiles_to_process: dict[str, LogFileSegment] = dict()
+        for log_file in sorted(logfiles):
+            segment = get_segment_to_process(db_connection, log_file)
+            if segment is None:
+                print("Skipping ", log_file)
+                continue
 
-            print("Processing ", log_file)
+            logfiles_to_process[log_file] = segment
 
-            day_to_get_metrics_from = datetime.strptime(
-                get_date_from_string(log_file),
-                "%Y-%m-%d"
-            )
+        resource_usage = None
+        if options.query_netdata and len(logfiles_to_process) > 0:
+            with metrics.phase("netdata"):
+                resource_usage = get_resource_usage_for_log_files(logfiles_to_process, options, loop)
 
-            if query_netdata:
-                resource_usage = loop.run_until_complete(
-                    get_system_cpu_data(
-                        loop,
-                        day_to_get_metrics_from
+        if workers <= 1:
+            for log_file, segment in logfiles_to_process.items():
+                with metrics.file(log_file, size=segment.end_offset - segment.start_offset):
+                    training_data_rows = create_training_data_rows_for_log_file(
+                        log_file, segment, options,
+                        get_resource_usage_of_day(resource_usage, get_day_of_log_file(log_file))
                     )
-                )
-
-            tracker: Optional[NumberOfParallelCommandsTracker] = None
-            flow_stats: Optional[list[SwitchAggFlowStats]] = None
-            if enrich_with_statistics:
-                print("Enriching with additional files")
-                tracker = create_and_initialize_tracker(day_to_get_metrics_from, log_file)
-                flow_stats = create_and_initialize_switchflowstats(day_to_get_metrics_from, log_file)
-
-            training_data_rows: list[TrainingDataRow] = list()
-            counter = 0
-            for line in read_data_line_from_log_file(log_file):
-                training_data_row = TrainingDataRow.from_logfile_entry(line)
-
-                resource_usage_row = None
-                if query_netdata:
-                    # get resource usage from netdata
-                    resource_usage_row = get_row_from_dataframe_using_nearest_time(
-                        resource_usage,
-                        training_data_row.timestamp.timestamp()
+
+                    write_training_data_in_batches(
+                        db_connection, log_file, training_data_rows, batch_size, segment,
+                        create_parquet_writer(parquet_directory, log_file, segment)
                     )
-                if resource_usage_row is not None:
-                    if math.isnan(resource_usage_row["total"]):
-                        training_data_row.system_cpu_usage = 0
-                    else:
-                        training_data_row.system_cpu_usage = resource_usage_row["total"]
-                else:
-                    training_data_row.system_cpu_usage = 1
+        else:
+            write_training_data_from_workers(
+                db_connection, logfiles_to_process, options, batch_size, workers, resource_usage, parquet_directory
+            )
 
-                if tracker is not None:
-                    training_data_row.requests_per_second = tracker.get_requests_per_second_for(training_data_row.timestamp)
-                    training_data_row.requests_per_minute = tracker.get_requests_per_minute_for(training_data_row.timestamp)
+        db_connection.close()
 
-                if flow_stats is not None:
-                    flow_stats_for_switch = flow_stats[0]
-                    training_data_row.switch_id = flow_stats_for_switch.switch_id
-                    training_data_row.bytes_per_second_transmitted_through_switch = flow_stats_for_switch \
-                        .get_bytes_per_second_for(training_data_row.timestamp)
-                    training_data_row.packets_per_second_transmitted_through_switch = flow_stats_for_switch \
-                        .get_packets_per_second_for(training_data_row.timestamp)
 
-                training_data_rows.append(training_data_row)
+def etl_progress_key(log_file: str) -> str:
+    return str(Path(log_file).resolve())
 
-                counter = counter + 1
-                if counter % 10000 == 0:
-                    print("Processed {} entries".format(counter))
 
-            insert_training_data(db_connection, training_data_rows)
-            db_connection.commit()
-            print("Committed")
-        else:
-            print("Skipping ", log_file)
+def get_segment_to_process(db_connection: Session, log_file: str) -> Optional[LogFileSegment]:
+    """
+    Returns the part of a log file that has not been processed yet: the lines appended since the last run
+    or the rest of a file whose processing was interrupted. Returns None if there is nothing to process.
+    """
+    end_offset = get_end_of_complete_lines(log_file)
+
+    progress = get_etl_progress(db_connection, etl_progress_key(log_file))
+    if progress is None:
+        # files processed before the progress was tracked
+        if training_data_exists_in_db_using_sqlalchemy(db_connection, log_file):
+            return None
+
+        return LogFileSegment(0, end_offset)
+
+    # progress recorded before the entries were counted, every entry was one row then, unless --all-switches was used
+    entries_committed = progress.rows_committed if progress.entries_committed is None else progress.entries_committed
+    entries_at_byte_offset = progress.rows_at_byte_offset if progress.entries_at_byte_offset is None \
+        else progress.entries_at_byte_offset
+
+    # files processed before the byte offsets were tracked
+    if progress.fingerprint is None:
+        if progress.completed:
+            return None
+
+        return LogFileSegment(0, end_offset, progress.rows_committed, entries_committed=entries_committed)
+
+    if end_offset < progress.byte_offset \
+            or compute_fingerprint(etl_progress_key(log_file), progress.byte_offset) != progress.fingerprint:
+        print("{} was changed, not only appended to, since it was processed".format(log_file))
+        return None
+
+    if progress.completed and end_offset == progress.byte_offset:
+        return None
+
+    # compressed files are processed as a whole, they cannot be appended to
+    if progress.completed and is_compressed(log_file):
+        print("{} was changed since it was processed".format(log_file))
+        return None
+
+    if progress.completed:
+        print("Processing the {} bytes appended to {}".format(end_offset - progress.byte_offset, log_file))
+
+    return LogFileSegment(progress.byte_offset, end_offset, progress.rows_committed, progress.rows_at_byte_offset,
+                          entries_committed, entries_at_byte_offset)
+
+
+def get_day_of_log_file(log_file: str) -> datetime:
+    return datetime.strptime(
+        get_date_from_string(log_file),
+        "%Y-%m-%d"
+    )
+
+
+def get_resource_usage_for_log_files(
+        logfiles: Iterable[str],
+        options: EnrichmentOptions,
+        loop: asyncio.AbstractEventLoop
+) -> DataFrame:
+    """Fetches the system cpu usage of the days of all log files from netdata at once."""
+    from AcquirePerformanceMetricsFromNetdata import get_system_cpu_data_for_days, NetdataCache
+
+    days = {get_day_of_log_file(log_file) for log_file in logfiles}
+    print("Fetching netdata metrics of {} days".format(len(days)))
+
+    cache = None
+    if options.netdata_cache_directory is not None:
+        cache = NetdataCache(options.netdata_cache_directory)
+        if options.refresh_netdata_cache:
+            for day in days:
+                cache.invalidate(day)
+
+    try:
+        return loop.run_until_complete(
+            get_system_cpu_data_for_days(
+                loop,
+                days,
+                options.netdata_host,
+                options.netdata_port,
+                max_concurrent_requests=options.netdata_concurrency,
+                cache=cache
+            )
+        )
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def get_resource_usage_of_day(resource_usage: Optional[DataFrame], day: datetime) -> Optional[DataFrame]:
+    if resource_usage is None:
+        return None
+
+    start = int(day.timestamp())
+    end = int((day + timedelta(days=1)).timestamp())
+    # the samples right next to the day can be the nearest ones of its first and last entries
+    return resource_usage.loc[start - 1:end]
+
+
+def create_training_data_rows_for_log_file(
+        log_file: str,
+        segment: LogFileSegment,
+        options: EnrichmentOptions,
+        resource_usage: Optional[DataFrame] = None
+):
+    """
+    :param segment: The part of the log file to create the rows of
+    :param resource_usage: The system cpu usage of the day of the log file, if netdata is queried
+    """
+    entries_committed = segment.entries_committed_of_segment
+    if entries_committed > 0:
+        print("Resuming {} after {} committed entries".format(log_file, segment.entries_committed))
+    elif segment.start_offset > 0:
+        print("Processing {} from byte {}".format(log_file, segment.start_offset))
+    else:
+        print("Processing ", log_file)
+
+    day_to_get_metrics_from = get_day_of_log_file(log_file)
+
+    tracker: Optional[NumberOfParallelCommandsTracker] = None
+    flow_stats_index: Optional[SwitchFlowStatsIndex] = None
+    if options.enrich_with_statistics:
+        print("Enriching with additional files")
+        tracker = create_and_initialize_tracker(day_to_get_metrics_from, log_file)
+        flow_stats_index = create_switchflowstats_index(day_to_get_metrics_from, log_file, options.all_switches)
+
+    entries_and_offsets = islice(
+        read_data_lines_and_offsets(log_file, segment.start_offset, segment.end_offset), entries_committed, None
+    )
+    # the offsets of the entries that are enriched, but whose rows are not passed on yet
+    ends_of_entries = deque()
+
+    def read_entries():
+        for log_file_entry, end_of_entry in entries_and_offsets:
+            ends_of_entries.append(end_of_entry)
+            yield log_file_entry
+
+    training_data_rows = create_training_data_rows(
+        read_entries(),
+        resource_usage,
+        options.netdata_tolerance,
+        tracker,
+        flow_stats_index,
+        all_switches=options.all_switches
+    )
+
+    return _with_ends_of_entries(training_data_rows, ends_of_entries)
+
+
+def _with_ends_of_entries(training_data_rows, ends_of_entries: deque):
+    """Gives every row the byte offset right after its log file entry, there is one row per entry."""
+    for training_data_row in training_data_rows:
+        setattr(training_data_row, END_OF_ENTRY, ends_of_entries.popleft())
+        yield training_data_row
+
+
+def get_end_of_last_entry(batch: list[TrainingDataRow]) -> Optional[int]:
+    """Returns the byte offset right after the log file entry of the last row of a batch, if it is known."""
+    if len(batch) == 0:
+        return None
+
+    return getattr(batch[-1], END_OF_ENTRY, None)
+
+
+def create_training_data_rows(
+        log_file_entries,
+        resource_usage,
+        netdata_tolerance: float,
+        tracker: Optional[NumberOfParallelCommandsTracker],
+        flow_stats_index: Optional[SwitchFlowStatsIndex],
+        enrichment_batch_size: int = 10000,
+        count_lines: bool = True,
+        all_switches: bool = False
+):
+    """
+    Creates the training data rows of the log file entries, enriched in batches.
+    :param flow_stats_index: The switches to enrich the rows with, the rows have the flow statistics of the first one
+    :param count_lines: Count the entries as the processed lines of the stage metrics,
+    False if the lines the entries are created from are counted already
+    :param all_switches: Also give the rows the flow statistics of every switch of the index,
+    they are inserted into the switch flow statistics table together with the rows
+    """
+    log_file_entries = iter(log_file_entries)
+    metrics = get_stage_metrics()
+
+    while True:
+        with metrics.phase("parse"):
+            entries = list(islice(log_file_entries, enrichment_batch_size))
+            if len(entries) == 0:
+                break
+            batch = [TrainingDataRow.from_logfile_entry(line) for line in entries]
+
+        with metrics.phase("enrich"):
+            system_cpu_usage, bytes_per_second, packets_per_second = _get_enrichment_of_batch(
+                batch, resource_usage, netdata_tolerance, flow_stats_index
+            )
+
+        for i, (training_data_row, cpu_usage) in enumerate(zip(batch, system_cpu_usage)):
+            training_data_row.system_cpu_usage = cpu_usage
 
-    db_connection.close()
+            if tracker is not None:
+                training_data_row.requests_per_second = tracker.get_requests_per_second_for(training_data_row.timestamp)
+                training_data_row.requests_per_minute = tracker.get_requests_per_minute_for(training_data_row.timestamp)
+
+            if flow_stats_index is not None:
+                training_data_row.switch_id = flow_stats_index.switch_ids[0]
+                training_data_row.bytes_per_second_transmitted_through_switch = bytes_per_second[i][0]
+                training_data_row.packets_per_second_transmitted_through_switch = packets_per_second[i][0]
+
+                if all_switches:
+                    setattr(training_data_row, SWITCH_FLOW_STATS,
+                            list(zip(flow_stats_index.switch_ids, bytes_per_second[i], packets_per_second[i])))
+
+            yield training_data_row
+
+        if count_lines:
+            metrics.count_lines(len(batch))
+
+
+def _get_enrichment_of_batch(
+        batch: list[TrainingDataRow],
+        resource_usage,
+        netdata_tolerance: float,
+        flow_stats_index: Optional[SwitchFlowStatsIndex]
+) -> tuple[list, Optional[list], Optional[list]]:
+    """Returns the system cpu usage and the flow statistics of all switches of a batch of rows at once."""
+    if resource_usage is not None:
+        from AcquirePerformanceMetricsFromNetdata import join_dataframe_using_nearest_time
+
+        # get resource usage from netdata for the whole batch at once
+        resource_usage_rows = join_dataframe_using_nearest_time(
+            resource_usage,
+            [training_data_row.timestamp.timestamp() for training_data_row in batch],
+            netdata_tolerance
+        )
+        total = resource_usage_rows["total"].to_numpy()
+        system_cpu_usage = np.where(
+            resource_usage_rows["time"].isna().to_numpy(),
+            CPU_USAGE_WITHOUT_SAMPLE,
+            np.where(np.isnan(total), CPU_USAGE_WITHOUT_VALUE, total)
+        )
+    else:
+        system_cpu_usage = np.full(len(batch), CPU_USAGE_WITHOUT_SAMPLE)
+
+    bytes_per_second = None
+    packets_per_second = None
+    if flow_stats_index is not None:
+        # get the flow statistics of all switches for the whole batch at once
+        bytes_per_second, packets_per_second = flow_stats_index.get_rates_for(
+            [training_data_row.timestamp for training_data_row in batch]
+        )
+        bytes_per_second = bytes_per_second.tolist()
+        packets_per_second = packets_per_second.tolist()
+
+    return system_cpu_usage.tolist(), bytes_per_second, packets_per_second
+
+
+def _get_training_data_columns() -> Optional[list[tuple[str, str]]]:
+    """Returns the (attribute, column) names of TrainingDataRow, if it is mapped to a table."""
+    try:
+        mapper = inspect(TrainingDataRow)
+    except NoInspectionAvailable:
+        return None
+
+    return [
+        (column_property.key, column_property.columns[0].key)
+        for column_property in mapper.column_attrs
+        # leave the generation of the ids to the database
+        if not (column_property.columns[0].primary_key and column_property.columns[0].autoincrement)
+    ]
+
+
+_TRAINING_DATA_COLUMNS = _get_training_data_columns()
+
+
+def _get_training_data_column_types() -> Optional[dict[str, type]]:
+    """Returns the python types of the columns of TrainingDataRow, if it is mapped to a table."""
+    if _TRAINING_DATA_COLUMNS is None:
+        return None
+
+    column_types = dict()
+    for _, column in _TRAINING_DATA_COLUMNS:
+        try:
+            column_types[column] = TrainingDataRow.__table__.columns[column].type.python_type
+        except NotImplementedError:
+            column_types[column] = str
+
+    return column_types
+
+
+_TRAINING_DATA_COLUMN_TYPES = _get_training_data_column_types()
+
+
+def to_training_data_values(batch: list[TrainingDataRow]) -> list:
+    """
+    Converts training data rows to plain column values, which are cheap to send between processes
+    and can be inserted with a single executemany. Returns the rows unchanged if that is not possible.
+    """
+    if _TRAINING_DATA_COLUMNS is None:
+        return batch
+
+    values = [
+        {column: getattr(training_data_row, attribute) for attribute, column in _TRAINING_DATA_COLUMNS}
+        for training_data_row in batch
+    ]
+
+    for values_of_row, training_data_row in zip(values, batch):
+        if hasattr(training_data_row, SWITCH_FLOW_STATS):
+            values_of_row[SWITCH_FLOW_STATS] = getattr(training_data_row, SWITCH_FLOW_STATS)
+
+    return values
+
+
+def insert_training_data_batch(db_connection: Session, batch: list):
+    """
+    Inserts training data rows (or their values) and the flow statistics of all switches they have.
+    The flow statistics are removed from the values.
+    """
+    if len(batch) == 0:
+        return
+
+    if isinstance(batch[0], dict):
+        flow_stats_of_rows = [values.pop(SWITCH_FLOW_STATS, None) for values in batch]
+        if flow_stats_of_rows[0] is None:
+            db_connection.execute(insert(TrainingDataRow.__table__), batch)
+            return
+
+        id_column = TrainingDataRow.__table__.primary_key.columns[0]
+        training_data_ids = db_connection.execute(
+            insert(TrainingDataRow.__table__).returning(id_column, sort_by_parameter_order=True), batch
+        ).scalars().all()
+    else:
+        insert_training_data(db_connection, batch)
+
+        flow_stats_of_rows = [getattr(training_data_row, SWITCH_FLOW_STATS, None) for training_data_row in batch]
+        if flow_stats_of_rows[0] is None:
+            return
+
+        # the ids are generated by the database
+        db_connection.flush()
+        training_data_ids = [training_data_row.id for training_data_row in batch]
+
+    insert_switch_flow_stats(db_connection, training_data_ids, flow_stats_of_rows)
+
+
+def create_parquet_writer(
+        parquet_directory: Optional[str],
+        log_file: str,
+        segment: LogFileSegment
+) -> Optional[ParquetDatasetWriter]:
+    """Creates the writer of the training data of a log file to the Parquet dataset, if one is written."""
+    if parquet_directory is None:
+        return None
+
+    parquet_writer = ParquetDatasetWriter(parquet_directory, _TRAINING_DATA_COLUMN_TYPES, log_file)
+    if segment.rows_committed == 0:
+        # the rows of an earlier run whose progress is gone are replaced
+        parquet_writer.remove_files()
+
+    return parquet_writer
+
+
+def commit_training_data(
+        db_connection: Session,
+        log_file: str,
+        segment: LogFileSegment,
+        batch: list,
+        completed: bool,
+        parquet_writer: Optional[ParquetDatasetWriter] = None,
+        end_of_last_entry: Optional[int] = None
+):
+    """
+    Inserts a batch of training data rows (or their values) of a log file and commits it
+    together with the progress of the log file, so that an interrupted run can be resumed.
+    :param parquet_writer: Also write the batch to the Parquet dataset, before it is committed.
+    The files of a batch are named after the rows committed before it, a resumed run replaces them.
+    :param end_of_last_entry: The byte offset right after the log file entry of the last row, if it is known
+    """
+    with get_stage_metrics().phase("write"):
+        if parquet_writer is not None:
+            parquet_writer.write(batch, segment.rows_committed)
+
+        insert_training_data_batch(db_connection, batch)
+        segment.rows_committed += len(batch)
+        # every entry is one row
+        segment.entries_committed += len(batch)
+        if end_of_last_entry is not None:
+            segment.entry_offset = end_of_last_entry
+        save_etl_progress_of_segment(db_connection, etl_progress_key(log_file), segment, completed)
+        db_connection.commit()
+
+    if completed:
+        print("Committed", log_file)
+    else:
+        print("Committed {} rows of {}".format(segment.rows_committed, log_file))
+
+
+def write_training_data_in_batches(
+        db_connection: Session,
+        log_file: str,
+        training_data_rows,
+        batch_size: int,
+        segment: LogFileSegment,
+        parquet_writer: Optional[ParquetDatasetWriter] = None
+):
+    """
+    Inserts the training data rows of a log file in batches and commits every batch.
+    :param db_connection: The session to write to
+    :param log_file: The log file the rows were created from
+    :param training_data_rows: The rows to insert
+    :param batch_size: Number of rows per batch
+    :param segment: The part of the log file the rows were created from
+    :param parquet_writer: Also write the rows to a Parquet dataset
+    """
+    batch: list[TrainingDataRow] = list()
+    for training_data_row in training_data_rows:
+        batch.append(training_data_row)
+
+        if len(batch) >= batch_size:
+            commit_training_data(db_connection, log_file, segment, to_training_data_values(batch), False,
+                                 parquet_writer, get_end_of_last_entry(batch))
+            batch = list()
+
+    commit_training_data(db_connection, log_file, segment, to_training_data_values(batch), True, parquet_writer)
+
+
+def _create_training_data_in_worker(
+        log_file: str,
+        segment: LogFileSegment,
+        options: EnrichmentOptions,
+        batch_size: int,
+        queue,
+        stop,
+        resource_usage: Optional[DataFrame]
+):
+    """
+    Creates the training data rows of a log file and sends them to the writer in batches.
+    :param stop: An event the writer sets when it failed, the worker stops sending batches then
+    """
+    with get_stage_metrics().file(log_file, size=segment.end_offset - segment.start_offset):
+        training_data_rows = create_training_data_rows_for_log_file(
+            log_file, segment, options, resource_usage
+        )
+
+        while True:
+            batch = list(islice(training_data_rows, batch_size))
+            if len(batch) == 0:
+                break
+            if stop.is_set():
+                return
+            queue.put((log_file, to_training_data_values(batch), get_end_of_last_entry(batch)))
+
+    # the log file is done
+    queue.put((log_file, None, None))
+
+
+def _drain_queue_until_done(queue, futures: list):
+    """Discards the batches the workers send until all of them finished, failed or were cancelled."""
+    while not all(future.done() for future in futures):
+        try:
+            queue.get(timeout=0.1)
+        except Empty:
+            pass
+
+
+def write_training_data_from_workers(
+        db_connection: Session,
+        logfiles_to_process: dict[str, LogFileSegment],
+        options: EnrichmentOptions,
+        batch_size: int,
+        workers: int,
+        resource_usage: Optional[DataFrame] = None,
+        parquet_directory: Optional[str] = None
+):
+    """
+    Parses and enriches the log files in a pool of worker processes.
+    The workers send their rows in batches to this process, which is the only one writing to the database.
+    :param logfiles_to_process: The log files to process and the part of each to process
+    :param resource_usage: The system cpu usage of the days of the log files, if netdata is queried
+    :param parquet_directory: Also write the rows to a Parquet dataset in this directory
+    """
+    parquet_writers = {
+        log_file: create_parquet_writer(parquet_directory, log_file, segment)
+        for log_file, segment in logfiles_to_process.items()
+    }
+
+    with Manager() as manager, ProcessPoolExecutor(max_workers=workers) as executor:
+        # bounded, so that the workers wait for the writer instead of piling up rows in memory
+        queue = manager.Queue(maxsize=2 * workers)
+        stop = manager.Event()
+
+        futures = [
+            executor.submit(
+                run_with_stage_metrics, _create_training_data_in_worker,
+                log_file, segment, options, batch_size, queue, stop,
+                get_resource_usage_of_day(resource_usage, get_day_of_log_file(log_file))
+            )
+            for log_file, segment in logfiles_to_process.items()
+        ]
+
+        unfinished_logfiles = set(logfiles_to_process)
+        try:
+            while len(unfinished_logfiles) > 0:
+                try:
+                    log_file, batch, end_of_last_entry = queue.get(timeout=1)
+                except Empty:
+                    for future in futures:
+                        if future.done() and future.exception() is not None:
+                            raise future.exception()
+                    continue
+
+                if batch is None:
+                    commit_training_data(db_connection, log_file, logfiles_to_process[log_file], [], True,
+                                         parquet_writers[log_file])
+                    unfinished_logfiles.remove(log_file)
+                else:
+                    commit_training_data(db_connection, log_file, logfiles_to_process[log_file], batch, False,
+                                         parquet_writers[log_file], end_of_last_entry)
+        except BaseException:
+            # leaving the executor waits for the workers, which may be blocked on the full queue
+            print("Stopping the workers")
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            _drain_queue_until_done(queue, futures)
+            raise
+
+        # the workers parsed and enriched the rows
+        for future in futures:
+            _, metrics_of_log_file = future.result()
+            get_stage_metrics().merge(metrics_of_log_file)
 
 
 def create_and_initialize_tracker(day_to_get_metrics_from, log_file):
@@ -159,17 +777,18 @@ def create_and_initialize_tracker(day_to_get_metrics_from, log_file):
         .with_name("request_statistics_{}".format(day_to_get_metrics_from.date())) \
         .with_suffix(".json")
 
+    # the binary sidecar is written next to the json file by RequestLogToCLF,
+    # it is outdated if the json file was written again without it, e.g. by an older RequestLogToCLF
+    sidecar_path = target_path.with_suffix(".npy")
+    if sidecar_path.exists() and \
+            (not target_path.exists() or path.getmtime(target_path) <= path.getmtime(sidecar_path)):
+        return NumberOfParallelCommandsTracker.from_npy(sidecar_path)
+
     if not target_path.exists():
         return None
 
     with open(target_path, "r") as f:
-        request_statistics = json.load(f)
-        tracker = NumberOfParallelCommandsTracker()
-        tracker.requests_per_second = {time.fromisoformat(key): value for key, value in
-                                       request_statistics['requests_per_second'].items()}
-        tracker.requests_per_minute = {time.fromisoformat(key): value for key, value in
-                                       request_statistics['requests_per_minute'].items()}
-    return tracker
+        return NumberOfParallelCommandsTracker.from_json(f)
 
 
 def create_and_initialize_switchflowstats(day_to_get_metrics_from, log_file) -> Optional[list[SwitchAggFlowStats]]:
@@ -186,5 +805,14 @@ def create_and_initialize_switchflowstats(day_to_get_metrics_from, log_file) ->
         return all_flow_stats
 
 
+def create_switchflowstats_index(day_to_get_metrics_from, log_file, all_switches: bool) \
+        -> Optional[SwitchFlowStatsIndex]:
+    flow_stats = create_and_initialize_switchflowstats(day_to_get_metrics_from, log_file)
+    if flow_stats is None or len(flow_stats) == 0:
+        return None
+
+    return SwitchFlowStatsIndex(flow_stats if all_switches else flow_stats[:1])
+
+
 if __name__ == "__main__":
     typer.run(main)
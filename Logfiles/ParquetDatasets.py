@@ -0,0 +1,139 @@
+import os
+from datetime import datetime
+from glob import glob
+from hashlib import md5
+from os.path import join
+from pathlib import Path
+from typing import Optional
+
+from CompressedLogFiles import strip_compression_suffix
+
+# The datasets are partitioned hive style, e.g. day=2021-03-04/request_type=ID_REQ_A/,
+# so that readers only read the files of the days and request types they filter for.
+# pyarrow is only needed if a dataset is written or read.
+PARTITION_COLUMNS = ("day", "request_type")
+
+# the columns of the converted request log entries, named like the columns of the training data
+CONVERTED_ENTRY_COLUMNS = {
+    "timestamp": datetime,
+    "number_of_parallel_requests_start": int,
+    "number_of_parallel_requests_end": int,
+    "number_of_parallel_requests_finished": int,
+    "request_type": str,
+    "response_time": int,
+}
+
+
+def _to_arrow_type(python_type: type):
+    import pyarrow as pa
+
+    if python_type is datetime:
+        return pa.timestamp("us")
+    if python_type is bool:
+        return pa.bool_()
+    if python_type is int:
+        return pa.int64()
+    if python_type is float:
+        return pa.float64()
+    return pa.string()
+
+
+def get_dataset_file_name(source_path: str) -> str:
+    """
+    Returns the name of the files written for the rows of a source file.
+    Contains a hash of the path, so that the sources of the same day in different directories do not collide.
+    """
+    path_hash = md5(str(Path(source_path).resolve()).encode()).hexdigest()[:8]
+    return "{}-{}".format(Path(strip_compression_suffix(str(source_path))).stem, path_hash)
+
+
+def open_dataset(directory: str):
+    """
+    Opens a dataset written by ParquetDatasetWriter with typed partition columns.
+    Filters on day and request_type skip whole directories, e.g.
+    open_dataset(d).to_table(columns=["response_time"], filter=pyarrow.dataset.field("day") == date(2021, 3, 4)).
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    partitioning = ds.partitioning(
+        pa.schema([("day", pa.date32()), ("request_type", pa.string())]),
+        flavor="hive"
+    )
+    return ds.dataset(directory, format="parquet", partitioning=partitioning)
+
+
+class ParquetDatasetWriter:
+    """
+    Writes the rows of one source file to a Parquet dataset partitioned by day and request type.
+    Every batch of rows is written as complete files, one per partition, named after the source
+    and the number of rows of the source written before the batch.
+    Writing the same batch of a source again, e.g. after an interrupted run, replaces its files.
+    """
+
+    def __init__(self,
+                 directory: str,
+                 columns: dict[str, type],
+                 source_path: str,
+                 timestamp_column: str = "timestamp",
+                 batch_size: int = 200000):
+        """
+        :param directory: The root directory of the dataset
+        :param columns: The names and python types of the columns of the rows
+        :param source_path: The file the rows are created from
+        :param timestamp_column: The column the day of a row is taken from
+        :param batch_size: Number of rows added with add that are written at once
+        """
+        import pyarrow as pa
+
+        self.directory = directory
+        self.schema = pa.schema([(name, _to_arrow_type(python_type)) for name, python_type in columns.items()])
+        self.timestamp_column = timestamp_column
+        self.batch_size = batch_size
+        self.name = get_dataset_file_name(source_path)
+
+        self._rows: list[dict] = []
+        self._rows_written = 0
+
+    def remove_files(self):
+        """Removes the files written for the source before, so that they are not read twice."""
+        for path in glob(join(self.directory, "**", self.name + "-*.parquet"), recursive=True):
+            os.remove(path)
+
+    def write(self, rows: list[dict], rows_written_before: Optional[int] = None):
+        """
+        :param rows: The rows as dicts of column values, values of other columns are ignored
+        :param rows_written_before: The number of rows of the source written before, names the files
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        if rows_written_before is None:
+            rows_written_before = self._rows_written
+
+        if len(rows) > 0:
+            table = pa.Table.from_pylist(rows, schema=self.schema)
+            table = table.append_column("day", pc.cast(table[self.timestamp_column], pa.date32()))
+
+            pq.write_to_dataset(
+                table,
+                self.directory,
+                partition_cols=list(PARTITION_COLUMNS),
+                basename_template="{}-{}-{{i}}.parquet".format(self.name, rows_written_before),
+                existing_data_behavior="overwrite_or_ignore"
+            )
+
+        self._rows_written = rows_written_before + len(rows)
+
+    def add(self, row: dict):
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.write(self._rows)
+        self._rows = []
+
+    def close(self):
+        self.flush()
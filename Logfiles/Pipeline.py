@@ -0,0 +1,413 @@
+import argparse
+import asyncio
+import os
+from collections import deque
+from contextlib import ExitStack
+from datetime import datetime
+from itertools import groupby, islice, chain
+from os.path import join, getsize, exists
+from pathlib import Path
+from typing import Iterator, Optional, TextIO, Iterable
+
+from rast_common.main.StringUtils import dir_path
+from rast_common.main.StringUtils import get_date_from_string
+from rast_common.main.TrainingDatabase import training_data_exists_in_db_using_sqlalchemy
+from sqlalchemy.orm import Session
+
+from ARSLogConverter import merge_line_pairs
+from Common import LogFileEntry
+from CompressedLogFiles import open_log_file, glob_log_files
+from EtlProgress import get_etl_progress, save_etl_progress, save_etl_progress_of_segment, LogFileSegment
+from LogMerger import LogMerger, UnsortedLogFileError
+from LogToDbETL import EnrichmentOptions, setup_db_using_sqlalchemy, etl_progress_key, get_day_of_log_file, \
+    get_resource_usage_for_log_files, get_resource_usage_of_day, create_training_data_rows, \
+    create_switchflowstats_index, to_training_data_values, insert_training_data_batch, get_segment_to_process, \
+    create_training_data_rows_for_log_file, write_training_data_in_batches
+from RequestLogToCLF import RequestLogConverter, write_to_target_log
+from StageMetrics import get_stage_metrics, add_instrumentation_arguments, instrument
+from TimestampParser import get_timestamp_from_string
+from WSLogFixer import read_lines, fix_lines
+
+
+# Runs WSLogFixer/ARSLogConverter, LogMerger, RequestLogToCLF and LogToDbETL for one day after another
+# in one process. The stages are chained as generators, so the lines of a day are read and parsed once
+# and the intermediate files are only written on request.
+
+
+def get_fixed_path(path: str) -> Optional[str]:
+    """Returns the path WSLogFixer or ARSLogConverter write the fixed log file to, None if there is nothing to fix."""
+    name = Path(path).name
+
+    if "Worker-cmd" in name:
+        return path.replace("Worker-cmd", "WSCmd_f")
+    if "WSCmd" in name and "WSCmd_f" not in name:
+        return path.replace("WSCmd", "WSCmd_f")
+    if "koppelcmd" in name:
+        return path.replace("koppelcmd", "ARS")
+
+    return None
+
+
+def find_logfiles_by_day(directory: str) -> list[tuple[str, list[str]]]:
+    """Groups the log files in the directory by the date in their file name, like LogMerger does."""
+    logfiles = glob_log_files(directory, '*.log')
+
+    # omit the outputs of the later stages and the fixed versions of the log files that are fixed on the fly
+    fixed_paths = {get_fixed_path(logfile) for logfile in logfiles}
+    logfiles = [
+        logfile for logfile in logfiles
+        if not Path(logfile).name.startswith(("Merged_", "Conv_")) and logfile not in fixed_paths
+    ]
+
+    data = sorted(logfiles, key=get_date_from_string)
+    return [(group, list(logfiles_of_day)) for group, logfiles_of_day in groupby(data, key=get_date_from_string)]
+
+
+def read_logfile(path: str, write_fixed: bool = False) -> Iterator[str]:
+    """
+    Yields the lines of a log file, fixed like WSLogFixer or ARSLogConverter would fix them.
+    :param write_fixed: Also write the fixed lines to the file the fixer would write them to
+    """
+    fixed_path = get_fixed_path(path)
+
+    print("Reading ", path)
+    with ExitStack() as stack:
+        if "koppelcmd" in Path(path).name:
+            lines = merge_line_pairs(stack.enter_context(open_log_file(path)))
+        elif fixed_path is not None:
+            lines = fix_lines(read_lines(path))
+        else:
+            lines = stack.enter_context(open_log_file(path))
+
+        if not write_fixed or fixed_path is None:
+            yield from lines
+            return
+
+        fixed_file = stack.enter_context(open_log_file(fixed_path, mode="w"))
+        for line in lines:
+            fixed_file.write(line)
+            yield line
+
+
+def merge_logfiles(paths: list[str], write_fixed: bool = False) -> Iterator[tuple[datetime, str]]:
+    """
+    Merges log files that are each ordered by time, see LogMerger.merge_sorted_files.
+    :raises UnsortedLogFileError: as soon as a line of a log file is older than its predecessor
+    """
+    return LogMerger.merge_sorted_streams(
+        *(LogMerger.read_sorted_lines(read_logfile(path, write_fixed), path) for path in paths)
+    )
+
+
+def sort_logfiles(paths: list[str],
+                  write_fixed: bool = False,
+                  memory_budget: Optional[int] = None,
+                  temp_directory: Optional[str] = None) -> Iterator[tuple[datetime, str]]:
+    """Merges log files that are not ordered by time, see LogMerger.aggregate."""
+    lines = chain.from_iterable(read_logfile(path, write_fixed) for path in paths)
+
+    if memory_budget is not None:
+        for line in LogMerger.external_sort(lines, memory_budget, temp_directory):
+            yield get_timestamp_from_string(line), line
+        return
+
+    timestamped_lines = [(get_timestamp_from_string(line), line) for line in lines]
+    timestamped_lines.sort(key=lambda entry: entry[0])
+    yield from timestamped_lines
+
+
+def write_lines_through(timestamped_lines: Iterable[tuple[datetime, str]], target_path: str):
+    """Writes the lines to the target file while passing them on."""
+    print("Writing to ", target_path)
+    with open(target_path, mode="w") as target_file:
+        for timestamp, line in timestamped_lines:
+            target_file.write(line)
+            yield timestamp, line
+
+
+class StreamingRequestLogConverter(RequestLogConverter):
+    """
+    Converts the merged request log to log file entries, instead of lines of a Conv_*.log file.
+    An entry is passed on once the minute it ended in is over, because only then the request statistics
+    of its second and its minute are complete.
+    """
+
+    def __init__(self, args, conv_file: Optional[TextIO] = None):
+        """:param conv_file: Also write the converted lines to this file"""
+        super().__init__(args)
+        self._conv_file = conv_file
+        self._converted_entries: deque[LogFileEntry] = deque()
+
+    def write_converted_entry(self, data: dict, target_file: TextIO):
+        if self._conv_file is not None:
+            write_to_target_log(data, self._conv_file)
+
+        self._converted_entries.append(LogFileEntry(
+            data["receivedAt"],
+            data["parallelRequestsStart"],
+            data["parallelRequestsEnd"],
+            data["parallelCommandsFinished"],
+            data["cmd"],
+            data["time"]
+        ))
+
+    def convert(self, timestamped_lines: Iterable[tuple[datetime, str]], name: str) -> Iterator[LogFileEntry]:
+        """
+        :param timestamped_lines: The lines of the merged request log and their timestamps, ordered by time
+        :param name: The name of the request log, for error messages
+        """
+        metrics = get_stage_metrics()
+
+        counter = 0
+        for timestamp, line in timestamped_lines:
+            counter = counter + 1
+            if counter % 20000 == 0:
+                metrics.count_lines(20000)
+
+            self.process_line(line, self._conv_file, name, timestamp)
+
+            start_of_minute = timestamp.replace(second=0, microsecond=0)
+            while len(self._converted_entries) > 0 and self._converted_entries[0].time_stamp < start_of_minute:
+                yield self._converted_entries.popleft()
+
+        metrics.count_lines(counter % 20000)
+
+        yield from self._converted_entries
+        self._converted_entries.clear()
+
+        if len(self.started_commands) > 0:
+            print("{} commands remaining".format(len(self.started_commands)))
+
+
+def process_day(db_connection: Session,
+                day: str,
+                logfiles: list[str],
+                args,
+                options: EnrichmentOptions,
+                resource_usage=None):
+    """
+    Runs all stages for the log files of one day and commits the training data of the day at once.
+    The log files are expected to be ordered by time. If one is not, the rows written so far are rolled back
+    and the day is processed again with sorting.
+    A day that LogToDbETL processed before is continued from its Conv_*.log file, like LogToDbETL would,
+    so that no row is inserted twice.
+    """
+    directory = Path(logfiles[0]).parent
+    conv_path = str(directory / "Conv_{}.log".format(day))
+
+    progress = get_etl_progress(db_connection, etl_progress_key(conv_path))
+    if progress is None:
+        # days processed before the progress was tracked
+        if training_data_exists_in_db_using_sqlalchemy(db_connection, conv_path):
+            print("Skipping {}, training data of it was created before the progress was tracked".format(day))
+            return
+    elif exists(conv_path):
+        _continue_day_from_conv_file(db_connection, day, conv_path, args, options, resource_usage)
+        return
+    elif progress.completed:
+        print("Skipping ", day)
+        return
+    elif progress.rows_committed > 0:
+        print("Skipping {}, {} rows of {} were committed, but the file is gone. "
+              "Convert the day again with RequestLogToCLF and continue it with LogToDbETL"
+              .format(day, progress.rows_committed, conv_path))
+        return
+
+    print("Processing %s" % logfiles)
+    with get_stage_metrics().file(conv_path, size=sum(getsize(logfile) for logfile in logfiles)):
+        try:
+            rows_committed = _write_training_data_of_day(db_connection, day, logfiles, args, options,
+                                                         resource_usage, streaming=True)
+        except UnsortedLogFileError as e:
+            db_connection.rollback()
+            print(e)
+            print("Falling back to sorting")
+            rows_committed = _write_training_data_of_day(db_connection, day, logfiles, args, options,
+                                                         resource_usage, streaming=False)
+
+    # every entry is one row
+    if args.write_converted:
+        segment = LogFileSegment(0, getsize(conv_path), rows_committed, entries_committed=rows_committed)
+        save_etl_progress_of_segment(db_connection, etl_progress_key(conv_path), segment, True)
+    else:
+        save_etl_progress(db_connection, etl_progress_key(conv_path), rows_committed, True,
+                          entries_committed=rows_committed)
+    db_connection.commit()
+
+    print("Committed {} rows of {}".format(rows_committed, day))
+
+
+def _continue_day_from_conv_file(db_connection: Session,
+                                 day: str,
+                                 conv_path: str,
+                                 args,
+                                 options: EnrichmentOptions,
+                                 resource_usage):
+    """Processes the part of the Conv_*.log file of a day that LogToDbETL has not processed yet."""
+    segment = get_segment_to_process(db_connection, conv_path)
+    if segment is None:
+        print("Skipping ", day)
+        return
+
+    print("Continuing {} from byte {} of {}".format(day, segment.start_offset, conv_path))
+    with get_stage_metrics().file(conv_path, size=segment.end_offset - segment.start_offset):
+        training_data_rows = create_training_data_rows_for_log_file(conv_path, segment, options, resource_usage)
+        write_training_data_in_batches(db_connection, conv_path, training_data_rows, args.batch_size, segment)
+
+
+def _write_training_data_of_day(db_connection: Session,
+                                day: str,
+                                logfiles: list[str],
+                                args,
+                                options: EnrichmentOptions,
+                                resource_usage,
+                                streaming: bool) -> int:
+    directory = Path(logfiles[0]).parent
+    conv_path = str(directory / "Conv_{}.log".format(day))
+
+    if streaming:
+        timestamped_lines = merge_logfiles(logfiles, args.write_fixed)
+    else:
+        timestamped_lines = sort_logfiles(logfiles, args.write_fixed, args.memory_budget, args.temp_directory)
+
+    if args.write_merged:
+        timestamped_lines = write_lines_through(timestamped_lines, str(directory / "Merged_{}.log".format(day)))
+
+    metrics = get_stage_metrics()
+
+    rows_written = 0
+    with ExitStack() as stack:
+        conv_file = stack.enter_context(open(conv_path, mode="w")) if args.write_converted else None
+
+        converter = StreamingRequestLogConverter(args, conv_file)
+
+        training_data_rows = create_training_data_rows(
+            converter.convert(timestamped_lines, day),
+            resource_usage,
+            options.netdata_tolerance,
+            converter.parallel_commands_tracker if options.enrich_with_statistics else None,
+            create_switchflowstats_index(get_day_of_log_file(conv_path), conv_path, options.all_switches)
+                if options.enrich_with_statistics else None,
+            # the lines of the log files are counted by the converter
+            count_lines=False,
+            all_switches=options.all_switches
+        )
+
+        while True:
+            batch = list(islice(training_data_rows, args.batch_size))
+            if len(batch) == 0:
+                break
+
+            with metrics.phase("write"):
+                insert_training_data_batch(db_connection, to_training_data_values(batch))
+            rows_written += len(batch)
+
+    if args.write_converted:
+        converter.write_statistics(directory / "request_statistics_{}.json".format(day))
+
+    return rows_written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Converts raw WS and ARS log files to training data in one go, '
+                                                 'without writing the intermediate log files.')
+    parser.add_argument('--directory', '-d',
+                        type=dir_path,
+                        help='the directory the log files are located in')
+    parser.add_argument('--output-directory', '-o',
+                        type=str,
+                        default=r"../db",
+                        help='the directory the database should be saved at (relative to this scripts location)')
+    parser.add_argument('--force',
+                        action='store_true',
+                        help='ignore errors in the log files')
+    parser.add_argument('--write-fixed',
+                        action='store_true',
+                        help='write the fixed log files, like WSLogFixer and ARSLogConverter')
+    parser.add_argument('--write-merged',
+                        action='store_true',
+                        help='write the merged log files, like LogMerger')
+    parser.add_argument('--write-converted',
+                        action='store_true',
+                        help='write the converted log files and request statistics, like RequestLogToCLF')
+    parser.add_argument('--memory-budget', '-m',
+                        type=int,
+                        help='sort unordered log files with an external sort that uses about this many megabytes '
+                             'of memory')
+    parser.add_argument('--temp-directory', '-t',
+                        type=dir_path,
+                        help='the directory the external sort writes its temporary files to')
+    parser.add_argument('--batch-size', '-b',
+                        type=int,
+                        default=50000,
+                        help='number of training data rows that are inserted at once')
+    parser.add_argument('--netdata', '-n',
+                        action='store_true',
+                        help='query a netdata instance for performance metrics')
+    parser.add_argument('--netdata-host',
+                        type=str,
+                        default=EnrichmentOptions.netdata_host,
+                        help='host of the netdata instance')
+    parser.add_argument('--netdata-port',
+                        type=int,
+                        default=EnrichmentOptions.netdata_port,
+                        help='port of the netdata instance')
+    parser.add_argument('--netdata-tolerance',
+                        type=float,
+                        default=EnrichmentOptions.netdata_tolerance,
+                        help='maximum distance in seconds between a log entry and the netdata sample used for it')
+    parser.add_argument('--netdata-cache-directory',
+                        type=str,
+                        default=r"../netdata_cache",
+                        help='the directory netdata metrics of past days are cached in '
+                             '(relative to this scripts location)')
+    parser.add_argument('--all-switches',
+                        action='store_true',
+                        help='also store the flow statistics of every switch in the switch flow statistics '
+                             'per training data row')
+    parser.add_argument('--no-enrich',
+                        action='store_true',
+                        help='do not enrich the training data with request and switch flow statistics')
+    add_instrumentation_arguments(parser)
+
+    args = parser.parse_args()
+
+    if args.directory is None:
+        parser.print_help()
+        exit(1)
+
+    if args.memory_budget is not None:
+        args.memory_budget = args.memory_budget * 1024 * 1024
+
+    options = EnrichmentOptions(
+        query_netdata=args.netdata,
+        netdata_tolerance=args.netdata_tolerance,
+        netdata_cache_directory=join(os.path.dirname(os.path.abspath(__file__)), args.netdata_cache_directory),
+        netdata_host=args.netdata_host,
+        netdata_port=args.netdata_port,
+        enrich_with_statistics=not args.no_enrich,
+        all_switches=args.all_switches
+    )
+
+    with instrument("Pipeline", args.report, args.profile, args.profile_output) as metrics:
+        db_connection = Session(setup_db_using_sqlalchemy(args.output_directory))
+
+        days = find_logfiles_by_day(args.directory)
+        print("Days to process: " + str([day for day, _ in days]))
+
+        resource_usage = None
+        if options.query_netdata and len(days) > 0:
+            with metrics.phase("netdata"):
+                resource_usage = get_resource_usage_for_log_files(
+                    ["Conv_{}.log".format(day) for day, _ in days], options, asyncio.get_event_loop()
+                )
+
+        for day, logfiles in days:
+            process_day(db_connection, day, logfiles, args, options,
+                        get_resource_usage_of_day(resource_usage, datetime.strptime(day, "%Y-%m-%d")))
+
+        db_connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,24 @@
 import argparse
-import glob
+import io
 import json
+import locale
+import os
 import re
-from datetime import datetime, time
-from os.path import join
-from typing import Tuple, TextIO
-
-from rast_common.main.StringUtils import dir_path, get_timestamp_from_line
+from datetime import datetime, time, date
+from itertools import islice
+from pathlib import Path
+from time import monotonic, sleep
+from typing import Tuple, TextIO, Iterator, Optional, Callable, BinaryIO
+
+import numpy as np
+from rast_common.main.StringUtils import dir_path
 from rast_common.main.StringUtils import get_date_from_string
 
+from CompressedLogFiles import open_log_file, glob_log_files, is_compressed, COMPRESSION_SUFFIXES
+from ParquetDatasets import ParquetDatasetWriter, CONVERTED_ENTRY_COLUMNS
+from StageMetrics import get_stage_metrics, add_instrumentation_arguments, instrument
+from TimestampParser import get_timestamp_from_line
+
 
 def get_threadid_from_line_optimized(line: str) -> int:
     # Find the positions of the first '[' and the next ']'
@@ -25,12 +35,13 @@ def get_threadid_from_line_optimized(line: str) -> int:
     return 0
 
 
-def get_threadid_and_timestamp(line: str) -> Tuple[int, datetime]:
+def get_threadid_and_timestamp(line: str, timestamp: Optional[datetime] = None) -> Tuple[int, datetime]:
     # format: [tid] yyyy-MM-dd hh-mm-ss.f
 
     tid = get_threadid_from_line_optimized(line)
 
-    timestamp = get_timestamp_from_line(line)
+    if timestamp is None:
+        timestamp = get_timestamp_from_line(line)
 
     return tid, timestamp
 
@@ -47,132 +58,255 @@ def write_to_target_log(data, target_file):
     target_file.write(f"{firstPart} {secondPart} {thirdPart}\n")
 
 
+def to_converted_entry_row(data) -> dict:
+    """Converts the data of a converted entry to a row with the CONVERTED_ENTRY_COLUMNS."""
+    return {
+        "timestamp": data['receivedAt'],
+        "number_of_parallel_requests_start": data['parallelRequestsStart'],
+        "number_of_parallel_requests_end": data['parallelRequestsEnd'],
+        "number_of_parallel_requests_finished": data['parallelCommandsFinished'],
+        "request_type": data['cmd'],
+        "response_time": data['time'],
+    }
+
+
+SECONDS_PER_DAY = 24 * 60 * 60
+MINUTES_PER_DAY = 24 * 60
+
+
+def second_of_day(timestamp: datetime) -> int:
+    return timestamp.hour * 3600 + timestamp.minute * 60 + timestamp.second
+
+
 class NumberOfParallelCommandsTrackerEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, NumberOfParallelCommandsTracker):
+            # in the order the seconds and minutes were first seen, like the dicts the counts used to be stored in
             return {
-                "requests_per_second": {str(k): v for k, v in obj.requests_per_second.items()},
-                "requests_per_minute": {str(k): v for k, v in obj.requests_per_minute.items()},
+                "requests_per_second": {
+                    str(time(second // 3600, second // 60 % 60, second % 60)): int(obj.requests_per_second[second])
+                    for second in obj.seconds_in_order
+                },
+                "requests_per_minute": {
+                    str(time(minute // 60, minute % 60)): int(obj.requests_per_minute[minute])
+                    for minute in obj.minutes_in_order
+                },
             }
         return super().default(obj)
 
 
 class NumberOfParallelCommandsTracker:
+    """
+    Counts the started requests per second and per minute of the day.
+    The counts are stored in arrays indexed by the second and the minute of the day.
+    The seconds and minutes with requests are also remembered in the order they were first seen.
+    """
+
     def __init__(self):
         self.current_parallel_commands = 0
-        self.requests_per_second: dict[time, int] = dict()
-        self.requests_per_minute: dict[time, int] = dict()
+        self.requests_per_second = np.zeros(SECONDS_PER_DAY, dtype=np.int32)
+        self.requests_per_minute = np.zeros(MINUTES_PER_DAY, dtype=np.int32)
+        self.seconds_in_order: list[int] = []
+        self.minutes_in_order: list[int] = []
 
-    def process_log_line(self, line: str):
+    def process_log_line(self, line: str, timestamp: Optional[datetime] = None):
         if "CMD-START" in line:
             self.current_parallel_commands += 1
-            timestamp = get_timestamp_from_line(line)
-            time_of_request = timestamp.time()
-            time_of_request = time_of_request.replace(time_of_request.hour, time_of_request.minute, time_of_request.second, 0)
-            if time_of_request not in self.requests_per_second:
-                self.requests_per_second[time_of_request] = 0
-            self.requests_per_second[time_of_request] += 1
-            time_of_request = time_of_request.replace(time_of_request.hour, time_of_request.minute, 0)
-            if time_of_request not in self.requests_per_minute:
-                self.requests_per_minute[time_of_request] = 0
-            self.requests_per_minute[time_of_request] += 1
+            second = second_of_day(timestamp if timestamp is not None else get_timestamp_from_line(line))
+            minute = second // 60
+            if self.requests_per_second[second] == 0:
+                self.seconds_in_order.append(second)
+                if self.requests_per_minute[minute] == 0:
+                    self.minutes_in_order.append(minute)
+            self.requests_per_second[second] += 1
+            self.requests_per_minute[minute] += 1
         elif "CMD-ENDE" in line:
             self.current_parallel_commands -= 1
 
     def get_requests_per_second_for(self, timestamp: datetime):
-        time_of_request = timestamp.time()
-        time_of_request = time_of_request.replace(time_of_request.hour, time_of_request.minute, time_of_request.second, 0)
-        if time_of_request not in self.requests_per_second:
-            return 0
-        return self.requests_per_second[time_of_request]
+        return int(self.requests_per_second[second_of_day(timestamp)])
 
     def get_requests_per_minute_for(self, timestamp: datetime):
-        time_of_request = timestamp.time()
-        time_of_request = time_of_request.replace(time_of_request.hour, time_of_request.minute, 0, 0)
-        if time_of_request not in self.requests_per_minute:
-            return 0
-        return self.requests_per_minute[time_of_request]
+        return int(self.requests_per_minute[second_of_day(timestamp) // 60])
 
     def reset(self):
         self.current_parallel_commands = 0
-        self.requests_per_second: dict[time, int] = dict()
-        self.requests_per_minute: dict[time, int] = dict()
+        self.requests_per_second = np.zeros(SECONDS_PER_DAY, dtype=np.int32)
+        self.requests_per_minute = np.zeros(MINUTES_PER_DAY, dtype=np.int32)
+        self.seconds_in_order = []
+        self.minutes_in_order = []
 
     def to_json(self, file: TextIO):
         return json.dump(self, file, cls=NumberOfParallelCommandsTrackerEncoder, indent=2)
 
+    def to_npy(self, path):
+        """Saves the requests per second followed by the requests per minute as one binary array."""
+        np.save(path, np.concatenate((self.requests_per_second, self.requests_per_minute)))
+
+    @staticmethod
+    def from_json(file: TextIO) -> "NumberOfParallelCommandsTracker":
+        request_statistics = json.load(file)
+
+        tracker = NumberOfParallelCommandsTracker()
+        for key, value in request_statistics['requests_per_second'].items():
+            second = second_of_day(time.fromisoformat(key))
+            tracker.requests_per_second[second] = value
+            tracker.seconds_in_order.append(second)
+        for key, value in request_statistics['requests_per_minute'].items():
+            minute = second_of_day(time.fromisoformat(key)) // 60
+            tracker.requests_per_minute[minute] = value
+            tracker.minutes_in_order.append(minute)
+        return tracker
+
+    @staticmethod
+    def from_npy(path) -> "NumberOfParallelCommandsTracker":
+        """Loads a tracker saved with to_npy. The file is memory-mapped, not read."""
+        counts = np.load(path, mmap_mode="r")
+
+        tracker = NumberOfParallelCommandsTracker()
+        tracker.requests_per_second = counts[:SECONDS_PER_DAY]
+        tracker.requests_per_minute = counts[SECONDS_PER_DAY:]
+        # the order the seconds were first seen in is not saved, the order of the time of day is the closest
+        tracker.seconds_in_order = np.flatnonzero(tracker.requests_per_second).tolist()
+        tracker.minutes_in_order = np.flatnonzero(tracker.requests_per_minute).tolist()
+        return tracker
+
+
+def follow_lines(path: str,
+                 poll_interval: float = 0.5,
+                 idle_timeout: Optional[float] = None,
+                 on_idle: Optional[Callable[[], None]] = None) -> Iterator[str]:
+    """
+    Yields the lines of a growing file from its beginning on, like tail -F does.
+    Keeps following the path when the file is rotated (replaced by a new file) or truncated.
+    A line is only yielded once it is complete.
+    :param path: The path of the file to follow
+    :param poll_interval: Seconds to wait for new lines at the end of the file
+    :param idle_timeout: Stop after that many seconds without new lines, follow forever if None
+    :param on_idle: Called every time all lines written so far are yielded
+    """
+    logfile: Optional[BinaryIO] = None
+    partial_line = b""
+    new_lines_at = monotonic()
+
+    # like reading in text mode does, with the encoding open_log_file uses
+    encoding = locale.getpreferredencoding(False)
+
+    def decode(complete_line: bytes) -> str:
+        return complete_line.decode(encoding).replace("\r\n", "\n")
+
+    while True:
+        if logfile is None:
+            try:
+                logfile = open(path, "rb")
+                print("Following %s" % path)
+            except FileNotFoundError:
+                pass
+
+        line = logfile.readline() if logfile is not None else b""
+        if line:
+            partial_line += line
+            if partial_line.endswith(b"\n"):
+                yield decode(partial_line)
+                partial_line = b""
+                new_lines_at = monotonic()
+            continue
+
+        # all lines written so far are read
+        if on_idle is not None:
+            on_idle()
+
+        if idle_timeout is not None and monotonic() - new_lines_at >= idle_timeout:
+            break
+
+        sleep(poll_interval)
+
+        if logfile is None:
+            continue
+
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            # rotated, but the new file does not exist yet
+            continue
+
+        if stat.st_ino != os.fstat(logfile.fileno()).st_ino:
+            # rotated, read what was written to the old file in the meantime and continue with the new one
+            partial_line += logfile.read()
+            for complete_line in partial_line.splitlines(keepends=True):
+                yield decode(complete_line if complete_line.endswith(b"\n") else complete_line + b"\n")
+            partial_line = b""
+
+            logfile.close()
+            logfile = None
+        elif stat.st_size < logfile.tell():
+            print("%s was truncated" % path)
+            logfile.seek(0)
+            partial_line = b""
+
+    if logfile is not None:
+        logfile.close()
+
 
 class RequestLogConverter:
 
     def __init__(self, args):
         self.started_commands = {}
+        # number of commands that finished so far, every started command remembers
+        # the value at its start to know how many commands finished while it was running
+        self.finished_commands = 0
         self.args = args
 
         self.parallel_commands_tracker = NumberOfParallelCommandsTracker()
 
-    def read(self, path: str):
+        # also writes the converted entries to a Parquet dataset, if one is given
+        self._parquet_writer: Optional[ParquetDatasetWriter] = None
+        self._parquet_rows: list[dict] = []
+
+        # state of follow
+        self._day: Optional[date] = None
+        self._target_file: Optional[TextIO] = None
+        self._statistics_interval = 60.0
+        self._statistics_written_at = 0.0
+
+    def read(self, path: str, compression_suffix: str = ""):
+        """:param compression_suffix: Compress the converted log, one of the COMPRESSION_SUFFIXES"""
 
-        from pathlib import Path
         name_of_log_file = Path(path).name
         target_path = Path(path) \
-            .with_name("Conv_{}".format(get_date_from_string(name_of_log_file))) \
-            .with_suffix(".log")
+            .with_name("Conv_{}.log{}".format(get_date_from_string(name_of_log_file), compression_suffix))
 
         print("Writing to ", target_path)
-        target_file = open(target_path, mode="w")
+        target_file = open_log_file(target_path, mode="w")
+
+        if self.args.parquet_directory is not None:
+            print("Writing to Parquet dataset", self.args.parquet_directory)
+            self._parquet_writer = ParquetDatasetWriter(
+                self.args.parquet_directory, CONVERTED_ENTRY_COLUMNS, str(target_path)
+            )
+            # the entries of an earlier conversion of the log file are replaced
+            self._parquet_writer.remove_files()
+
+        metrics = get_stage_metrics()
 
         print("Reading from %s" % path)
-        with open(path) as logfile:
-            counter = 0
-
-            for line in logfile:
-                counter = counter + 1
-                if counter % 20000 == 0:
-                    print("Processed {} entries".format(counter))
-
-                if "CMD-START" in line:
-                    (tid, _) = self.process_threadid_and_timestamp(line)
-                    self.process_cmd(line, tid)
-                elif "CMD-ENDE" in line:
-                    (tid, end_time) = get_threadid_and_timestamp(line)
-
-                    if tid not in self.started_commands:
-                        print("Command ended without corresponding start log entry")
-                        print("in file: ", logfile)
-                        print("on line: ", line)
-                        print(self.started_commands)
-                        if not self.args.force:
-                            input("Press ENTER to continue...")
-                        continue
-
-                    self.started_commands[tid][
-                        "parallelCommandsEnd"] = self.parallel_commands_tracker.current_parallel_commands
-
-                    start_time = self.started_commands[tid]["time"]
-
-                    execution_time_ms = (end_time - start_time).total_seconds() * 1000
-
-                    write_to_target_log(
-                        {
-                            "receivedAt": end_time,
-                            "cmd": self.started_commands[tid]["cmd"],
-                            "parallelRequestsStart": self.started_commands[tid]["parallelCommandsStart"],
-                            "parallelRequestsEnd": self.started_commands[tid]["parallelCommandsEnd"],
-                            "parallelCommandsFinished": self.started_commands[tid]["parallelCommandsFinished"],
-                            "time": int(execution_time_ms)
-                        },
-                        target_file
-                    )
-
-                    # thread <tid> finished his command,
-                    # increment counter of other commands
-                    for cmd in self.started_commands.values():
-                        cmd["parallelCommandsFinished"] = cmd["parallelCommandsFinished"] + 1
-
-                    # ...remove from startedCommands
-                    self.started_commands.pop(tid)
-
-                self.parallel_commands_tracker.process_log_line(line)
+        with metrics.file(path), open_log_file(path) as logfile:
+            while True:
+                # a batch of lines is converted in memory and written at once
+                with metrics.phase("parse"):
+                    lines = list(islice(logfile, 20000))
+                    if len(lines) == 0:
+                        break
+
+                    converted_lines = io.StringIO()
+                    for line in lines:
+                        self.process_line(line, converted_lines, logfile)
+
+                with metrics.phase("write"):
+                    target_file.write(converted_lines.getvalue())
+                    self._write_parquet_rows()
+
+                metrics.count_lines(len(lines))
 
         if len(self.started_commands) > 0:
             print("Commands remaining")
@@ -180,25 +314,173 @@ class RequestLogConverter:
             if not self.args.force:
                 input("Press ENTER to continue...")
         self.started_commands.clear()
+        self.finished_commands = 0
 
         target_path = Path(path) \
             .with_name("request_statistics_{}".format(get_date_from_string(name_of_log_file))) \
             .with_suffix(".json")
 
-        with open(target_path, "w") as write_file:
-            self.parallel_commands_tracker.to_json(write_file)
+        self.write_statistics(target_path)
 
         self.parallel_commands_tracker.reset()
         target_file.close()
 
+        if self._parquet_writer is not None:
+            with metrics.phase("write"):
+                self._parquet_writer.close()
+            self._parquet_writer = None
+
+    def follow(self,
+               path: str,
+               poll_interval: float = 0.5,
+               statistics_interval: float = 60,
+               idle_timeout: Optional[float] = None):
+        """
+        Converts a growing request log file while it is written, see follow_lines.
+        The converted lines are flushed whenever all lines written so far are converted,
+        the statistics are written every statistics_interval seconds.
+        The output files are named after the day of the log entries, so that following a log file
+        that is rotated every day starts new output files at midnight. Only a later day starts new output files,
+        entries of an earlier day that are logged late are written to the output files of the current day.
+        The converted lines are appended to the output files, remove them before following a log file
+        from its beginning again.
+        """
+        self._statistics_interval = statistics_interval
+
+        metrics = get_stage_metrics()
+        try:
+            for line in follow_lines(path, poll_interval, idle_timeout, lambda: self._flush_followed_output(path)):
+                metrics.count_lines()
+
+                if "CMD-START" in line or "CMD-ENDE" in line:
+                    day = get_timestamp_from_line(line).date()
+                    if self._day is None or day > self._day:
+                        self._start_day(path, day)
+
+                self.process_line(line, self._target_file, path)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self._day is not None:
+                self._finish_day(path)
+
+        if len(self.started_commands) > 0:
+            print("{} commands still running".format(len(self.started_commands)))
+
+    def _start_day(self, path: str, day: date):
+        if self._day is not None:
+            self._finish_day(path)
+
+        self._day = day
+
+        target_path = Path(path).with_name("Conv_{}.log".format(day))
+        print("Appending to ", target_path)
+        self._target_file = open(target_path, mode="a")
+
+        # the commands running at midnight keep running
+        current_parallel_commands = self.parallel_commands_tracker.current_parallel_commands
+        self.parallel_commands_tracker.reset()
+        self.parallel_commands_tracker.current_parallel_commands = current_parallel_commands
+
+    def _finish_day(self, path: str):
+        self._target_file.close()
+        self.write_statistics(Path(path).with_name("request_statistics_{}.json".format(self._day)))
+
+    def _flush_followed_output(self, path: str):
+        if self._day is None:
+            return
+
+        self._target_file.flush()
+
+        if monotonic() - self._statistics_written_at >= self._statistics_interval:
+            self.write_statistics(Path(path).with_name("request_statistics_{}.json".format(self._day)))
+
+    def write_statistics(self, target_path: Path):
+        """
+        Writes the request statistics as json and as .npy sidecar. Both files are replaced at once,
+        so that a reader never sees a partially written file.
+        """
+        temporary_path = target_path.with_name(target_path.name + ".tmp")
+        with open(temporary_path, "w") as write_file:
+            self.parallel_commands_tracker.to_json(write_file)
+        os.replace(temporary_path, target_path)
+
+        with open(temporary_path, "wb") as write_file:
+            self.parallel_commands_tracker.to_npy(write_file)
+        os.replace(temporary_path, target_path.with_suffix(".npy"))
+
+        self._statistics_written_at = monotonic()
+
+    def process_line(self, line: str, target_file: TextIO, logfile, timestamp: Optional[datetime] = None):
+        """
+        :param line: The next line of the request log
+        :param target_file: The file the converted line is written to
+        :param logfile: The request log, for error messages
+        :param timestamp: The timestamp of the line, if it is known already
+        """
+        if "CMD-START" in line:
+            (tid, _) = self.process_threadid_and_timestamp(line, timestamp)
+            self.process_cmd(line, tid)
+        elif "CMD-ENDE" in line:
+            (tid, end_time) = get_threadid_and_timestamp(line, timestamp)
+
+            if tid not in self.started_commands:
+                print("Command ended without corresponding start log entry")
+                print("in file: ", logfile)
+                print("on line: ", line)
+                print(self.started_commands)
+                if not self.args.force:
+                    input("Press ENTER to continue...")
+                return
+
+            self.started_commands[tid][
+                "parallelCommandsEnd"] = self.parallel_commands_tracker.current_parallel_commands
+
+            start_time = self.started_commands[tid]["time"]
+
+            execution_time_ms = (end_time - start_time).total_seconds() * 1000
+
+            self.write_converted_entry(
+                {
+                    "receivedAt": end_time,
+                    "cmd": self.started_commands[tid]["cmd"],
+                    "parallelRequestsStart": self.started_commands[tid]["parallelCommandsStart"],
+                    "parallelRequestsEnd": self.started_commands[tid]["parallelCommandsEnd"],
+                    "parallelCommandsFinished":
+                        self.finished_commands - self.started_commands[tid]["finishedCommandsAtStart"],
+                    "time": int(execution_time_ms)
+                },
+                target_file
+            )
+
+            # thread <tid> finished his command,
+            # this increments the counter of all other commands
+            self.finished_commands += 1
+
+            # ...remove from startedCommands
+            self.started_commands.pop(tid)
+
+        self.parallel_commands_tracker.process_log_line(line, timestamp)
+
+    def write_converted_entry(self, data: dict, target_file: TextIO):
+        write_to_target_log(data, target_file)
+
+        if self._parquet_writer is not None:
+            self._parquet_rows.append(to_converted_entry_row(data))
+
+    def _write_parquet_rows(self):
+        for row in self._parquet_rows:
+            self._parquet_writer.add(row)
+        self._parquet_rows.clear()
+
     @staticmethod
     def write_ARS_CMDs_to_target_log(data, target_file):
         if "ID_REQ_KC_STORE7D3BPACKET" in data["cmd"]:
             write_to_target_log(data, target_file)
 
-    def process_threadid_and_timestamp(self, line: str) -> Tuple[int, datetime]:
+    def process_threadid_and_timestamp(self, line: str, timestamp: Optional[datetime] = None) -> Tuple[int, datetime]:
 
-        tid, timestamp = get_threadid_and_timestamp(line)
+        tid, timestamp = get_threadid_and_timestamp(line, timestamp)
 
         if tid in self.started_commands.keys():
             print(tid, " already processes another command", self.started_commands[tid]["cmd"])
@@ -211,7 +493,7 @@ class RequestLogConverter:
             "cmd": None,
             "parallelCommandsStart": self.parallel_commands_tracker.current_parallel_commands,
             "parallelCommandsEnd": 0,
-            "parallelCommandsFinished": 0
+            "finishedCommandsAtStart": self.finished_commands
         }
 
         return tid, timestamp
@@ -239,27 +521,67 @@ def main():
     parser.add_argument('--force',
                         action='store_true',
                         help='ignore errors in the log files')
+    parser.add_argument('--follow', '-F',
+                        action='store_true',
+                        help='keep converting a growing log file (given with --files) while it is written, '
+                             'like tail -F, until interrupted. Implies --force')
+    parser.add_argument('--poll-interval',
+                        type=float,
+                        default=0.5,
+                        help='seconds to wait for new lines when following a log file')
+    parser.add_argument('--statistics-interval',
+                        type=float,
+                        default=60,
+                        help='seconds between two writes of the request statistics when following a log file')
+    parser.add_argument('--idle-timeout',
+                        type=float,
+                        help='stop following a log file after that many seconds without new lines')
+    parser.add_argument('--compress', '-c',
+                        choices=[suffix[1:] for suffix in COMPRESSION_SUFFIXES],
+                        help='compress the converted log files')
+    parser.add_argument('--parquet-directory', '-p',
+                        type=str,
+                        help='also write the converted log entries to a Parquet dataset in this directory, '
+                             'partitioned by day and request type (needs pyarrow)')
+    add_instrumentation_arguments(parser)
     args = parser.parse_args()
     if args.files is None and args.directory is None:
         parser.print_help()
         exit(1)
 
-    logfiles_to_convert = args.files if args.files is not None else []
+    if args.follow:
+        if args.files is None or len(args.files) != 1:
+            parser.error("--follow needs exactly one log file given with --files")
+        if is_compressed(args.files[0]) or args.compress is not None:
+            parser.error("--follow cannot be used with compressed log files")
+        if args.parquet_directory is not None:
+            parser.error("--follow cannot be used with --parquet-directory")
+
+        # nobody is there to press ENTER
+        args.force = True
+
+        with instrument("RequestLogToCLF", args.report, args.profile, args.profile_output):
+            converter = RequestLogConverter(args)
+            converter.follow(args.files[0], args.poll_interval, args.statistics_interval, args.idle_timeout)
+        return
+
+    with instrument("RequestLogToCLF", args.report, args.profile, args.profile_output):
+        logfiles_to_convert = args.files if args.files is not None else []
 
-    if args.directory is not None:
-        logfiles = glob.glob(join(args.directory, '**', 'Merged_*.log'), recursive=True)
-        logfiles.extend(glob.glob(join(args.directory, '**', "teastore-cmd_*.log"), recursive=True))
-        logfiles_to_convert.extend(logfiles)
+        if args.directory is not None:
+            logfiles = glob_log_files(args.directory, 'Merged_*.log')
+            logfiles.extend(glob_log_files(args.directory, "teastore-cmd_*.log"))
+            logfiles_to_convert.extend(logfiles)
 
-    # remove duplicates trick
-    logfiles_to_convert = sorted(set(logfiles_to_convert))
+        # remove duplicates trick
+        logfiles_to_convert = sorted(set(logfiles_to_convert))
 
-    print("Logs to convert: " + str(logfiles_to_convert))
+        print("Logs to convert: " + str(logfiles_to_convert))
 
-    for path in logfiles_to_convert:
-        converter = RequestLogConverter(args)
-        print("Converting ", path)
-        converter.read(path)
+        for path in logfiles_to_convert:
+            converter = RequestLogConverter(args)
+            print("Converting ", path)
+            converter.read(path, "." + args.compress if args.compress is not None else "")
 
 
 if __name__ == "__main__":
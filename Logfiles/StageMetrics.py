@@ -0,0 +1,257 @@
+import json
+import sys
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from os.path import getsize, exists
+from time import perf_counter
+from typing import Optional, Callable
+
+# Measures where a run of one of the Logfiles scripts spends its time: the lines and bytes it processes,
+# the time spent in its phases (like parse, enrich and write), the duration of every file and the peak memory.
+# The metrics of a run are collected in one StageMetrics object per process, see get_stage_metrics.
+
+PROFILERS = ["cprofile", "pyinstrument"]
+
+
+def get_peak_rss_mb(children: bool = False) -> Optional[float]:
+    """
+    Returns the peak resident set size of this process, or of the largest of its terminated child processes.
+    Returns None on systems without the resource module.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class StageMetrics:
+    def __init__(self, name: str = "", progress_interval: int = 20000):
+        """
+        :param name: The name of the script
+        :param progress_interval: Print the progress every time this many more lines are processed
+        """
+        self.name = name
+        self.progress_interval = progress_interval
+        self.started_at = datetime.now()
+        self.completed = False
+
+        self.lines = 0
+        self.bytes = 0
+        self.phase_seconds: dict[str, float] = defaultdict(float)
+        # path -> seconds, lines and bytes of the file
+        self.files: dict[str, dict] = dict()
+
+        self._start = perf_counter()
+        self._seconds: Optional[float] = None
+
+    @property
+    def seconds(self) -> float:
+        return self._seconds if self._seconds is not None else perf_counter() - self._start
+
+    def count_lines(self, lines: int = 1):
+        """Counts processed lines and prints the progress, it is cheaper to count many lines at once."""
+        previous_lines = self.lines
+        self.lines += lines
+
+        if self.lines // self.progress_interval > previous_lines // self.progress_interval:
+            print("Processed {} entries ({:.0f} lines/s)".format(self.lines, self.lines / self.seconds))
+
+    @contextmanager
+    def phase(self, name: str):
+        """Adds the time spent in the with block to the phase."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_seconds[name] += perf_counter() - start
+
+    @contextmanager
+    def file(self, path, size: Optional[int] = None):
+        """
+        Measures the processing of a file in the with block: its duration and the lines counted meanwhile.
+        :param size: The number of bytes processed, defaults to the size of the file
+        """
+        start = perf_counter()
+        lines = self.lines
+        try:
+            yield
+        finally:
+            if size is None:
+                size = getsize(path) if exists(path) else 0
+
+            metrics_of_file = self.files.setdefault(str(path), {"seconds": 0.0, "lines": 0, "bytes": 0})
+            metrics_of_file["seconds"] += perf_counter() - start
+            metrics_of_file["lines"] += self.lines - lines
+            metrics_of_file["bytes"] += size
+            self.bytes += size
+
+    def merge(self, other: dict):
+        """
+        Adds the metrics of a worker process, see run_with_stage_metrics.
+        The durations of phases and files are summed, so they can be longer than the run with parallel workers.
+        """
+        self.lines += other["lines"]
+        self.bytes += other["bytes"]
+
+        for name, seconds in other["phases"].items():
+            self.phase_seconds[name] += seconds
+
+        for path, metrics_of_file in other["files"].items():
+            merged = self.files.setdefault(path, {"seconds": 0.0, "lines": 0, "bytes": 0})
+            for key in merged:
+                merged[key] += metrics_of_file[key]
+
+    def finish(self, completed: bool = True):
+        self._seconds = perf_counter() - self._start
+        self.completed = completed
+
+    def to_dict(self) -> dict:
+        seconds = self.seconds
+        return {
+            "name": self.name,
+            "arguments": sys.argv[1:],
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "completed": self.completed,
+            "seconds": seconds,
+            "lines": self.lines,
+            "bytes": self.bytes,
+            "lines_per_second": self.lines / seconds if seconds > 0 else 0.0,
+            "bytes_per_second": self.bytes / seconds if seconds > 0 else 0.0,
+            "phases": dict(self.phase_seconds),
+            "files": self.files,
+            "peak_rss_mb": get_peak_rss_mb(),
+            "peak_rss_mb_of_workers": get_peak_rss_mb(children=True),
+        }
+
+    def summary(self) -> str:
+        seconds = self.seconds
+        summary = "Finished {} in {:.2f} s: {} lines ({:.0f} lines/s), {:.1f} MB ({:.1f} MB/s)".format(
+            self.name, seconds, self.lines, self.lines / seconds if seconds > 0 else 0.0,
+            self.bytes / 1024 / 1024, self.bytes / 1024 / 1024 / seconds if seconds > 0 else 0.0
+        )
+
+        if len(self.phase_seconds) > 0:
+            summary += ", " + ", ".join(
+                "{} {:.2f} s".format(name, phase_seconds) for name, phase_seconds in self.phase_seconds.items()
+            )
+
+        peak_rss_mb = get_peak_rss_mb()
+        if peak_rss_mb is not None:
+            summary += ", peak RSS {:.1f} MB".format(peak_rss_mb)
+
+        return summary
+
+
+_stage_metrics = StageMetrics()
+
+
+def get_stage_metrics() -> StageMetrics:
+    """Returns the metrics of the current run of this process."""
+    return _stage_metrics
+
+
+def run_with_stage_metrics(function: Callable, *args):
+    """
+    Runs a function with metrics of its own, e.g. in a worker process that is reused for several tasks.
+    Returns the result of the function and its metrics, which the parent process merges into its metrics.
+    """
+    global _stage_metrics
+
+    outer_metrics = _stage_metrics
+    _stage_metrics = StageMetrics(outer_metrics.name, outer_metrics.progress_interval)
+    try:
+        result = function(*args)
+        _stage_metrics.finish()
+        return result, _stage_metrics.to_dict()
+    finally:
+        _stage_metrics = outer_metrics
+
+
+def add_instrumentation_arguments(parser):
+    """Adds the arguments of instrument to an argparse parser."""
+    parser.add_argument('--report',
+                        type=str,
+                        help='write a json report of the run to this file: lines and bytes per second, '
+                             'time spent per phase, duration of every file and peak memory usage')
+    parser.add_argument('--profile',
+                        choices=PROFILERS,
+                        help='profile the run with cProfile or pyinstrument (needs pyinstrument)')
+    parser.add_argument('--profile-output',
+                        type=str,
+                        help='the file the profile is written to, defaults to <script>.prof or <script>.html')
+
+
+def _start_profiler(profiler: Optional[str], profile_output: str) -> Callable[[], None]:
+    """Starts the profiler and returns the function that stops it and writes the profile."""
+    if profiler is None:
+        return lambda: None
+
+    if profiler == "cprofile":
+        import cProfile
+
+        profile = cProfile.Profile()
+        profile.enable()
+
+        def stop_cprofile():
+            profile.disable()
+            profile.dump_stats(profile_output)
+            print("Wrote profile to {}, view it with python -m pstats {}".format(profile_output, profile_output))
+
+        return stop_cprofile
+
+    if profiler == "pyinstrument":
+        from pyinstrument import Profiler
+
+        profile = Profiler()
+        profile.start()
+
+        def stop_pyinstrument():
+            profile.stop()
+            with open(profile_output, "w") as f:
+                f.write(profile.output_html())
+            print("Wrote profile to", profile_output)
+
+        return stop_pyinstrument
+
+    raise ValueError("Unknown profiler {}, use one of {}".format(profiler, PROFILERS))
+
+
+@contextmanager
+def instrument(name: str,
+               report_path: Optional[str] = None,
+               profiler: Optional[str] = None,
+               profile_output: Optional[str] = None):
+    """
+    Measures a run of a script in the with block, prints a summary at its end and writes the report.
+    :param name: The name of the script
+    :param report_path: Write the metrics of the run as json to this file
+    :param profiler: Profile the run with one of the PROFILERS
+    :param profile_output: The file the profile is written to
+    """
+    global _stage_metrics
+
+    if profile_output is None:
+        profile_output = "{}.{}".format(name, "html" if profiler == "pyinstrument" else "prof")
+
+    _stage_metrics = StageMetrics(name)
+    stop_profiler = _start_profiler(profiler, profile_output)
+
+    completed = False
+    try:
+        yield _stage_metrics
+        completed = True
+    finally:
+        stop_profiler()
+
+        _stage_metrics.finish(completed)
+        print(_stage_metrics.summary())
+
+        if report_path is not None:
+            with open(report_path, "w") as f:
+                json.dump(_stage_metrics.to_dict(), f, indent=2)
+            print("Wrote report to", report_path)
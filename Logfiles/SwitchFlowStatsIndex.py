@@ -0,0 +1,67 @@
+from datetime import datetime
+from typing import Sequence
+
+import numpy as np
+from rast_common.main.SwitchAggFlowStats import SwitchAggFlowStats
+
+
+def _to_microseconds(timestamps) -> np.ndarray:
+    return np.array(timestamps, dtype="datetime64[us]").astype(np.int64)
+
+
+class SwitchFlowStatsIndex:
+    """
+    Looks up the bytes and packets per second of several switches for whole batches of timestamps at once.
+
+    The samples of every switch are kept in arrays sorted by time. Like the getters of SwitchAggFlowStats,
+    the rates at a timestamp are the ones of the last sample at or before it, and 0 before the first sample.
+    A batch of timestamps is looked up with one binary search per switch.
+    """
+
+    def __init__(self, flow_stats: Sequence[SwitchAggFlowStats]):
+        """
+        :param flow_stats: The flow statistics of the switches
+        """
+        self.switch_ids = [flow_stats_for_switch.switch_id for flow_stats_for_switch in flow_stats]
+
+        # per switch: the times of the samples in microseconds, sorted, and the rates from each sample on,
+        # the rates are preceded by the 0 of the time before the first sample
+        self._sample_times: list[np.ndarray] = []
+        self._bytes_per_second: list[np.ndarray] = []
+        self._packets_per_second: list[np.ndarray] = []
+
+        for flow_stats_for_switch in flow_stats:
+            samples = flow_stats_for_switch.samples
+            sample_times = _to_microseconds([sample.timestamp for sample in samples])
+            # stable, so that of samples with the same time the last one wins, like in the getters
+            order = np.argsort(sample_times, kind="stable")
+
+            self._sample_times.append(sample_times[order])
+            self._bytes_per_second.append(
+                np.concatenate(([0], np.array([sample.bytes_per_second for sample in samples])[order]))
+            )
+            self._packets_per_second.append(
+                np.concatenate(([0], np.array([sample.packets_per_second for sample in samples])[order]))
+            )
+
+    def __len__(self):
+        return len(self.switch_ids)
+
+    def get_rates_for(self, timestamps: Sequence[datetime]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the bytes per second and the packets per second transmitted through every switch
+        at the given timestamps, as arrays with one row per timestamp and one column per switch.
+        """
+        times = _to_microseconds(timestamps)
+
+        bytes_per_second = []
+        packets_per_second = []
+        for sample_times, bytes_of_switch, packets_of_switch in zip(
+                self._sample_times, self._bytes_per_second, self._packets_per_second
+        ):
+            # the number of samples at or before each timestamp, 0 is the time before the first sample
+            positions = np.searchsorted(sample_times, times, side="right")
+            bytes_per_second.append(bytes_of_switch[positions])
+            packets_per_second.append(packets_of_switch[positions])
+
+        return np.stack(bytes_per_second, axis=1), np.stack(packets_per_second, axis=1)
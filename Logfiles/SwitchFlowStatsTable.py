@@ -0,0 +1,44 @@
+from sqlalchemy import Engine, MetaData, Table, Column, String, Integer, Float, insert
+from sqlalchemy.orm import Session
+
+_metadata = MetaData()
+
+# The flow statistics of every switch at the time of a training data row, see --all-switches of LogToDbETL.
+# The training data table itself has the flow statistics of the first switch only,
+# so that every log entry is one row of training data, however many switches there are.
+switch_flow_stats_table = Table(
+    "training_data_switch_flow_stats",
+    _metadata,
+    # the id of the row in the training data table
+    Column("training_data_id", Integer, primary_key=True),
+    Column("switch_id", String, primary_key=True),
+    Column("bytes_per_second_transmitted_through_switch", Float),
+    Column("packets_per_second_transmitted_through_switch", Float),
+)
+
+
+def create_switch_flow_stats_table(db_connection: Engine):
+    _metadata.create_all(db_connection)
+
+
+def insert_switch_flow_stats(db_connection: Session,
+                             training_data_ids: list[int],
+                             flow_stats_of_rows: list[list[tuple[str, float, float]]]):
+    """
+    Inserts the flow statistics of the switches of training data rows, with the rows in the same transaction.
+    :param training_data_ids: The ids of the training data rows
+    :param flow_stats_of_rows: The (switch id, bytes per second, packets per second) of every switch, per row
+    """
+    values = [
+        {
+            "training_data_id": training_data_id,
+            "switch_id": switch_id,
+            "bytes_per_second_transmitted_through_switch": bytes_per_second,
+            "packets_per_second_transmitted_through_switch": packets_per_second
+        }
+        for training_data_id, flow_stats_of_row in zip(training_data_ids, flow_stats_of_rows)
+        for switch_id, bytes_per_second, packets_per_second in flow_stats_of_row
+    ]
+
+    if len(values) > 0:
+        db_connection.execute(insert(switch_flow_stats_table), values)
@@ -0,0 +1,324 @@
+import argparse
+import heapq
+import os
+import random
+from bisect import bisect
+from dataclasses import dataclass
+from datetime import date, timedelta
+from itertools import accumulate
+from os.path import join
+from typing import Iterator, Optional
+
+# Generates synthetic command logs in the formats the Logfiles tools read, as fixtures for tests and benchmarks.
+# The logs only depend on the options, the same options always generate the same bytes.
+
+MICROSECONDS_PER_DAY = 24 * 60 * 60 * 1000000
+
+# the requests the alarm devices send to the ARS
+ARS_REQUEST_TYPE = "ID_REQ_KC_STORE7D3BPACKET"
+
+# first thread id of every source, so that the thread ids of the sources of a day do not collide when merged
+THREAD_IDS_PER_SOURCE = 100000
+
+
+@dataclass
+class SyntheticLogOptions:
+    # command log lines (starts and ends of requests) per day, of all sources together
+    lines_per_day: int = 100000
+    # mean number of requests in flight at the same time, of all sources together
+    concurrency: float = 20
+    request_types: int = 10
+    # WS log files per day
+    sources: int = 2
+    # ARS log files per day
+    ars_sources: int = 1
+    # fraction of WS log entries that are broken into two lines, like WSLogFixer expects
+    broken_entries: float = 0.01
+    seed: int = 0
+
+
+def get_request_types(number_of_request_types: int) -> list[str]:
+    return ["ID_REQ_TYPE_{:02d}".format(i) for i in range(number_of_request_types)]
+
+
+def format_time_of_day(day: date, microsecond_of_day: int) -> str:
+    seconds, microseconds = divmod(microsecond_of_day, 1000000)
+    return "{} {:02d}:{:02d}:{:02d}.{:06d}".format(
+        day, seconds // 3600, seconds // 60 % 60, seconds % 60, microseconds
+    )
+
+
+def generate_requests(day: date,
+                      requests: int,
+                      concurrency: float,
+                      request_types: list[str],
+                      rng: random.Random,
+                      first_thread_id: int = 1) -> Iterator[tuple[str, int, Optional[str]]]:
+    """
+    Yields the starts and ends of the requests of one source during one day, ordered by time.
+    The requests arrive at random and take as long as needed to keep concurrency requests in flight
+    on average. The more common a request type is, the faster it is answered.
+    A request is processed by a thread that processes no other request at the same time.
+    :return: (timestamp, thread id, request type) of a start and (timestamp, thread id, None) of an end
+    """
+    if requests <= 0:
+        return
+
+    mean_gap = MICROSECONDS_PER_DAY / (requests + 1)
+    # Little's law: requests in flight = arrival rate * mean response time
+    mean_response_time = max(concurrency, 0.0) * mean_gap
+
+    # the first request type is the most common one
+    weights = [1 / (i + 1) for i in range(len(request_types))]
+    cumulative_weights = list(accumulate(weights))
+    total_weight = cumulative_weights[-1]
+    # from 0.5 to 1.5 times the mean response time, weighted by how common the request types are
+    response_time_factors = [0.5 + i / max(len(request_types) - 1, 1) for i in range(len(request_types))]
+    mean_factor = sum(w * f for w, f in zip(weights, response_time_factors)) / total_weight
+    response_time_factors = [factor / mean_factor for factor in response_time_factors]
+
+    free_thread_ids: list[int] = []
+    next_thread_id = first_thread_id
+    # (end, thread id) of the requests in flight
+    ends: list[tuple[int, int]] = []
+
+    start = 0
+    for _ in range(requests):
+        start = min(start + int(rng.expovariate(1 / mean_gap)), MICROSECONDS_PER_DAY - 1)
+
+        while len(ends) > 0 and ends[0][0] <= start:
+            end, thread_id = heapq.heappop(ends)
+            free_thread_ids.append(thread_id)
+            yield format_time_of_day(day, end), thread_id, None
+
+        if len(free_thread_ids) > 0:
+            thread_id = free_thread_ids.pop()
+        else:
+            thread_id = next_thread_id
+            next_thread_id += 1
+
+        request_type = bisect(cumulative_weights, rng.random() * total_weight)
+        request_type = min(request_type, len(request_types) - 1)
+        yield format_time_of_day(day, start), thread_id, request_types[request_type]
+
+        response_time = int(rng.expovariate(1 / (mean_response_time * response_time_factors[request_type]))) \
+            if mean_response_time > 0 else 0
+        # the requests of a day end that day
+        heapq.heappush(ends, (min(start + response_time, MICROSECONDS_PER_DAY - 1), thread_id))
+
+    while len(ends) > 0:
+        end, thread_id = heapq.heappop(ends)
+        yield format_time_of_day(day, end), thread_id, None
+
+
+def write_ws_log(path: str, requests: Iterator[tuple[str, int, Optional[str]]], rng: random.Random,
+                 broken_entries: float) -> int:
+    """
+    Writes a raw WS log: latin-1 encoded, with Windows line breaks and some entries broken into two lines.
+    :return: The number of lines written
+    """
+    lines = 0
+    with open(path, "wb") as logfile:
+        batch = []
+        for timestamp, thread_id, request_type in requests:
+            if request_type is None:
+                batch.append("[{}] {} CMD-ENDE done\r\n".format(thread_id, timestamp))
+            elif rng.random() < broken_entries:
+                batch.append("[{}] {} CMD-START {} Daten\r\näöü\r\n".format(
+                    thread_id, timestamp, request_type
+                ))
+                lines += 1
+            else:
+                batch.append("[{}] {} CMD-START {} Daten äöü\r\n".format(
+                    thread_id, timestamp, request_type
+                ))
+
+            if len(batch) == 10000:
+                logfile.write("".join(batch).encode("latin-1"))
+                lines += len(batch)
+                batch.clear()
+
+        logfile.write("".join(batch).encode("latin-1"))
+        lines += len(batch)
+
+    return lines
+
+
+def write_ars_log(path: str, requests: Iterator[tuple[str, int, Optional[str]]]) -> int:
+    """
+    Writes a raw ARS log, every entry consists of two lines like ARSLogConverter expects.
+    :return: The number of lines written
+    """
+    lines = 0
+    with open(path, "w", newline="\r\n") as logfile:
+        batch = []
+        for timestamp, thread_id, request_type in requests:
+            if request_type is None:
+                batch.append("[{}] {} CMD-ENDE\ndone\n".format(thread_id, timestamp))
+            else:
+                batch.append("[{}] {} CMD-START {}\npayload\n".format(thread_id, timestamp, request_type))
+
+            if len(batch) == 10000:
+                logfile.writelines(batch)
+                lines += 2 * len(batch)
+                batch.clear()
+
+        logfile.writelines(batch)
+        lines += 2 * len(batch)
+
+    return lines
+
+
+def write_teastore_log(path: str, requests: Iterator[tuple[str, int, Optional[str]]]) -> int:
+    """
+    Writes a TeaStore command log, which needs neither fixing nor merging.
+    :return: The number of lines written
+    """
+    lines = 0
+    with open(path, "w") as logfile:
+        batch = []
+        for timestamp, thread_id, request_type in requests:
+            if request_type is None:
+                batch.append("[{}] {} CMD-ENDE done\n".format(thread_id, timestamp))
+            else:
+                batch.append("[{}] {} CMD-START {} payload\n".format(thread_id, timestamp, request_type))
+
+            if len(batch) == 10000:
+                logfile.writelines(batch)
+                lines += len(batch)
+                batch.clear()
+
+        logfile.writelines(batch)
+        lines += len(batch)
+
+    return lines
+
+
+def generate_day(directory: str, day: date, options: SyntheticLogOptions, system: str = "gs") -> dict[str, int]:
+    """
+    Generates the raw log files of one day.
+    :param system: "gs" for WS and ARS logs, "teastore" for a TeaStore command log
+    :return: The number of lines of every generated file
+    """
+    requests_of_day = options.lines_per_day // 2
+    request_types = get_request_types(options.request_types)
+
+    def rng_of(source: int, purpose: str = "requests") -> random.Random:
+        return random.Random("{}-{}-{}-{}".format(options.seed, day, source, purpose))
+
+    def requests_of(source: int, sources: int, types: list[str]):
+        requests = requests_of_day * (source + 1) // sources - requests_of_day * source // sources
+        return generate_requests(
+            day, requests, options.concurrency * requests / max(requests_of_day, 1), types,
+            rng_of(source), source * THREAD_IDS_PER_SOURCE + 1
+        )
+
+    lines_of_files = dict()
+
+    if system == "teastore":
+        path = join(directory, "teastore-cmd_{}.log".format(day))
+        lines_of_files[path] = write_teastore_log(path, requests_of(0, 1, request_types))
+        return lines_of_files
+
+    sources = options.sources + options.ars_sources
+    for source in range(options.sources):
+        path = join(directory, "Worker-cmd_{}_{}.log".format(day, source))
+        lines_of_files[path] = write_ws_log(
+            path, requests_of(source, sources, request_types), rng_of(source, "broken"), options.broken_entries
+        )
+
+    for source in range(options.sources, sources):
+        path = join(directory, "koppelcmd_{}_{}.log".format(day, source - options.sources))
+        lines_of_files[path] = write_ars_log(path, requests_of(source, sources, [ARS_REQUEST_TYPE]))
+
+    return lines_of_files
+
+
+def generate_logs(directory: str,
+                  first_day: date,
+                  days: int,
+                  options: SyntheticLogOptions,
+                  system: str = "gs") -> dict[str, int]:
+    """
+    Generates the raw log files of consecutive days.
+    :return: The number of lines of every generated file
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    lines_of_files = dict()
+    for i in range(days):
+        day = first_day + timedelta(days=i)
+        print("Generating logs of", day)
+        lines_of_files.update(generate_day(directory, day, options, system))
+
+    return lines_of_files
+
+
+def main():
+    defaults = SyntheticLogOptions()
+
+    parser = argparse.ArgumentParser(description='Generates synthetic raw command logs, '
+                                                 'e.g. as input for benchmarks.')
+    parser.add_argument('--directory', '-d',
+                        type=str,
+                        required=True,
+                        help='the directory the log files are written to')
+    parser.add_argument('--system',
+                        choices=["gs", "teastore"],
+                        default="gs",
+                        help='generate WS and ARS logs of the GS legacy system or TeaStore command logs')
+    parser.add_argument('--first-day',
+                        type=date.fromisoformat,
+                        default=date(2021, 3, 4),
+                        help='the day of the first log files, yyyy-mm-dd')
+    parser.add_argument('--days',
+                        type=int,
+                        default=1,
+                        help='the number of days to generate log files for')
+    parser.add_argument('--lines-per-day', '-l',
+                        type=int,
+                        default=defaults.lines_per_day,
+                        help='the number of command log lines per day, of all log files together')
+    parser.add_argument('--concurrency', '-c',
+                        type=float,
+                        default=defaults.concurrency,
+                        help='the mean number of requests in flight at the same time')
+    parser.add_argument('--request-types', '-r',
+                        type=int,
+                        default=defaults.request_types,
+                        help='the number of request types')
+    parser.add_argument('--sources', '-s',
+                        type=int,
+                        default=defaults.sources,
+                        help='the number of WS log files per day')
+    parser.add_argument('--ars-sources',
+                        type=int,
+                        default=defaults.ars_sources,
+                        help='the number of ARS log files per day')
+    parser.add_argument('--broken-entries',
+                        type=float,
+                        default=defaults.broken_entries,
+                        help='the fraction of WS log entries that are broken into two lines')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=defaults.seed,
+                        help='the seed of the random numbers, the same seed generates the same logs')
+
+    args = parser.parse_args()
+
+    options = SyntheticLogOptions(
+        lines_per_day=args.lines_per_day,
+        concurrency=args.concurrency,
+        request_types=args.request_types,
+        sources=args.sources,
+        ars_sources=args.ars_sources,
+        broken_entries=args.broken_entries,
+        seed=args.seed
+    )
+
+    lines_of_files = generate_logs(args.directory, args.first_day, args.days, options, args.system)
+    print("Generated {} lines in {} files".format(sum(lines_of_files.values()), len(lines_of_files)))
+
+
+if __name__ == "__main__":
+    main()
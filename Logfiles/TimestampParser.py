@@ -0,0 +1,136 @@
+import re
+from datetime import datetime
+
+from rast_common.main import StringUtils
+
+# yyyy-MM-dd HH:mm:ss, optionally followed by '.' or ',' and the fraction of the second.
+# Like strptime, the fields after the year may have a single digit, e.g. 2021-3-4 5:06:07
+_TIMESTAMP_PATTERN = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2}) (\d{1,2}):(\d{1,2}):(\d{1,2})")
+_TIMESTAMP_LENGTH = 19
+
+# The logs are ordered by time, so consecutive lines share the same second most of the time
+_MAX_CACHED_SECONDS = 100000
+_timestamps_by_second: dict[str, datetime] = dict()
+
+
+def _looks_like_timestamp(text: str, start: int) -> bool:
+    return len(text) >= start + _TIMESTAMP_LENGTH \
+        and text[start + 4] == '-' \
+        and text[start + 7] == '-' \
+        and text[start + 10] == ' ' \
+        and text[start + 13] == ':' \
+        and text[start + 16] == ':'
+
+
+def find_timestamp(text: str) -> int:
+    """
+    Returns the index the first timestamp in text starts at or -1 if there is none.
+    Checks the fixed offsets of our log formats first and only searches the whole text if they do not match:
+    * 2021-03-04 12:00:00.123456 ... (raw logs)
+    * [2021-03-04 12:00:00,123456] ... (Conv logs)
+    * [tid] 2021-03-04 12:00:00.123456 ... (command logs)
+    """
+    if _looks_like_timestamp(text, 0):
+        return 0
+    if _looks_like_timestamp(text, 1):
+        return 1
+
+    end_of_tid = text.find('] ')
+    if end_of_tid != -1 and _looks_like_timestamp(text, end_of_tid + 2):
+        return end_of_tid + 2
+
+    match = _TIMESTAMP_PATTERN.search(text)
+    if match is None:
+        return -1
+    return match.start()
+
+
+def parse_timestamp(text: str, start: int = 0) -> datetime:
+    """
+    Parses a timestamp in the format yyyy-MM-dd HH:mm:ss[.,]f that begins at the given index.
+    :param text: The text containing the timestamp
+    :param start: The index the timestamp begins at
+    :raises ValueError: if there is no valid timestamp at the index
+    """
+    if _looks_like_timestamp(text, start):
+        prefix = text[start:start + _TIMESTAMP_LENGTH]
+
+        timestamp = _timestamps_by_second.get(prefix)
+        if timestamp is None:
+            timestamp = datetime(int(prefix[0:4]), int(prefix[5:7]), int(prefix[8:10]),
+                                 int(prefix[11:13]), int(prefix[14:16]), int(prefix[17:19]))
+
+            if len(_timestamps_by_second) >= _MAX_CACHED_SECONDS:
+                _timestamps_by_second.clear()
+            _timestamps_by_second[prefix] = timestamp
+
+        fraction_start = start + _TIMESTAMP_LENGTH
+    else:
+        # fields with a single digit
+        match = _TIMESTAMP_PATTERN.match(text, start)
+        if match is None:
+            raise ValueError("No timestamp at index {} of '{}'".format(start, text))
+
+        timestamp = datetime(*(int(field) for field in match.groups()))
+        fraction_start = match.end()
+
+    if text[fraction_start:fraction_start + 1] not in ('.', ','):
+        return timestamp
+
+    fraction = text[fraction_start + 1:fraction_start + 7]
+    if not fraction.isdigit():
+        digits = 0
+        while digits < len(fraction) and fraction[digits].isdigit():
+            digits += 1
+        fraction = fraction[:digits]
+
+        if digits == 0:
+            return timestamp
+
+    # the fraction is left-aligned, just like %f does it: ',5' is 500000 microseconds
+    return timestamp.replace(microsecond=int(fraction.ljust(6, '0')))
+
+
+def get_timestamp_from_line(line: str) -> datetime:
+    """Drop-in replacement for StringUtils.get_timestamp_from_line."""
+    start = find_timestamp(line)
+    if start == -1:
+        return StringUtils.get_timestamp_from_line(line)
+
+    return parse_timestamp(line, start)
+
+
+def get_timestamp_from_string(line: str) -> datetime:
+    """Drop-in replacement for StringUtils.get_timestamp_from_string."""
+    start = find_timestamp(line)
+    if start == -1:
+        return StringUtils.get_timestamp_from_string(line)
+
+    return parse_timestamp(line, start)
+
+
+if __name__ == "__main__":
+    import random
+    import timeit
+    from datetime import timedelta
+
+    # micro-benchmark of the Conv log timestamps, the tests are in tests/test_TimestampParser.py
+    random.seed(42)
+    conv_lines = []
+    timestamp = datetime(2021, 3, 4)
+    for _ in range(50000):
+        timestamp += timedelta(microseconds=random.randint(0, 200000))
+        conv_lines.append(f"[{timestamp.strftime('%Y-%m-%d %H:%M:%S,%f'):26}] (PR:  1/ 2/ 0) ID_A")
+
+    def parse_with_strptime():
+        for line in conv_lines:
+            datetime.strptime(re.search('\\[.*\\]', line).group(), '[%Y-%m-%d %H:%M:%S,%f]')
+
+    def parse_with_parser():
+        for line in conv_lines:
+            get_timestamp_from_line(line)
+
+    strptime_duration = min(timeit.repeat(parse_with_strptime, number=1, repeat=3))
+    parser_duration = min(timeit.repeat(parse_with_parser, number=1, repeat=3))
+    print(f"strptime: {len(conv_lines) / strptime_duration:,.0f} lines/s")
+    print(f"parser:   {len(conv_lines) / parser_duration:,.0f} lines/s ({strptime_duration / parser_duration:.1f}x)")
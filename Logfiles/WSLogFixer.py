@@ -1,17 +1,42 @@
 import argparse
-import glob
 import os
-from os import SEEK_SET
-from os.path import join
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+from typing import Iterable, Iterator
 
 from rast_common.main.StringUtils import dir_path
 
+from CompressedLogFiles import open_log_file, glob_log_files
+from StageMetrics import get_stage_metrics, run_with_stage_metrics, add_instrumentation_arguments, instrument
 
-def peek_line(f):
-    line = f.readline()
-    count = len(line) + 1
-    f.seek(f.tell() - count, SEEK_SET)
-    return line
+
+def read_lines(path: str) -> Iterator[str]:
+    """
+    Reads the lines of a latin-1 encoded file in text mode, through the read buffer of the file object.
+    Only '\n', '\r\n' and '\r' end a line, they all become '\n'. Unlike str.splitlines(),
+    characters like '\x85' or '\x0c' in a log message stay within its line.
+    """
+    with open_log_file(path, encoding="latin-1") as logfile:
+        yield from logfile
+
+
+def fix_lines(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Merges the lines of a log entry that contains line breaks, with one line of lookahead:
+    a line and the next one are kept apart if both start with '[', otherwise they are merged.
+    """
+    lines = iter(lines)
+
+    first_line = next(lines, "")
+    while first_line:
+        second_line = next(lines, "")
+
+        if first_line.startswith('[') and second_line.startswith('['):
+            yield first_line
+            first_line = second_line
+        else:
+            yield "{}{}\n".format(first_line.rstrip('\n'), second_line.strip())
+            first_line = next(lines, "")
 
 
 def fix_log(path: str):
@@ -33,27 +58,21 @@ def fix_log(path: str):
             return
         target_path = path.replace("WSCmd", "WSCmd_f")
 
-    print("Converting ", path)
-    with open(path, encoding="latin-1") as logfile:
-        with open(target_path, mode="w") as targetFile:
-            counter = 0
-
-            first_line = logfile.readline()
-            while first_line:
-                second_line = peek_line(logfile)
+    metrics = get_stage_metrics()
 
-                counter = counter + 1
-                if counter % 10000 == 0:
-                    print("Processed {} entries".format(counter))
+    print("Converting ", path)
+    with metrics.file(path), open_log_file(target_path, mode="w") as targetFile:
+        lines = fix_lines(read_lines(path))
+        while True:
+            with metrics.phase("parse"):
+                batch = list(islice(lines, 10000))
+            if len(batch) == 0:
+                break
 
-                if first_line.startswith('[') and second_line.startswith('['):
-                    targetFile.write(first_line)
-                else:
-                    targetFile.write("{}{}\n".format(first_line.rstrip('\n'),
-                                                     second_line.strip()))
-                    logfile.readline()  # consume second line
+            with metrics.phase("write"):
+                targetFile.writelines(batch)
 
-                first_line = logfile.readline()
+            metrics.count_lines(len(batch))
 
 
 if __name__ == "__main__":
@@ -65,6 +84,11 @@ if __name__ == "__main__":
     parser.add_argument('--directory', '-d',
                         type=dir_path,
                         help='the directory the log files are located in')
+    parser.add_argument('--jobs', '-j',
+                        type=int,
+                        default=1,
+                        help='the number of log files to fix in parallel')
+    add_instrumentation_arguments(parser)
 
     args = parser.parse_args()
 
@@ -72,15 +96,28 @@ if __name__ == "__main__":
         parser.print_help()
         exit(1)
 
-    logfilesToConvert = args.files if args.files is not None else []
-
-    if args.directory is not None:
-        logfiles = glob.glob(join(args.directory, '**', 'Worker-cmd*.log'), recursive=True)
-        logfiles.extend(glob.glob(join(args.directory, '**', 'WSCmd*.log'), recursive=True))
-        logfilesToConvert.extend(logfiles)
-
-    print("Logs to convert: \n" + "\n".join(logfilesToConvert))
-
-    for path in logfilesToConvert:
-        fix_log(path)
-        os.remove(path)
+    with instrument("WSLogFixer", args.report, args.profile, args.profile_output) as metrics:
+        logfilesToConvert = args.files if args.files is not None else []
+
+        if args.directory is not None:
+            logfiles = glob_log_files(args.directory, 'Worker-cmd*.log')
+            logfiles.extend(glob_log_files(args.directory, 'WSCmd*.log'))
+            logfilesToConvert.extend(logfiles)
+
+        print("Logs to convert: \n" + "\n".join(logfilesToConvert))
+
+        if args.jobs <= 1:
+            for path in logfilesToConvert:
+                fix_log(path)
+                os.remove(path)
+        else:
+            with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+                futures = {
+                    executor.submit(run_with_stage_metrics, fix_log, path): path for path in logfilesToConvert
+                }
+
+                for finished, future in enumerate(as_completed(futures), start=1):
+                    _, metrics_of_file = future.result()
+                    metrics.merge(metrics_of_file)
+                    os.remove(futures[future])
+                    print("Finished fixing {} ({}/{} files)".format(futures[future], finished, len(futures)))
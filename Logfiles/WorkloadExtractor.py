@@ -1,165 +1,559 @@
 import argparse
 import contextlib
 import datetime
-import glob
+import io
+import os
 import re
-from os.path import join
-from typing import Optional
-
-from rast_common.main.StringUtils import dir_path, get_timestamp_from_line
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import groupby, repeat
+from typing import Optional, Iterable, Iterator, Callable, Sequence
+
+import numpy as np
+from rast_common.main.StringUtils import dir_path
 from rast_common.main.StringUtils import get_date_from_string
 
+from CompressedLogFiles import open_log_file, glob_log_files, is_compressed
+from StageMetrics import get_stage_metrics, run_with_stage_metrics, add_instrumentation_arguments, instrument
+from TimestampParser import get_timestamp_from_line
+
+# the kinds of lines in a command log
+CMD_START = "CMD-START"
+CMD_END = "CMD-ENDE"
+
+_REQUEST_ID_PATTERN = re.compile(r"ID_\w+")
+
+
+class LogEvent:
+    """A line of a command log, parsed once for all trackers."""
+
+    __slots__ = ("line", "kind", "request_id", "_timestamp")
+
+    def __init__(self, line: str, kind: Optional[str], request_id: Optional[str]):
+        self.line = line
+        # CMD_START, CMD_END or None for other lines
+        self.kind = kind
+        self.request_id = request_id
+        self._timestamp: Optional[datetime.datetime] = None
+
+    @property
+    def timestamp(self) -> datetime.datetime:
+        # parsed on first use, most trackers do not need the timestamp of most lines
+        if self._timestamp is None:
+            self._timestamp = get_timestamp_from_line(self.line)
+        return self._timestamp
+
+
+def parse_log_line(line: str) -> LogEvent:
+    if CMD_START in line:
+        kind = CMD_START
+    elif CMD_END in line:
+        kind = CMD_END
+    else:
+        kind = None
+
+    s = _REQUEST_ID_PATTERN.search(line)
+
+    return LogEvent(line, kind, s.group() if s is not None else None)
 
-class RequestFilter:
-    def __init__(self, source_file_path: str, request_type: str):
+
+class LogEventTracker(ABC):
+    """
+    Base class of the analyses of command logs.
+    A LogEventDispatcher parses every line once and hands the event to all registered trackers,
+    so another analysis does not add another parse of every line.
+    """
+
+    # the kinds of events the tracker is interested in, None for all of them
+    kinds: Optional[frozenset] = None
+
+    @abstractmethod
+    def process_event(self, event: LogEvent):
+        pass
+
+    def process_log_line(self, line: str):
+        event = parse_log_line(line)
+        if self.kinds is None or event.kind in self.kinds:
+            self.process_event(event)
+
+    def get_partial_result(self):
         """
-        :param source_file_path: The path to a command log file.
+        Returns what the tracker collected from the lines it processed, for instance from a chunk of a log file
+        processed by a worker. It has to be picklable.
+        Only trackers that process the chunks of log files in parallel, see extract_workload_in_parallel,
+        have to implement it and merge_partial_result.
+        """
+        raise NotImplementedError("{} cannot process chunks in parallel".format(type(self).__name__))
+
+    def merge_partial_result(self, partial_result):
+        """Merges a partial result into the tracker, as if it had processed the lines of the partial result itself."""
+        raise NotImplementedError("{} cannot process chunks in parallel".format(type(self).__name__))
+
+    def close(self):
+        pass
+
+
+class LogEventDispatcher:
+    def __init__(self, trackers: Iterable[LogEventTracker] = ()):
+        self._trackers = []
+        # the trackers to hand the events of each kind to
+        self._trackers_by_kind: dict[Optional[str], list[LogEventTracker]] = {
+            kind: [] for kind in (CMD_START, CMD_END, None)
+        }
+
+        for tracker in trackers:
+            self.register(tracker)
+
+    def register(self, tracker: LogEventTracker) -> LogEventTracker:
+        self._trackers.append(tracker)
+        self._update_trackers_by_kind()
+        return tracker
+
+    def unregister(self, tracker: LogEventTracker):
+        self._trackers.remove(tracker)
+        self._update_trackers_by_kind()
+
+    def _update_trackers_by_kind(self):
+        for kind, trackers in self._trackers_by_kind.items():
+            trackers[:] = [tracker for tracker in self._trackers if tracker.kinds is None or kind in tracker.kinds]
+
+    def process_log_line(self, line: str) -> LogEvent:
+        event = parse_log_line(line)
+
+        for tracker in self._trackers_by_kind[event.kind]:
+            tracker.process_event(event)
+
+        return event
+
+    def process_log_lines(self, lines: Iterable[str]) -> int:
+        """Dispatches the events of all lines and returns the number of lines."""
+        trackers_by_kind = self._trackers_by_kind
+        metrics = get_stage_metrics()
+
+        counter = 0
+        for line in lines:
+            counter = counter + 1
+            if counter % 20000 == 0:
+                metrics.count_lines(20000)
+
+            event = parse_log_line(line)
+
+            for tracker in trackers_by_kind[event.kind]:
+                tracker.process_event(event)
+
+        metrics.count_lines(counter % 20000)
+        return counter
+
+
+class RequestFilter(LogEventTracker):
+    def __init__(self,
+                 source_file_path: Optional[str],
+                 request_type: str,
+                 target_path: Optional[str] = None,
+                 temp_directory: Optional[str] = None):
+        """
+        :param source_file_path: The path to a command log file, None to only collect the lines in a temporary file
         :param request_type: The type of request to include in the output. All other request types are omitted.
+        :param target_path: Write the output to this file instead of the one next to the command log file.
+        :param temp_directory: Where the temporary file is created, defaults to the system temp directory
         """
 
-        from pathlib import Path
-        target_path = Path(source_file_path) \
-            .with_name("Request_Statistics") \
-            .with_suffix(".log")
+        if target_path is None and source_file_path is None:
+            file_descriptor, target_path = tempfile.mkstemp(suffix=".log", dir=temp_directory)
+            os.close(file_descriptor)
+        elif target_path is None:
+            from pathlib import Path
+            target_path = Path(source_file_path) \
+                .with_name("Request_Statistics") \
+                .with_suffix(".log")
 
-        print("Writing to ", target_path)
+            print("Writing to ", target_path)
+
+        self._target_path = str(target_path)
         self._target_file = open(target_path, mode="w")
 
         self._request_type = request_type
 
-    def process_log_line(self, line: str):
-        s = re.search(r"ID_\w+", line)
-        if s is None:
-            return
+    def process_event(self, event: LogEvent):
+        if event.request_id == self._request_type:
+            self._target_file.write(f"{event.line}\n")
 
-        cmd = s.group()
+    def get_partial_result(self) -> str:
+        """Returns the path of the output, which is complete once the filter is closed."""
+        return self._target_path
 
-        if cmd == self._request_type:
-            self._target_file.write(f"{line}\n")
+    def merge_partial_result(self, partial_result: str):
+        """Appends the output of another filter to the output and removes it."""
+        with open(partial_result) as partial_file:
+            shutil.copyfileobj(partial_file, self._target_file)
+        os.remove(partial_result)
 
+    def close(self):
+        self._target_file.close()
 
-class RequestNamesTracker:
-    def __init__(self, source_file_path: str):
-        self._known_request_names = set()
 
-        from pathlib import Path
-        target_path = Path(source_file_path) \
-            .with_name("Request_Names") \
-            .with_suffix(".log")
+class RequestNamesTracker(LogEventTracker):
+    kinds = frozenset({CMD_START})
 
-        print("Writing to ", target_path)
-        self._target_file = open(target_path, mode="w")
+    def __init__(self, source_file_path: Optional[str] = None):
+        """:param source_file_path: The path to a command log file, None to only collect the names"""
+        # the names in the order they appeared in
+        self._known_request_names: dict[str, None] = dict()
 
-    def process_log_line(self, line: str):
-        if "CMD-START" not in line:
-            return
+        self._target_file = None
+        if source_file_path is not None:
+            from pathlib import Path
+            target_path = Path(source_file_path) \
+                .with_name("Request_Names") \
+                .with_suffix(".log")
 
-        s = re.search(r"ID_\w+", line)
-        if s is None:
+            print("Writing to ", target_path)
+            self._target_file = open(target_path, mode="w")
+
+    def process_event(self, event: LogEvent):
+        if event.request_id is None:
             return
 
-        cmd = s.group()
+        self._add_request_name(event.request_id)
 
+    def _add_request_name(self, cmd: str):
         if cmd not in self._known_request_names:
-            self._known_request_names.add(cmd)
+            self._known_request_names[cmd] = None
+
+            if self._target_file is not None:
+                self._target_file.write(f"{cmd}\n")
+
+    def get_partial_result(self) -> list[str]:
+        return list(self._known_request_names)
 
-            self._target_file.write(f"{cmd}\n")
+    def merge_partial_result(self, partial_result: list[str]):
+        for cmd in partial_result:
+            self._add_request_name(cmd)
 
     def close(self):
-        self._target_file.close()
+        if self._target_file is not None:
+            self._target_file.close()
+
+
+class RequestsPerSecondTracker(LogEventTracker):
+    """
+    Counts the requests per second and per hour. A window starts with a request and ends before the first request
+    that is more than a second (an hour) later, which starts the next window.
 
+    The timestamps of the requests are collected and the windows determined when the tracker is closed,
+    so that the timestamps collected from the chunks of a log file in parallel can simply be put together.
+    """
 
-class RequestsPerSecondTracker:
-    def __init__(self, source_file_path: str):
-        self._requests_per_second_counter = 0
-        self._requests_per_second_start_time: Optional[datetime] = None
+    kinds = frozenset({CMD_START})
 
-        self._requests_per_hour_counter = 0
-        self._requests_per_hour_start_time: Optional[datetime] = None
+    # number of timestamps that are collected in a list before they are moved to a more compact array
+    _TIMESTAMPS_PER_ARRAY = 100000
+
+    _EPOCH = datetime.datetime(1970, 1, 1)
+    _MICROSECOND = datetime.timedelta(microseconds=1)
+
+    def __init__(self, source_file_path: Optional[str] = None):
+        """:param source_file_path: The path to a command log file, None to only collect the timestamps"""
+        # microseconds since the epoch
+        self._timestamps: list[int] = []
+        self._timestamp_arrays: list[np.ndarray] = []
 
         self._tracked_data = []
-        self._total_amount_of_requests = 0
 
         # GS-specific: Ignore the requests that are send to the ARS by the alarm devices
         self.IGNORE_REQUESTS = {'ID_REQ_KC_STORE7D3BPACKET'}
 
-        from pathlib import Path
-        name_of_log_file = Path(source_file_path).name
-        target_path = Path(source_file_path) \
-            .with_name("Requests_per_time_unit_{}".format(get_date_from_string(name_of_log_file))) \
-            .with_suffix(".log")
-
-        print("Writing to ", target_path)
-        self._target_file = open(target_path, mode="w")
+        self._target_file = None
+        if source_file_path is not None:
+            from pathlib import Path
+            name_of_log_file = Path(source_file_path).name
+            target_path = Path(source_file_path) \
+                .with_name("Requests_per_time_unit_{}".format(get_date_from_string(name_of_log_file))) \
+                .with_suffix(".log")
 
-    def process_log_line(self, line: str):
-        if "CMD-START" not in line:
-            return
+            print("Writing to ", target_path)
+            self._target_file = open(target_path, mode="w")
 
+    def process_event(self, event: LogEvent):
+        # anywhere in the line, not only the request id
         for request_to_ignore in self.IGNORE_REQUESTS:
-            if request_to_ignore in line:
+            if request_to_ignore in event.line:
                 return
 
-        self._total_amount_of_requests += 1
+        self._timestamps.append((event.timestamp - self._EPOCH) // self._MICROSECOND)
+        if len(self._timestamps) >= self._TIMESTAMPS_PER_ARRAY:
+            self._move_timestamps_to_array()
+
+    def _move_timestamps_to_array(self):
+        if len(self._timestamps) > 0:
+            self._timestamp_arrays.append(np.array(self._timestamps, dtype=np.int64))
+            self._timestamps = []
+
+    def get_partial_result(self) -> np.ndarray:
+        """Returns the timestamps of the requests in microseconds since the epoch, in the order they were processed."""
+        self._move_timestamps_to_array()
+        return np.concatenate(self._timestamp_arrays) if len(self._timestamp_arrays) > 0 \
+            else np.empty(0, dtype=np.int64)
+
+    def merge_partial_result(self, partial_result: np.ndarray):
+        self._move_timestamps_to_array()
+        self._timestamp_arrays.append(partial_result)
+
+    def _write_windows_into_log(self) -> int:
+        """Writes the requests per second and hour into the log, returns the number of requests."""
+        microseconds = self.get_partial_result()
+
+        # (request that ended the window, hour window?, request that started it),
+        # ordered like they were written when the windows were still tracked request by request
+        windows = []
+        for window_length, is_hour in ((1000000, False), (3600 * 1000000, True)):
+            starts = _get_window_starts(microseconds, window_length)
+            windows.extend(zip(starts[1:] + [len(microseconds)], [is_hour] * len(starts), starts))
+        windows.sort()
+
+        for end, is_hour, start in windows:
+            start_time = self._EPOCH + int(microseconds[start]) * self._MICROSECOND
+            timestamp = start_time.strftime('%Y-%m-%d %H:%M:%S')
+
+            if is_hour:
+                self._tracked_data.append({"timestamp": start_time, "rph": end - start})
+                self._target_file.write(f"{timestamp}\tRPH: {end - start}/h\n")
+            else:
+                self._tracked_data.append({"timestamp": start_time, "rps": end - start})
+                self._target_file.write(f"{timestamp}\tRPS: {end - start}/s\n")
+
+        return len(microseconds)
 
-        timestamp_of_request = get_timestamp_from_line(line)
+    def close(self):
+        if self._target_file is None:
+            return
 
-        if self._requests_per_second_start_time is None:
-            self._requests_per_second_start_time = timestamp_of_request
+        total_amount_of_requests = self._write_windows_into_log()
 
-        if self._requests_per_hour_start_time is None:
-            self._requests_per_hour_start_time = timestamp_of_request
+        self._target_file.write(f"Total count: {total_amount_of_requests}\n")
 
-        difference = (timestamp_of_request - self._requests_per_second_start_time)
-        if difference.total_seconds() > 1:
-            self._write_requests_per_second_into_log(timestamp_of_request)
+        self._target_file.close()
 
-        difference = (timestamp_of_request - self._requests_per_hour_start_time)
-        if difference.total_seconds() > 3600:
-            self._write_requests_per_hour_into_log(timestamp_of_request)
+        # from pandas import DataFrame
+        # df = DataFrame.from_records(self._tracked_data)
+        #
+        # print(df)
 
-        self._requests_per_second_counter += 1
-        self._requests_per_hour_counter += 1
 
-    def _write_requests_per_second_into_log(self, timestamp_of_last_request):
-        timestamp = self._requests_per_second_start_time.strftime('%Y-%m-%d %H:%M:%S')
+def _get_window_starts(microseconds: np.ndarray, window_length: int) -> list[int]:
+    """
+    Returns the indices of the requests that start a window: the first request and every request
+    that is more than window_length microseconds after the request that started the previous window.
+    """
+    if len(microseconds) == 0:
+        return []
 
-        self._tracked_data.append(
-            {"timestamp": self._requests_per_second_start_time, "rps": self._requests_per_second_counter})
-        self._target_file.write(f"{timestamp}\tRPS: {self._requests_per_second_counter}/s\n")
-        self._requests_per_second_counter = 0
-        self._requests_per_second_start_time = timestamp_of_last_request
+    starts = [0]
 
-    def _write_requests_per_hour_into_log(self, timestamp_of_last_request):
-        timestamp = self._requests_per_hour_start_time.strftime('%Y-%m-%d %H:%M:%S')
+    if np.all(microseconds[1:] >= microseconds[:-1]):
+        # the request that starts the window after each request's window
+        next_starts = np.searchsorted(microseconds, microseconds + window_length, side="right")
 
-        self._tracked_data.append(
-            {"timestamp": self._requests_per_hour_start_time, "rph": self._requests_per_hour_counter})
-        self._target_file.write(f"{timestamp}\tRPH: {self._requests_per_hour_counter}/h\n")
-        self._requests_per_hour_counter = 0
-        self._requests_per_hour_start_time = timestamp_of_last_request
+        start = 0
+        while next_starts[start] < len(microseconds):
+            start = int(next_starts[start])
+            starts.append(start)
+    else:
+        # requests that are not ordered by time
+        microseconds = microseconds.tolist()
+        start_time = microseconds[0]
+        for index, timestamp in enumerate(microseconds):
+            if timestamp - start_time > window_length:
+                starts.append(index)
+                start_time = timestamp
 
-    def close(self):
-        self._write_requests_per_second_into_log(None)
-        self._write_requests_per_hour_into_log(None)
+    return starts
 
-        self._target_file.write(f"Total count: {self._total_amount_of_requests}\n")
 
-        self._target_file.close()
+# Creates a tracker given the path of the command log file it writes its output next to. The workers that process
+# chunks of log files in parallel create their trackers with None, those only collect their partial results.
+# The factories are passed to the workers, so they have to be picklable: classes and functools.partial objects are,
+# lambdas are not.
+TrackerFactory = Callable[[Optional[str]], LogEventTracker]
+
+# the trackers of each log file, which are created anew for every log file
+DEFAULT_FILE_TRACKER_FACTORIES: list[TrackerFactory] = [RequestsPerSecondTracker]
 
-        # from pandas import DataFrame
-        # df = DataFrame.from_records(self._tracked_data)
-        #
-        # print(df)
+
+def get_default_tracker_factories(request_type: str, temp_directory: Optional[str] = None) -> list[TrackerFactory]:
+    """
+    Returns the factories of the trackers of all log files together: the request names and the request filter.
+    :param request_type: The type of request to write to Request_Statistics.log
+    :param temp_directory: Where the request filters of the workers write their output to
+    """
+    return [RequestNamesTracker, partial(RequestFilter, request_type=request_type, temp_directory=temp_directory)]
 
 
 @contextlib.contextmanager
-def rps_tracker(path):
-    theobj = RequestsPerSecondTracker(path)
+def create_trackers(tracker_factories: Sequence[TrackerFactory], path: Optional[str]):
+    """Creates the trackers of the path and closes them when done."""
+    trackers = []
     try:
-        yield theobj
+        for tracker_factory in tracker_factories:
+            trackers.append(tracker_factory(path))
+        yield trackers
     finally:
-        theobj.close()
+        for tracker in trackers:
+            tracker.close()
+
+
+def extract_workload(logfiles: list[str],
+                     request_type: str,
+                     tracker_factories: Optional[Sequence[TrackerFactory]] = None,
+                     file_tracker_factories: Optional[Sequence[TrackerFactory]] = None) -> int:
+    """
+    Extracts the workload of the log files one after another, returns the number of lines processed.
+    :param request_type: The type of request to write to Request_Statistics.log
+    :param tracker_factories: Create the trackers of all log files together, with the path of the first log file,
+                              defaults to get_default_tracker_factories
+    :param file_tracker_factories: Create the trackers of each log file, with its path,
+                                   defaults to DEFAULT_FILE_TRACKER_FACTORIES
+    """
+    if tracker_factories is None:
+        tracker_factories = get_default_tracker_factories(request_type)
+    if file_tracker_factories is None:
+        file_tracker_factories = DEFAULT_FILE_TRACKER_FACTORIES
+
+    metrics = get_stage_metrics()
+
+    line_counter = 0
+
+    with create_trackers(tracker_factories, logfiles[0]) as trackers:
+        dispatcher = LogEventDispatcher(trackers)
+
+        for path in logfiles:
+            print("Reading from %s" % path)
+            with metrics.file(path), open_log_file(path) as logfile, \
+                    create_trackers(file_tracker_factories, path) as trackers_of_file:
+                for tracker in trackers_of_file:
+                    dispatcher.register(tracker)
+
+                line_counter += dispatcher.process_log_lines(logfile)
+
+                for tracker in trackers_of_file:
+                    dispatcher.unregister(tracker)
+
+    return line_counter
+
+
+def get_chunks_of_log_file(path: str, chunk_size: int) -> list[tuple[int, int]]:
+    """
+    Splits a log file into byte ranges of about chunk_size bytes that start and end at the start of a line.
+    Compressed log files cannot be split, they are one chunk.
+    """
+    size = os.path.getsize(path)
+    if is_compressed(path):
+        return [(0, size)]
+
+    chunks = []
+    with open(path, "rb") as file:
+        start_offset = 0
+        while start_offset < size:
+            file.seek(start_offset + chunk_size - 1)
+            # move to the start of the next line
+            file.readline()
+            end_offset = min(file.tell(), size)
+
+            chunks.append((start_offset, end_offset))
+            start_offset = end_offset
+
+    return chunks
+
+
+def read_lines_of_chunk(path: str, start_offset: int, end_offset: int) -> Iterator[str]:
+    """Yields the lines of a chunk of a log file, decoded just like open(path) does it."""
+    if is_compressed(path):
+        with open_log_file(path) as logfile:
+            yield from logfile
+        return
+
+    with open(path, "rb") as file:
+        file.seek(start_offset)
+        data = file.read(end_offset - start_offset)
+
+    yield from io.TextIOWrapper(io.BytesIO(data))
+
+
+def extract_workload_of_chunk(path: str,
+                              start_offset: int,
+                              end_offset: int,
+                              tracker_factories: Sequence[TrackerFactory]) -> tuple[int, list]:
+    """
+    Processes a chunk of a log file in a worker.
+    Returns the number of lines and the partial results of the trackers, in the order of their factories.
+    """
+    with get_stage_metrics().file(path, size=end_offset - start_offset), \
+            create_trackers(tracker_factories, None) as trackers:
+        line_counter = LogEventDispatcher(trackers).process_log_lines(
+            read_lines_of_chunk(path, start_offset, end_offset)
+        )
+
+    return line_counter, [tracker.get_partial_result() for tracker in trackers]
+
+
+def extract_workload_in_parallel(logfiles: list[str],
+                                 request_type: str,
+                                 jobs: int,
+                                 chunk_size: int,
+                                 temp_directory: Optional[str] = None,
+                                 tracker_factories: Optional[Sequence[TrackerFactory]] = None,
+                                 file_tracker_factories: Optional[Sequence[TrackerFactory]] = None) -> int:
+    """
+    Extracts the workload of chunks of the log files in parallel and merges the partial results in the order of
+    the chunks, the output equals the one of extract_workload. Returns the number of lines processed.
+    :param temp_directory: Where the workers write the output of their request filters to,
+                           defaults to the system temp directory
+    :param tracker_factories: Create the trackers of all log files together, see extract_workload.
+                              Their trackers have to implement the partial results.
+    :param file_tracker_factories: Create the trackers of each log file, see extract_workload
+    """
+    chunks = [
+        (path, start_offset, end_offset)
+        for path in logfiles
+        for start_offset, end_offset in get_chunks_of_log_file(path, chunk_size)
+    ]
+    print("Processing {} chunks of {} files".format(len(chunks), len(logfiles)))
+
+    metrics = get_stage_metrics()
+
+    line_counter = 0
+
+    with tempfile.TemporaryDirectory(prefix="WorkloadExtractor_", dir=temp_directory) as chunk_directory, \
+            ProcessPoolExecutor(max_workers=jobs) as executor:
+        if tracker_factories is None:
+            tracker_factories = get_default_tracker_factories(request_type, chunk_directory)
+        if file_tracker_factories is None:
+            file_tracker_factories = DEFAULT_FILE_TRACKER_FACTORIES
+
+        with create_trackers(tracker_factories, logfiles[0]) as trackers:
+            results = executor.map(
+                run_with_stage_metrics,
+                repeat(extract_workload_of_chunk),
+                *zip(*chunks),
+                repeat([*tracker_factories, *file_tracker_factories])
+            )
+
+            for path, results_of_file in groupby(zip(chunks, results),
+                                                 key=lambda chunk_and_result: chunk_and_result[0][0]):
+                with create_trackers(file_tracker_factories, path) as trackers_of_file:
+                    for _, ((number_of_lines, partial_results), metrics_of_chunk) in results_of_file:
+                        line_counter += number_of_lines
+                        metrics.merge(metrics_of_chunk)
+
+                        for tracker, partial_result in zip([*trackers, *trackers_of_file], partial_results):
+                            tracker.merge_partial_result(partial_result)
+
+                print("Finished {}".format(path))
+
+    return line_counter
 
 
 if __name__ == "__main__":
@@ -173,6 +567,19 @@ if __name__ == "__main__":
     parser.add_argument('--directory', '-d',
                         type=dir_path,
                         help='the directory the log files are located in')
+    parser.add_argument('--jobs', '-j',
+                        type=int,
+                        default=1,
+                        help='the number of chunks of the log files to process in parallel')
+    parser.add_argument('--chunk-size', '-c',
+                        type=int,
+                        default=64,
+                        help='the size of the chunks the log files are split into in megabytes, '
+                             'when they are processed in parallel')
+    parser.add_argument('--temp-directory', '-t',
+                        type=dir_path,
+                        help='the directory the chunks processed in parallel write their temporary files to')
+    add_instrumentation_arguments(parser)
 
     args = parser.parse_args()
 
@@ -180,40 +587,31 @@ if __name__ == "__main__":
         parser.print_help()
         exit(1)
 
-    logfilesToConvert = args.files if args.files is not None else []
-
-    if args.directory is not None:
-        logfiles = glob.glob(join(args.directory, '**', 'Merged_*.log'), recursive=True)
-        logfiles.extend(glob.glob(join(args.directory, '**', "teastore-cmd_*.log"), recursive=True))
-        logfilesToConvert.extend(logfiles)
-
-    # remove duplicates trick
-    logfilesToConvert = sorted(set(logfilesToConvert))
-
-    print("Logs to convert: " + str(logfilesToConvert))
-
-    request_names_tracker = RequestNamesTracker(logfilesToConvert[0])
-
-    request_statistics = RequestFilter(logfilesToConvert[0], 'ID_REQ_KC_STORE7D3BPACKET')
-
-    line_counter = 0
+    if args.chunk_size <= 0:
+        parser.error("--chunk-size must be at least 1 megabyte")
 
-    for path in logfilesToConvert:
-        print("Reading from %s" % path)
-        with open(path) as logfile, rps_tracker(path) as requests_per_second_tracker:
-            counter = 0
+    with instrument("WorkloadExtractor", args.report, args.profile, args.profile_output):
+        logfilesToConvert = args.files if args.files is not None else []
 
-            for line in logfile:
-                counter = counter + 1
-                if counter % 20000 == 0:
-                    print("Processed {} entries".format(counter))
+        if args.directory is not None:
+            logfiles = glob_log_files(args.directory, 'Merged_*.log')
+            logfiles.extend(glob_log_files(args.directory, "teastore-cmd_*.log"))
+            logfilesToConvert.extend(logfiles)
 
-                requests_per_second_tracker.process_log_line(line)
-                request_names_tracker.process_log_line(line)
-                request_statistics.process_log_line(line)
+        # remove duplicates trick
+        logfilesToConvert = sorted(set(logfilesToConvert))
 
-            line_counter += counter
+        print("Logs to convert: " + str(logfilesToConvert))
 
-    request_names_tracker.close()
+        if args.jobs <= 1:
+            line_counter = extract_workload(logfilesToConvert, 'ID_REQ_KC_STORE7D3BPACKET')
+        else:
+            line_counter = extract_workload_in_parallel(
+                logfilesToConvert,
+                'ID_REQ_KC_STORE7D3BPACKET',
+                args.jobs,
+                args.chunk_size * 1024 * 1024,
+                args.temp_directory
+            )
 
-    print(f"Total lines processed: {line_counter}")
+        print(f"Total lines processed: {line_counter}")
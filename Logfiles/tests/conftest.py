@@ -0,0 +1,5 @@
+import sys
+from os.path import dirname, abspath
+
+# the scripts of Logfiles import each other as top level modules
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
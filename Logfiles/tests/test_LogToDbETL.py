@@ -0,0 +1,113 @@
+import contextlib
+import io
+import json
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from os.path import join, dirname, abspath
+
+from rast_common.main.TrainingDatabase import create_training_data_table, TrainingDataRow
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.orm import Session
+
+from Common import read_data_line_from_log_file
+from EtlProgress import create_etl_progress_table, get_etl_progress
+from LogToDbETL import EnrichmentOptions, get_segment_to_process, create_training_data_rows_for_log_file, \
+    write_training_data_in_batches, etl_progress_key
+from SwitchFlowStatsTable import create_switch_flow_stats_table, switch_flow_stats_table
+
+# a Conv log of 1477 entries and its request statistics
+DATA_DIRECTORY = join(dirname(abspath(__file__)), "data", "request_log", "expected")
+
+
+def write_switch_flow_stats(path: str, switches: int):
+    start = datetime(2021, 3, 4)
+    with open(path, "w") as file:
+        json.dump([
+            {
+                "switch_id": "s{}".format(switch + 1),
+                "samples": [
+                    {
+                        "timestamp": (start + timedelta(seconds=second, microseconds=250000)).isoformat(),
+                        "bytes_per_second": 1000 * switch + second,
+                        "packets_per_second": second
+                    }
+                    for second in range(0, 600, 2)
+                ]
+            }
+            for switch in range(switches)
+        ], file)
+
+
+def fail_after(training_data_rows, count: int):
+    for number, training_data_row in enumerate(training_data_rows):
+        if number == count:
+            raise RuntimeError("interrupted")
+        yield training_data_row
+
+
+class ResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log_file = shutil.copy(join(DATA_DIRECTORY, "Conv_2021-03-04.log"), self.directory)
+        shutil.copy(join(DATA_DIRECTORY, "request_statistics_2021-03-04.json"), self.directory)
+        write_switch_flow_stats(join(self.directory, "switch_flow_stats_2021-03-04.json"), switches=2)
+
+        db = create_engine("sqlite:///" + join(self.directory, "trainingdata.db"))
+        create_training_data_table(db)
+        create_etl_progress_table(db)
+        create_switch_flow_stats_table(db)
+        self.session = Session(db)
+
+    def tearDown(self):
+        self.session.close()
+        shutil.rmtree(self.directory)
+
+    def process(self, all_switches: bool, interrupt_after: int = None):
+        segment = get_segment_to_process(self.session, self.log_file)
+        options = EnrichmentOptions(all_switches=all_switches)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            training_data_rows = create_training_data_rows_for_log_file(self.log_file, segment, options)
+            if interrupt_after is not None:
+                training_data_rows = fail_after(training_data_rows, interrupt_after)
+
+            write_training_data_in_batches(self.session, self.log_file, training_data_rows, 200, segment)
+
+    def test_resume_with_other_switches(self):
+        with self.assertRaises(RuntimeError):
+            self.process(all_switches=False, interrupt_after=500)
+        self.session.rollback()
+
+        progress = get_etl_progress(self.session, etl_progress_key(self.log_file))
+        self.assertEqual(400, progress.entries_committed)
+        with open(self.log_file, "rb") as file:
+            committed = file.read(progress.byte_offset)
+        # right after the line of the 400th entry, the Conv log has one entry per line
+        self.assertEqual(400, committed.count(b"\n"))
+        self.assertTrue(committed.endswith(b"\n"))
+
+        self.process(all_switches=True)
+
+        entries = list(read_data_line_from_log_file(self.log_file))
+        training_data = self.session.execute(
+            select(TrainingDataRow.timestamp, TrainingDataRow.response_time).order_by(TrainingDataRow.id)
+        ).all()
+        self.assertEqual([(entry.time_stamp, entry.response_time) for entry in entries],
+                         [tuple(row) for row in training_data])
+
+        progress = get_etl_progress(self.session, etl_progress_key(self.log_file))
+        self.assertTrue(progress.completed)
+        self.assertEqual(len(entries), progress.entries_committed)
+
+        # the entries after the interruption have the flow statistics of both switches
+        self.assertEqual(
+            2 * (len(entries) - 400),
+            self.session.execute(select(func.count()).select_from(switch_flow_stats_table)).scalar()
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
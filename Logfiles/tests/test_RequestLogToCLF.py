@@ -0,0 +1,38 @@
+import argparse
+import contextlib
+import io
+import shutil
+import tempfile
+import unittest
+from os.path import join, dirname, abspath
+
+from RequestLogToCLF import RequestLogConverter
+
+DATA_DIRECTORY = join(dirname(abspath(__file__)), "data", "request_log")
+
+# The expected files were written by RequestLogToCLF before it counted the finished commands with a snapshot.
+# The request log starts with overlapping commands, a thread that starts a command before its last one ended,
+# an end without a start, an unknown command and lines that are neither starts nor ends,
+# followed by up to 60 commands in flight at once.
+REQUEST_LOG = "teastore-cmd_2021-03-04.log"
+EXPECTED_FILES = ["Conv_2021-03-04.log", "request_statistics_2021-03-04.json"]
+
+
+class RequestLogConverterTest(unittest.TestCase):
+
+    def test_converts_like_before(self):
+        with tempfile.TemporaryDirectory() as directory:
+            converter = RequestLogConverter(argparse.Namespace(force=True, parquet_directory=None))
+            # the warnings about the broken entries are expected
+            with contextlib.redirect_stdout(io.StringIO()):
+                converter.read(shutil.copy(join(DATA_DIRECTORY, REQUEST_LOG), directory))
+
+            for name in EXPECTED_FILES:
+                with self.subTest(name), \
+                        open(join(directory, name), "rb") as actual, \
+                        open(join(DATA_DIRECTORY, "expected", name), "rb") as expected:
+                    self.assertEqual(expected.read(), actual.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import json
+import random
+import unittest
+from datetime import datetime, timedelta
+
+from rast_common.main.SwitchAggFlowStats import SwitchAggFlowStatsDecoder
+from rast_common.main.TrainingDatabase import create_training_data_table, TrainingDataRow
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.orm import Session
+
+from Common import parse_data_line
+from LogToDbETL import create_training_data_rows, to_training_data_values, insert_training_data_batch
+from SwitchFlowStatsIndex import SwitchFlowStatsIndex
+from SwitchFlowStatsTable import create_switch_flow_stats_table, switch_flow_stats_table
+
+DAY = datetime(2021, 3, 4)
+
+
+def create_flow_stats(switches: int, samples: int):
+    """Creates the flow statistics of switches whose samples are taken at random times, like the json file has them."""
+    random.seed(15)
+    all_flow_stats = []
+    for switch in range(switches):
+        times = sorted(DAY + timedelta(microseconds=random.randint(0, 600 * 10 ** 6)) for _ in range(samples))
+        # two samples at the same time
+        times[samples // 2] = times[samples // 2 - 1]
+        all_flow_stats.append({
+            "switch_id": "s{}".format(switch + 1),
+            "samples": [
+                {
+                    "timestamp": sample_time.isoformat(timespec="microseconds"),
+                    "bytes_per_second": random.randint(0, 10 ** 6),
+                    "packets_per_second": random.randint(0, 10 ** 4)
+                }
+                for sample_time in times
+            ]
+        })
+
+    return json.loads(json.dumps(all_flow_stats), object_hook=SwitchAggFlowStatsDecoder.try_create_object)
+
+
+class SwitchFlowStatsIndexTest(unittest.TestCase):
+
+    def test_rates_are_the_ones_of_the_getters(self):
+        flow_stats = create_flow_stats(switches=3, samples=200)
+        index = SwitchFlowStatsIndex(flow_stats)
+
+        # sub-second timestamps, before the first and after the last sample,
+        # on the samples and a microsecond before and after them
+        timestamps = [DAY + timedelta(microseconds=random.randint(-10 ** 6, 610 * 10 ** 6)) for _ in range(2000)]
+        for sample in flow_stats[0].samples:
+            timestamps.extend([sample.timestamp, sample.timestamp - timedelta(microseconds=1),
+                               sample.timestamp + timedelta(microseconds=1)])
+
+        bytes_per_second, packets_per_second = index.get_rates_for(timestamps)
+
+        self.assertEqual((len(timestamps), 3), bytes_per_second.shape)
+        for switch, flow_stats_for_switch in enumerate(flow_stats):
+            self.assertEqual(
+                [flow_stats_for_switch.get_bytes_per_second_for(timestamp) for timestamp in timestamps],
+                bytes_per_second[:, switch].tolist()
+            )
+            self.assertEqual(
+                [flow_stats_for_switch.get_packets_per_second_for(timestamp) for timestamp in timestamps],
+                packets_per_second[:, switch].tolist()
+            )
+
+    def test_one_row_per_entry_with_all_switches(self):
+        flow_stats = create_flow_stats(switches=3, samples=50)
+        entries = [
+            parse_data_line("[{}] (PR:  1/ 2/ 0) ID_REQ_A                           : Response time {} ms".format(
+                (DAY + timedelta(seconds=n, microseconds=n * 1000)).strftime('%Y-%m-%d %H:%M:%S,%f'), n
+            ))
+            for n in range(120)
+        ]
+
+        db = create_engine("sqlite://")
+        create_training_data_table(db)
+        create_switch_flow_stats_table(db)
+
+        with Session(db) as session:
+            rows = list(create_training_data_rows(entries, None, 0.5, None, SwitchFlowStatsIndex(flow_stats),
+                                                  enrichment_batch_size=50, all_switches=True))
+            insert_training_data_batch(session, to_training_data_values(rows))
+            session.commit()
+
+            training_data = session.execute(
+                select(TrainingDataRow.id, TrainingDataRow.timestamp, TrainingDataRow.switch_id,
+                       TrainingDataRow.bytes_per_second_transmitted_through_switch)
+            ).all()
+            self.assertEqual(len(entries), len(training_data))
+            self.assertEqual(
+                3 * len(entries),
+                session.execute(select(func.count()).select_from(switch_flow_stats_table)).scalar()
+            )
+
+            for training_data_id, timestamp, switch_id, bytes_per_second in training_data:
+                # the training data has the first switch
+                self.assertEqual("s1", switch_id)
+                self.assertEqual(flow_stats[0].get_bytes_per_second_for(timestamp), bytes_per_second)
+
+                flow_stats_of_row = session.execute(
+                    select(switch_flow_stats_table.c.switch_id,
+                           switch_flow_stats_table.c.bytes_per_second_transmitted_through_switch)
+                    .where(switch_flow_stats_table.c.training_data_id == training_data_id)
+                    .order_by(switch_flow_stats_table.c.switch_id)
+                ).all()
+                self.assertEqual(
+                    [(flow_stats_for_switch.switch_id, flow_stats_for_switch.get_bytes_per_second_for(timestamp))
+                     for flow_stats_for_switch in flow_stats],
+                    [tuple(row) for row in flow_stats_of_row]
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
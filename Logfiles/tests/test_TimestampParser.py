@@ -0,0 +1,89 @@
+import random
+import unittest
+from datetime import datetime, timedelta
+
+from TimestampParser import get_timestamp_from_line, get_timestamp_from_string, parse_timestamp
+
+
+def create_lines(count: int) -> list[tuple[str, str, str]]:
+    """Returns (timestamp, strptime format, line) of the line formats of our logs."""
+    random.seed(42)
+    lines = []
+    timestamp = datetime(2021, 3, 4)
+    for n in range(count):
+        timestamp += timedelta(microseconds=random.randint(0, 50000))
+        kind = n % 5
+        if kind == 0:
+            text = timestamp.strftime('%Y-%m-%d %H:%M:%S,%f')
+            lines.append((text, '%Y-%m-%d %H:%M:%S,%f', f"[{text:26}] (PR:  1/ 2/ 0) ID_A"))
+        elif kind == 1:
+            text = timestamp.strftime('%Y-%m-%d %H:%M:%S.%f')
+            lines.append((text, '%Y-%m-%d %H:%M:%S.%f', f"[{n % 300}] {text} CMD-START ID_A"))
+        elif kind == 2:
+            text = timestamp.strftime('%Y-%m-%d %H:%M:%S,%f')[:-3]
+            lines.append((text, '%Y-%m-%d %H:%M:%S,%f', f"{text} INFO something"))
+        elif kind == 3:
+            text = timestamp.strftime('%Y-%m-%d %H:%M:%S')
+            lines.append((text, '%Y-%m-%d %H:%M:%S', f"worker <{text}> CMD-ENDE"))
+        else:
+            text = "{}-{}-{} {}:{}:{}.{}".format(timestamp.year, timestamp.month, timestamp.day, timestamp.hour,
+                                                timestamp.minute, timestamp.second, str(timestamp.microsecond)[:1])
+            lines.append((text, '%Y-%m-%d %H:%M:%S.%f', f"{text} single digit fields"))
+    return lines
+
+
+class TimestampParserTest(unittest.TestCase):
+
+    def test_matches_strptime(self):
+        lines = create_lines(100000)
+
+        mismatches = [line for text, timestamp_format, line in lines
+                      if get_timestamp_from_line(line) != datetime.strptime(text, timestamp_format)]
+
+        self.assertEqual([], mismatches[:10])
+        self.assertEqual(0, len(mismatches))
+
+    def test_string_and_line_are_parsed_alike(self):
+        for _, _, line in create_lines(1000):
+            self.assertEqual(get_timestamp_from_line(line), get_timestamp_from_string(line))
+
+    def test_fractions(self):
+        cases = {
+            "2021-03-04 12:00:00,5 x": datetime(2021, 3, 4, 12, 0, 0, 500000),
+            "2021-03-04 12:00:00.000001 x": datetime(2021, 3, 4, 12, 0, 0, 1),
+            "2021-03-04 12:00:00.123 x": datetime(2021, 3, 4, 12, 0, 0, 123000),
+            # digits beyond microseconds are cut off
+            "2021-03-04 12:00:00.1234567 x": datetime(2021, 3, 4, 12, 0, 0, 123456),
+            "2021-03-04 12:00:00. x": datetime(2021, 3, 4, 12, 0, 0),
+            "2021-03-04 12:00:00": datetime(2021, 3, 4, 12, 0, 0),
+            "[2021-03-04 12:00:00,250000    ] (PR:  1/ 2/ 0)": datetime(2021, 3, 4, 12, 0, 0, 250000),
+        }
+        for line, expected in cases.items():
+            with self.subTest(line):
+                self.assertEqual(expected, get_timestamp_from_line(line))
+
+    def test_single_digit_fields(self):
+        cases = {
+            "2021-3-4 5:6:7": datetime(2021, 3, 4, 5, 6, 7),
+            "[12] 2021-3-04 05:06:7,25 CMD-START": datetime(2021, 3, 4, 5, 6, 7, 250000),
+            "2021-12-1 23:5:59.999999 x": datetime(2021, 12, 1, 23, 5, 59, 999999),
+        }
+        for line, expected in cases.items():
+            with self.subTest(line):
+                self.assertEqual(expected, get_timestamp_from_line(line))
+
+    def test_invalid_timestamps(self):
+        for line in ["2021-13-04 12:00:00.000000 month",
+                     "2021-02-30 12:00:00.000000 day",
+                     "2021-03-04 24:00:00.000000 hour",
+                     "2021-03-04 12:60:00.000000 minute",
+                     "[2021-03-0x 12:00:00,000000] digits"]:
+            with self.subTest(line):
+                self.assertRaises(ValueError, get_timestamp_from_line, line)
+
+    def test_no_timestamp_at_index(self):
+        self.assertRaises(ValueError, parse_timestamp, "[1] CMD-START 2021-03-04 12:00:00", 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
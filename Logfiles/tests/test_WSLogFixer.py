@@ -0,0 +1,58 @@
+import contextlib
+import io
+import shutil
+import tempfile
+import unittest
+from os.path import join
+
+import Pipeline
+from WSLogFixer import fix_log, read_lines
+
+# latin-1 encoded, with characters that str.splitlines() would break at, within the messages
+LOG = (b"[1] 2021-03-04 00:00:01.000000 CMD-START ID_A caf\xc3\xa9 \xc2\x85 more\r\n"
+       b"[2] 2021-03-04 00:00:02.000000 CMD-START ID_B page\x0cbreak \x1c\x1d\x1e\x0b end\r\n"
+       b"  continued \x85 part  \r\n"
+       b"[3] 2021-03-04 00:00:03.000000 CMD-ENDE ID_A\r\n"
+       b"[4] 2021-03-04 00:00:04.000000 CMD-ENDE ID_B\x85\r\n"
+       b"[5] 2021-03-04 00:00:05.000000 CMD-START ID_C\r"
+       b"[6] 2021-03-04 00:00:06.000000 CMD-ENDE ID_C\n")
+
+FIXED_LINES = [
+    "[1] 2021-03-04 00:00:01.000000 CMD-START ID_A caf\xc3\xa9 \xc2\x85 more\n",
+    "[2] 2021-03-04 00:00:02.000000 CMD-START ID_B page\x0cbreak \x1c\x1d\x1e\x0b endcontinued \x85 part\n",
+    "[3] 2021-03-04 00:00:03.000000 CMD-ENDE ID_A\n",
+    "[4] 2021-03-04 00:00:04.000000 CMD-ENDE ID_B\x85\n",
+    "[5] 2021-03-04 00:00:05.000000 CMD-START ID_C\n",
+    "[6] 2021-03-04 00:00:06.000000 CMD-ENDE ID_C\n",
+]
+
+
+class WSLogFixerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log_file = join(self.directory, "Worker-cmd_2021-03-04.log")
+        with open(self.log_file, "wb") as file:
+            file.write(LOG)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_lines_end_at_line_breaks_only(self):
+        self.assertEqual(LOG.decode("latin-1").replace("\r\n", "\n").replace("\r", "\n").split("\n")[:-1],
+                         [line.rstrip("\n") for line in read_lines(self.log_file)])
+
+    def test_fix_log(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            fix_log(self.log_file)
+
+        with open(join(self.directory, "WSCmd_f_2021-03-04.log")) as file:
+            self.assertEqual(FIXED_LINES, list(file))
+
+    def test_pipeline_reads_the_fixed_lines(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(FIXED_LINES, list(Pipeline.read_logfile(self.log_file)))
+
+
+if __name__ == "__main__":
+    unittest.main()
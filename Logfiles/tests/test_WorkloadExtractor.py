@@ -0,0 +1,139 @@
+import contextlib
+import filecmp
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from os.path import join
+
+from WorkloadExtractor import CMD_END, LogEvent, LogEventDispatcher, LogEventTracker, extract_workload, \
+    extract_workload_in_parallel
+
+
+def create_lines(count: int) -> list[str]:
+    lines = []
+    for n in range(count):
+        kind = "CMD-START" if n % 2 == 0 else "CMD-ENDE"
+        lines.append("[{}] 2021-03-04 00:{:02}:{:02}.{:06} {} ID_REQ_{}".format(
+            n % 300, n // 60 % 60, n % 60, n * 7919 % 10 ** 6, kind, "AB"[n // 2 % 2]
+        ))
+    return lines
+
+
+class EndCounter(LogEventTracker):
+    """A tracker that does not implement the partial results, it cannot process chunks in parallel."""
+
+    kinds = frozenset({CMD_END})
+
+    def __init__(self, source_file_path=None):
+        self.count = 0
+
+    def process_event(self, event: LogEvent):
+        self.count += 1
+
+
+class MergeableEndCounter(EndCounter):
+
+    def get_partial_result(self) -> int:
+        return self.count
+
+    def merge_partial_result(self, partial_result: int):
+        self.count += partial_result
+
+
+class RecordingFactory:
+    """Creates trackers of a class and keeps the ones it created, it is picklable unlike a lambda."""
+
+    def __init__(self, tracker_class):
+        self.tracker_class = tracker_class
+        self.trackers = []
+
+    def __call__(self, source_file_path):
+        tracker = self.tracker_class(source_file_path)
+        self.trackers.append(tracker)
+        return tracker
+
+    def __getstate__(self):
+        # the workers keep the trackers they create to themselves
+        return {"tracker_class": self.tracker_class, "trackers": []}
+
+
+class LogEventTrackerTest(unittest.TestCase):
+
+    def test_tracker_without_partial_results(self):
+        tracker = EndCounter()
+
+        self.assertEqual(100, LogEventDispatcher([tracker]).process_log_lines(create_lines(100)))
+        self.assertEqual(50, tracker.count)
+
+        self.assertRaises(NotImplementedError, tracker.get_partial_result)
+        self.assertRaises(NotImplementedError, tracker.merge_partial_result, 50)
+
+
+class ExtractWorkloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.logfiles = []
+        for day, count in ((4, 3000), (5, 1000)):
+            path = join(self.directory, "teastore-cmd_2021-03-0{}.log".format(day))
+            with open(path, "w") as file:
+                file.writelines(line + "\n" for line in create_lines(count))
+            self.logfiles.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def copy_logfiles(self, name: str) -> list[str]:
+        directory = join(self.directory, name)
+        os.mkdir(directory)
+        return [shutil.copy(path, directory) for path in self.logfiles]
+
+    def test_parallel_output_equals_sequential_output(self):
+        sequential = self.copy_logfiles("sequential")
+        parallel = self.copy_logfiles("parallel")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(4000, extract_workload(sequential, "ID_REQ_A"))
+            self.assertEqual(4000, extract_workload_in_parallel(parallel, "ID_REQ_A", jobs=2, chunk_size=4096,
+                                                                temp_directory=self.directory))
+
+        names = sorted(os.listdir(join(self.directory, "sequential")))
+        self.assertEqual(["Request_Names.log", "Request_Statistics.log", "Requests_per_time_unit_2021-03-04.log",
+                          "Requests_per_time_unit_2021-03-05.log", "teastore-cmd_2021-03-04.log",
+                          "teastore-cmd_2021-03-05.log"], names)
+        self.assertEqual((names, [], []), filecmp.cmpfiles(join(self.directory, "sequential"),
+                                                           join(self.directory, "parallel"), names, shallow=False))
+        # the temporary files of the workers are removed
+        self.assertEqual(["parallel", "sequential"], sorted(name for name in os.listdir(self.directory)
+                                                            if os.path.isdir(join(self.directory, name))))
+
+    def test_trackers_of_the_caller(self):
+        for parallel in (False, True):
+            with self.subTest(parallel=parallel):
+                ends = RecordingFactory(MergeableEndCounter)
+                ends_of_files = RecordingFactory(MergeableEndCounter)
+
+                with contextlib.redirect_stdout(io.StringIO()):
+                    if parallel:
+                        extract_workload_in_parallel(self.logfiles, "ID_REQ_A", jobs=2, chunk_size=4096,
+                                                     tracker_factories=[ends], file_tracker_factories=[ends_of_files])
+                    else:
+                        extract_workload(self.logfiles, "ID_REQ_A",
+                                         tracker_factories=[ends], file_tracker_factories=[ends_of_files])
+
+                self.assertEqual([2000], [tracker.count for tracker in ends.trackers])
+                self.assertEqual([1500, 500], [tracker.count for tracker in ends_of_files.trackers])
+                # only the trackers of the caller write output
+                self.assertEqual(["teastore-cmd_2021-03-04.log", "teastore-cmd_2021-03-05.log"],
+                                 sorted(os.listdir(self.directory)))
+
+    def test_parallel_trackers_need_partial_results(self):
+        with contextlib.redirect_stdout(io.StringIO()), self.assertRaises(NotImplementedError):
+            extract_workload_in_parallel(self.logfiles, "ID_REQ_A", jobs=2, chunk_size=4096,
+                                         tracker_factories=[EndCounter], file_tracker_factories=[])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+import argparse
+import asyncio
+import random
+from datetime import datetime
+from typing import Optional
+from zlib import crc32
+
+import numpy as np
+from aiohttp import web
+
+from AcquirePerformanceMetricsFromNetdata import NetdataCache
+
+# Stands in for a netdata instance by serving its data endpoint (/api/v1/data)
+# from the responses recorded in a NetdataCache or from synthetic series.
+
+
+def synthetic_values(chart: str, dimension: str, times: np.ndarray) -> np.ndarray:
+    """
+    Returns values between 0 and 100 for the given unix timestamps.
+    The values only depend on the chart, the dimension and the time,
+    so that the same second always has the same value, no matter how the time range is requested.
+    """
+    seed = np.uint64(crc32("{}.{}".format(chart, dimension).encode()))
+
+    # cheap integer hash of the time as noise
+    with np.errstate(over="ignore"):
+        noise = ((times.astype(np.uint64) + seed) * np.uint64(2654435761)) % np.uint64(1000)
+
+    hour_of_the_day = (times % 86400) / 3600
+    daily_pattern = 25 * (1 - np.cos(2 * np.pi * hour_of_the_day / 24))
+
+    return np.round(daily_pattern + noise / 100, 4)
+
+
+class NetdataReplayServer:
+    def __init__(self,
+                 recording: Optional[NetdataCache] = None,
+                 recorded_base_url: Optional[str] = None,
+                 update_every: int = 1,
+                 latency: float = 0,
+                 jitter: float = 0,
+                 failure_rate: float = 0,
+                 synthetic_dimensions: tuple[str, ...] = ("user", "system")):
+        """
+        :param recording: Cache with the recorded responses, synthetic series are served if there is none
+        :param recorded_base_url: The netdata instance of the recording to replay,
+        defaults to the only one of the recording
+        :param update_every: Seconds between two synthetic values, the size of the payload shrinks with it
+        :param latency: Seconds to wait before responding
+        :param jitter: Maximum number of seconds added to the latency at random
+        :param failure_rate: Fraction of the requests that fail with 503 Service Unavailable
+        :param synthetic_dimensions: Dimensions of the synthetic charts, if the request does not name any
+        """
+        self._recording = recording
+        self._recorded_base_url = recorded_base_url
+        if recording is not None and recorded_base_url is None:
+            base_urls = recording.get_base_urls()
+            if len(base_urls) != 1:
+                raise ValueError("Choose one of the recorded netdata instances: {}".format(base_urls))
+            self._recorded_base_url = base_urls[0]
+
+        self._update_every = update_every
+        self._latency = latency
+        self._jitter = jitter
+        self._failure_rate = failure_rate
+        self._synthetic_dimensions = synthetic_dimensions
+
+        self.number_of_requests = 0
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/api/v1/data", self.get_data)
+        return app
+
+    async def get_data(self, request: web.Request) -> web.Response:
+        self.number_of_requests += 1
+
+        delay = self._latency + random.uniform(0, self._jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if random.random() < self._failure_rate:
+            raise web.HTTPServiceUnavailable()
+
+        try:
+            chart = request.query["chart"]
+            after = int(request.query["after"])
+            before = int(request.query["before"])
+        except (KeyError, ValueError):
+            raise web.HTTPBadRequest(text="chart, after and before are required")
+
+        dimensions = [dimension for dimension in request.query.get("dimensions", "").split(",") if dimension != ""]
+
+        if self._recording is not None:
+            labels, data = self._get_recorded_data(chart, request.query.get("dimensions", ""), after, before)
+        else:
+            labels, data = self._get_synthetic_data(chart, dimensions, after, before)
+
+        return web.json_response({
+            "api": 1,
+            "id": chart,
+            "name": chart,
+            "update_every": self._update_every,
+            "after": after,
+            "before": before,
+            "dimension_names": labels[1:],
+            "labels": labels,
+            "data": data
+        })
+
+    def _get_synthetic_data(self, chart: str, dimensions: list[str], after: int, before: int):
+        if len(dimensions) == 0:
+            dimensions = list(self._synthetic_dimensions)
+
+        first = -(-after // self._update_every) * self._update_every
+        # like netdata, the newest values come first
+        times = np.arange(first, before + 1, self._update_every)[::-1]
+
+        columns = [times.tolist()] + [synthetic_values(chart, dimension, times).tolist() for dimension in dimensions]
+
+        return ["time"] + dimensions, [list(row) for row in zip(*columns)]
+
+    def _get_recorded_data(self, chart: str, dimensions: str, after: int, before: int):
+        labels = ["time"]
+        data = []
+
+        day = datetime.fromtimestamp(after).date()
+        while day <= datetime.fromtimestamp(before).date():
+            json_data = self._recording.get(self._recorded_base_url, chart, dimensions,
+                                            datetime(day.year, day.month, day.day))
+            if json_data is not None:
+                labels = json_data["labels"]
+                data.extend(row for row in json_data["data"] if after <= row[0] <= before)
+            day = day.fromordinal(day.toordinal() + 1)
+
+        data.sort(key=lambda row: row[0], reverse=True)
+        return labels, data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serves the data endpoint of netdata from recorded '
+                                                 'or synthetic performance metrics.')
+    parser.add_argument('--host',
+                        type=str,
+                        default="127.0.0.1",
+                        help='Host to listen on')
+    parser.add_argument('--port', '-p',
+                        type=int,
+                        default=19999,
+                        help='Port to listen on')
+    parser.add_argument('--recording', '-r',
+                        type=str,
+                        help='A netdata cache directory (see LogToDbETL --netdata-cache-directory) to replay, '
+                             'synthetic series are served if omitted')
+    parser.add_argument('--recorded-base-url',
+                        type=str,
+                        help='The netdata instance of the recording to replay, e.g. http://192.168.64.6:19999/api/v1/')
+    parser.add_argument('--update-every',
+                        type=int,
+                        default=1,
+                        help='Seconds between two synthetic values')
+    parser.add_argument('--latency', '-l',
+                        type=float,
+                        default=0,
+                        help='Milliseconds to wait before responding')
+    parser.add_argument('--jitter',
+                        type=float,
+                        default=0,
+                        help='Maximum number of milliseconds added to the latency at random')
+    parser.add_argument('--failure-rate',
+                        type=float,
+                        default=0,
+                        help='Fraction of the requests that fail with 503 Service Unavailable')
+
+    args = parser.parse_args()
+
+    server = NetdataReplayServer(
+        NetdataCache(args.recording) if args.recording is not None else None,
+        args.recorded_base_url,
+        args.update_every,
+        args.latency / 1000,
+        args.jitter / 1000,
+        args.failure_rate
+    )
+
+    web.run_app(server.create_app(), host=args.host, port=args.port)